@@ -0,0 +1,29 @@
+"""Add patient_timelines table
+
+Revision ID: a7c2e91d4f38
+Revises: f6a18b3d2c75
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+# revision identifiers
+revision = 'a7c2e91d4f38'
+down_revision = 'f6a18b3d2c75'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('patient_timelines',
+        sa.Column('patient_id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('format', sa.Integer(), nullable=False),
+        sa.Column('document', sa.LargeBinary().with_variant(mysql.MEDIUMBLOB(), 'mysql'), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('patient_id')
+    )
+
+def downgrade():
+    op.drop_table('patient_timelines')
@@ -0,0 +1,26 @@
+"""Add content hash to medical reports for deduplicated storage
+
+Revision ID: c3a9f2d4e817
+Revises: add_medical_reports
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = 'c3a9f2d4e817'
+down_revision = 'add_medical_reports'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column('medical_reports', sa.Column('content_sha256', sa.String(length=64), nullable=True))
+    op.create_index(op.f('ix_medical_reports_content_sha256'), 'medical_reports', ['content_sha256'], unique=False)
+    # Reference counts are computed per file_key when a report is deleted
+    op.create_index(op.f('ix_medical_reports_file_key'), 'medical_reports', ['file_key'], unique=False)
+
+def downgrade():
+    op.drop_index(op.f('ix_medical_reports_file_key'), table_name='medical_reports')
+    op.drop_index(op.f('ix_medical_reports_content_sha256'), table_name='medical_reports')
+    op.drop_column('medical_reports', 'content_sha256')
@@ -0,0 +1,43 @@
+"""Add change_events and change_sequences tables
+
+Revision ID: c3d85f0a6b12
+Revises: a7c2e91d4f38
+Create Date: 2026-10-20 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = 'c3d85f0a6b12'
+down_revision = 'a7c2e91d4f38'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('change_events',
+        sa.Column('seq', sa.BigInteger(), autoincrement=False, nullable=False),
+        sa.Column('entity', sa.String(length=30), nullable=False),
+        sa.Column('entity_id', sa.Integer(), nullable=True),
+        sa.Column('operation', sa.String(length=10), nullable=False),
+        sa.Column('data', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('seq')
+    )
+    op.create_index(op.f('ix_change_events_entity_id'), 'change_events', ['entity_id'], unique=False)
+    op.create_index(op.f('ix_change_events_created_at'), 'change_events', ['created_at'], unique=False)
+    change_sequences = op.create_table('change_sequences',
+        sa.Column('name', sa.String(length=30), nullable=False),
+        sa.Column('value', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('name')
+    )
+    op.bulk_insert(change_sequences, [
+        {'name': 'changes', 'value': 0},
+        {'name': 'changes_pruned', 'value': 0},
+    ])
+
+def downgrade():
+    op.drop_table('change_sequences')
+    op.drop_index(op.f('ix_change_events_created_at'), table_name='change_events')
+    op.drop_index(op.f('ix_change_events_entity_id'), table_name='change_events')
+    op.drop_table('change_events')
@@ -0,0 +1,49 @@
+"""Add upload_sessions table for resumable chunked uploads
+
+Revision ID: d84e1b6f0a53
+Revises: c3a9f2d4e817
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = 'd84e1b6f0a53'
+down_revision = 'c3a9f2d4e817'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('upload_sessions',
+        sa.Column('upload_id', sa.String(length=36), nullable=False),
+        sa.Column('patient_id', sa.Integer(), nullable=False),
+        sa.Column('doctor_id', sa.Integer(), nullable=False),
+        sa.Column('session_id', sa.Integer(), nullable=True),
+        sa.Column('file_name', sa.String(length=255), nullable=False),
+        sa.Column('content_type', sa.String(length=100), nullable=False),
+        sa.Column('file_size', sa.Integer(), nullable=False),
+        sa.Column('chunk_size', sa.Integer(), nullable=False),
+        sa.Column('content_sha256', sa.String(length=64), nullable=True),
+        sa.Column('received_bytes', sa.Integer(), nullable=False),
+        sa.Column('staging', sa.String(length=20), nullable=False),
+        sa.Column('staging_key', sa.String(length=500), nullable=False),
+        sa.Column('multipart_upload_id', sa.String(length=255), nullable=True),
+        sa.Column('parts', sa.Text(), nullable=False),
+        sa.Column('status', sa.Enum('active', 'finalizing', 'completed', 'aborted', 'expired', name='uploadsessionstatus'), nullable=False),
+        sa.Column('report_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['doctor_id'], ['doctors.id'], ),
+        sa.ForeignKeyConstraint(['patient_id'], ['patients.id'], ),
+        sa.ForeignKeyConstraint(['session_id'], ['medical_sessions.session_id'], ),
+        sa.ForeignKeyConstraint(['report_id'], ['medical_reports.report_id'], ),
+        sa.PrimaryKeyConstraint('upload_id')
+    )
+    op.create_index(op.f('ix_upload_sessions_status'), 'upload_sessions', ['status'], unique=False)
+    op.create_index(op.f('ix_upload_sessions_updated_at'), 'upload_sessions', ['updated_at'], unique=False)
+
+def downgrade():
+    op.drop_index(op.f('ix_upload_sessions_updated_at'), table_name='upload_sessions')
+    op.drop_index(op.f('ix_upload_sessions_status'), table_name='upload_sessions')
+    op.drop_table('upload_sessions')
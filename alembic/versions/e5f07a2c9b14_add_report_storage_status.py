@@ -0,0 +1,23 @@
+"""Add storage_status to medical_reports for spooled uploads
+
+Revision ID: e5f07a2c9b14
+Revises: d84e1b6f0a53
+Create Date: 2026-10-18 23:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = 'e5f07a2c9b14'
+down_revision = 'd84e1b6f0a53'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column('medical_reports', sa.Column('storage_status', sa.String(length=20), nullable=False, server_default='stored'))
+    op.create_index(op.f('ix_medical_reports_storage_status'), 'medical_reports', ['storage_status'], unique=False)
+
+def downgrade():
+    op.drop_index(op.f('ix_medical_reports_storage_status'), table_name='medical_reports')
+    op.drop_column('medical_reports', 'storage_status')
@@ -0,0 +1,47 @@
+"""Add jobs table and report processing columns
+
+Revision ID: f6a18b3d2c75
+Revises: e5f07a2c9b14
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = 'f6a18b3d2c75'
+down_revision = 'e5f07a2c9b14'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('jobs',
+        sa.Column('job_id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(length=50), nullable=False),
+        sa.Column('payload', sa.Text(), nullable=False),
+        sa.Column('report_id', sa.Integer(), nullable=True),
+        sa.Column('status', sa.Enum('queued', 'running', 'succeeded', 'failed', 'skipped', name='jobstatus'), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('max_attempts', sa.Integer(), nullable=False),
+        sa.Column('run_after', sa.DateTime(), nullable=False),
+        sa.Column('locked_by', sa.String(length=100), nullable=True),
+        sa.Column('locked_at', sa.DateTime(), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('result', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('job_id')
+    )
+    op.create_index(op.f('ix_jobs_job_id'), 'jobs', ['job_id'], unique=False)
+    op.create_index(op.f('ix_jobs_report_id'), 'jobs', ['report_id'], unique=False)
+    op.create_index('ix_jobs_status_run_after', 'jobs', ['status', 'run_after'], unique=False)
+    op.add_column('medical_reports', sa.Column('thumbnail_key', sa.String(length=500), nullable=True))
+    op.add_column('medical_reports', sa.Column('extracted_text', sa.Text(), nullable=True))
+
+def downgrade():
+    op.drop_column('medical_reports', 'extracted_text')
+    op.drop_column('medical_reports', 'thumbnail_key')
+    op.drop_index('ix_jobs_status_run_after', table_name='jobs')
+    op.drop_index(op.f('ix_jobs_report_id'), table_name='jobs')
+    op.drop_index(op.f('ix_jobs_job_id'), table_name='jobs')
+    op.drop_table('jobs')
@@ -1,7 +1,77 @@
 // File Sharing JavaScript Module
 const fileSharing = {
-    // Upload file to server
-    async uploadFile(file, patientId, doctorId, sessionId = null, sharedWith = []) {
+    // Larger files go through resumable chunked uploads
+    directUploadLimit: 50 * 1024 * 1024,
+
+    // Upload file: straight to S3 with a presigned POST, falling back to the server
+    async uploadFile(file, patientId, doctorId, sessionId = null, sharedWith = [], onProgress = null) {
+        if (file.size > this.directUploadLimit && window.crypto && window.crypto.subtle) {
+            return this.uploadResumable(file, patientId, doctorId, sessionId, onProgress);
+        }
+
+        const contentSha256 = await this.sha256Hex(file);
+        if (!contentSha256) {
+            return this.uploadViaServer(file, patientId, doctorId, sessionId, sharedWith);
+        }
+
+        const upload = {
+            patient_id: Number(patientId),
+            doctor_id: Number(doctorId),
+            session_id: sessionId ? Number(sessionId) : null,
+            file_name: file.name,
+            content_type: file.type || 'application/octet-stream',
+            file_size: file.size,
+            content_sha256: contentSha256
+        };
+
+        try {
+            const initResponse = await fetch('/reports/upload/initiate', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify(upload)
+            });
+
+            if (!initResponse.ok) {
+                throw new Error(`Upload failed: ${initResponse.statusText}`);
+            }
+
+            const init = await initResponse.json();
+            if (!init.direct) {
+                return this.uploadViaServer(file, patientId, doctorId, sessionId, sharedWith);
+            }
+
+            const formData = new FormData();
+            Object.entries(init.upload.fields).forEach(([name, value]) => formData.append(name, value));
+            formData.append('file', file);  // S3 requires the file to be the last field
+
+            const s3Response = await fetch(init.upload.url, {
+                method: 'POST',
+                body: formData
+            });
+
+            if (!s3Response.ok) {
+                throw new Error(`Upload to storage failed: ${s3Response.statusText}`);
+            }
+
+            const completeResponse = await fetch('/reports/upload/complete', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ ...upload, upload_key: init.upload.file_key, shared_with: sharedWith })
+            });
+
+            if (!completeResponse.ok) {
+                throw new Error(`Upload failed: ${completeResponse.statusText}`);
+            }
+
+            return await completeResponse.json();
+        } catch (error) {
+            console.error('Upload error:', error);
+            throw error;
+        }
+    },
+
+    // Upload file through the application server
+    async uploadViaServer(file, patientId, doctorId, sessionId = null, sharedWith = []) {
         const formData = new FormData();
         formData.append('file', file);
         formData.append('patient_id', patientId);
@@ -26,6 +96,104 @@ const fileSharing = {
         }
     },
 
+    // Resumable upload: numbered chunks with checksums; an interrupted upload of the
+    // same file continues from the last acknowledged offset
+    async uploadResumable(file, patientId, doctorId, sessionId = null, onProgress = null) {
+        const storageKey = `curanet-upload:${patientId}:${doctorId}:${file.name}:${file.size}:${file.lastModified}`;
+        let upload = null;
+
+        const savedId = localStorage.getItem(storageKey);
+        if (savedId) {
+            const response = await fetch(`/reports/uploads/${savedId}`);
+            if (response.ok) {
+                upload = await response.json();
+                if (!['active', 'finalizing', 'completed'].includes(upload.status)) upload = null;
+            }
+        }
+
+        if (!upload) {
+            const response = await fetch('/reports/uploads', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({
+                    patient_id: Number(patientId),
+                    doctor_id: Number(doctorId),
+                    session_id: sessionId ? Number(sessionId) : null,
+                    file_name: file.name,
+                    content_type: file.type || 'application/octet-stream',
+                    file_size: file.size
+                })
+            });
+            if (!response.ok) {
+                throw new Error(`Upload failed: ${response.statusText}`);
+            }
+            upload = await response.json();
+            localStorage.setItem(storageKey, upload.upload_id);
+        }
+
+        let attempts = 0;
+        let lastError = null;
+        while (upload.status === 'active' && upload.next_chunk < upload.total_chunks) {
+            const offset = upload.next_chunk * upload.chunk_size;
+            const chunk = file.slice(offset, offset + upload.chunk_size);
+            const chunkSha256 = await this.sha256Hex(chunk);
+
+            try {
+                const response = await fetch(
+                    `/reports/uploads/${upload.upload_id}/chunks/${upload.next_chunk}?offset=${offset}`,
+                    { method: 'PUT', headers: { 'X-Chunk-SHA256': chunkSha256 }, body: chunk }
+                );
+                if (response.ok) {
+                    upload = await response.json();
+                    attempts = 0;
+                    if (onProgress) onProgress(upload.offset / upload.file_size);
+                    continue;
+                }
+                lastError = new Error(`Upload failed: ${response.statusText}`);
+                if (response.status !== 409 && response.status < 500) throw lastError;
+            } catch (error) {
+                if (error === lastError) throw error;
+                lastError = error;
+            }
+            if (++attempts > 5) throw lastError;
+
+            // Network error or out-of-order chunk: back off, then ask where to resume
+            await new Promise(resolve => setTimeout(resolve, Math.min(1000 * 2 ** attempts, 30000)));
+            const state = await fetch(`/reports/uploads/${upload.upload_id}`);
+            if (state.ok) upload = await state.json();
+        }
+
+        if (upload.status === 'active') {
+            const response = await fetch(`/reports/uploads/${upload.upload_id}/complete`, { method: 'POST' });
+            if (!response.ok) {
+                throw new Error(`Upload failed: ${response.statusText}`);
+            }
+            upload = await response.json();
+        }
+
+        // Large S3 uploads are verified in the background after complete
+        for (let polls = 0; upload.status === 'finalizing'; polls++) {
+            if (polls >= 120) throw new Error('Upload is still being verified, try again later');
+            await new Promise(resolve => setTimeout(resolve, Math.min(1000 * (polls + 1), 5000)));
+            const state = await fetch(`/reports/uploads/${upload.upload_id}`);
+            if (state.ok) upload = await state.json();
+        }
+        localStorage.removeItem(storageKey);
+        if (upload.status !== 'completed') {
+            throw new Error(`Upload failed: upload ${upload.status}`);
+        }
+        return { report_id: upload.report_id, message: 'Report uploaded successfully', file_name: upload.file_name };
+    },
+
+    // Hex SHA-256 of a file or blob (null where Web Crypto is unavailable, e.g. plain HTTP)
+    async sha256Hex(file) {
+        if (!window.crypto || !window.crypto.subtle) return null;
+        const digest = await window.crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+        return Array.from(new Uint8Array(digest))
+            .map(byte => byte.toString(16).padStart(2, '0'))
+            .join('');
+    },
+
     // Get patient reports
     async getPatientReports(patientId, doctorId) {
         try {
@@ -78,7 +246,7 @@ const fileSharing = {
                             <line x1="12" y1="15" x2="12" y2="3"/>
                         </svg>
                         <p>Drag and drop files here or <span class="upload-link">browse</span></p>
-                        <p class="upload-hint">Supports PDF, DOC, DOCX, JPG, PNG (Max 10MB)</p>
+                        <p class="upload-hint">Supports PDF, DOC, DOCX, JPG, PNG (Large scans resume if interrupted)</p>
                     </div>
                     <input type="file" id="fileInput" accept=".pdf,.doc,.docx,.jpg,.jpeg,.png" style="display: none;">
                 </div>
@@ -142,9 +310,12 @@ const fileSharing = {
         try {
             // Simulate progress (in real implementation, use XMLHttpRequest for progress tracking)
             progressFill.style.width = '30%';
-            progressText.textContent = 'Uploading to server...';
+            progressText.textContent = 'Uploading...';
 
-            const result = await this.uploadFile(file, patientId, doctorId);
+            const result = await this.uploadFile(file, patientId, doctorId, null, [], (fraction) => {
+                progressFill.style.width = `${Math.round(fraction * 100)}%`;
+                progressText.textContent = `Uploading... ${Math.round(fraction * 100)}%`;
+            });
 
             progressFill.style.width = '100%';
             progressText.textContent = 'Upload complete!';
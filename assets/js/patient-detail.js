@@ -94,129 +94,26 @@ class PatientDetailManager {
   // Load patient details from API
   async loadPatientDetails() {
     try {
-      // Extract numeric ID from patient ID (remove 'P' prefix if present)
-      const numericId = this.patientId.toString().replace(/^P/, '');
-      const response = await fetch(`/api/patient/${numericId}`);
-      
+      // One lookup that accepts both 'P000001' and numeric IDs
+      const response = await fetch(`/api/patients?ids=${encodeURIComponent(this.patientId)}`);
       if (!response.ok) {
-        // If the specific API doesn't exist, try to get basic patient info
-        // from existing endpoints and create mock data for demonstration
-        await this.loadBasicPatientInfo();
+        this.showError("Failed to load patient information");
         return;
       }
 
-      const patient = await response.json();
+      const patient = (await response.json())[this.patientId];
+      if (!patient) {
+        this.showError("Patient not found");
+        return;
+      }
       this.displayPatientData(patient);
-      
-    } catch (error) {
-      console.error("Error loading patient details:", error);
-      // Fallback to basic patient info
-      await this.loadBasicPatientInfo();
-    }
-  }
 
-  // Fallback method to load basic patient info and create demo data
-  async loadBasicPatientInfo() {
-    try {
-      // Try to get patient info from existing admin endpoint
-      const response = await fetch(`/admin/patients-list`);
-      
-      if (response.ok) {
-        const patients = await response.json();
-        const numericId = this.patientId.toString().replace(/^P/, '');
-        const patient = patients.find(p => 
-          p.patient_id == this.patientId || 
-          p.patient_id == `P${numericId}` || 
-          p.id == numericId
-        );
-        
-        if (patient) {
-          // Create enhanced patient data with demo information
-          const enhancedPatient = this.createEnhancedPatientData(patient);
-          this.displayPatientData(enhancedPatient);
-        } else {
-          this.showError("Patient not found");
-        }
-      } else {
-        this.showError("Failed to load patient information");
-      }
     } catch (error) {
-      console.error("Error loading basic patient info:", error);
+      console.error("Error loading patient details:", error);
       this.showError("Failed to load patient information. Please try again.");
     }
   }
 
-  // Create enhanced patient data with demo information
-  createEnhancedPatientData(basicPatient) {
-    return {
-      ...basicPatient,
-      gender: "Not specified",
-      emergency_contact: "+1 (555) 123-4567",
-      address: "123 Main St, City, State 12345",
-      registration_date: "2023-01-15",
-      visits: [
-        {
-          date: "2024-01-15",
-          doctor: "Dr. Smith",
-          department: "Cardiology",
-          diagnosis: "Routine checkup",
-          status: "completed"
-        },
-        {
-          date: "2024-01-10",
-          doctor: "Dr. Johnson",
-          department: "General Medicine",
-          diagnosis: "Flu symptoms",
-          status: "completed"
-        }
-      ],
-      prescriptions: [
-        {
-          date: "2024-01-15",
-          medication: "Lisinopril 10mg",
-          dosage: "Once daily",
-          duration: "30 days",
-          prescribed_by: "Dr. Smith"
-        },
-        {
-          date: "2024-01-10",
-          medication: "Amoxicillin 500mg",
-          dosage: "Three times daily",
-          duration: "7 days",
-          prescribed_by: "Dr. Johnson"
-        }
-      ],
-      lab_reports: [
-        {
-          date: "2024-01-15",
-          test_name: "Complete Blood Count",
-          result: "Normal",
-          reference_range: "4.5-11.0 x10³/μL",
-          status: "normal"
-        },
-        {
-          date: "2024-01-15",
-          test_name: "Cholesterol Panel",
-          result: "180 mg/dL",
-          reference_range: "<200 mg/dL",
-          status: "normal"
-        }
-      ],
-      documents: [
-        {
-          id: "doc1",
-          name: "Blood Test Results",
-          date: "2024-01-15"
-        },
-        {
-          id: "doc2",
-          name: "X-Ray Report",
-          date: "2024-01-10"
-        }
-      ]
-    };
-  }
-
   // Display patient data on the page
   displayPatientData(patient) {
     // Hide loading state and show content
@@ -139,16 +139,52 @@ const PatientSidebar = {
         PatientSidebar.loadPatientInfo();
     },
 
+    // Patients already loaded, by the ID they were requested with
+    patientCache: new Map(),
+    pendingIds: null,
+
+    // Look up patients by ID ('P000001' or '1'). IDs requested in the same tick
+    // are fetched together with one /api/patients request; resolves to {id: patient or null}
+    getPatients: (ids) => {
+        const missing = ids.filter(id => !PatientSidebar.patientCache.has(String(id)));
+        if (missing.length === 0) {
+            return Promise.resolve(PatientSidebar.pickCached(ids));
+        }
+
+        if (!PatientSidebar.pendingIds) {
+            const batch = PatientSidebar.pendingIds = new Set();
+            batch.request = Promise.resolve().then(async () => {
+                PatientSidebar.pendingIds = null;
+                const query = encodeURIComponent([...batch].join(','));
+                const response = await fetch(`/api/patients?ids=${query}`);
+                if (!response.ok) {
+                    throw new Error('Failed to load patients');
+                }
+                const patients = await response.json();
+                Object.entries(patients).forEach(([id, patient]) => PatientSidebar.patientCache.set(id, patient));
+            });
+        }
+        const batch = PatientSidebar.pendingIds;
+        missing.forEach(id => batch.add(String(id)));
+        return batch.request.then(() => PatientSidebar.pickCached(ids));
+    },
+
+    pickCached: (ids) => {
+        const patients = {};
+        ids.forEach(id => {
+            patients[id] = PatientSidebar.patientCache.get(String(id)) || null;
+        });
+        return patients;
+    },
+
     // Load patient information
     loadPatientInfo: async () => {
         try {
             const urlParams = new URLSearchParams(window.location.search);
             const patientId = urlParams.get('id') || '1';
             
-            const response = await fetch(`/api/patient/${patientId}`);
-            if (response.ok) {
-                const patient = await response.json();
-                
+            const patient = (await PatientSidebar.getPatients([patientId]))[patientId];
+            if (patient) {
                 document.getElementById('userName').textContent = patient.name;
                 document.getElementById('patientId').textContent = `ID: P${patient.id}`;
                 document.getElementById('userAvatar').textContent = patient.name[0].toUpperCase();
@@ -0,0 +1,257 @@
+"""
+Admission control for expensive routes.
+
+Routes are grouped into classes. Each class admits at most `limit` requests
+at a time per worker and queues at most `max_queue` more. Anything beyond
+that is shed right away with 503 and Retry-After, as is a queued request
+that waits longer than ADMISSION_QUEUE_TIMEOUT_SECONDS. Routes outside
+every class (login, availability, lists, ...) are never limited, so a rush
+on the heavy routes can't take the database pool and threadpool from them.
+
+The limit adapts to observed latency (AIMD). After every window of
+completed requests the class compares the window's p90 service time with
+its target latency:
+
+- above the target: limit = limit x ADMISSION_DECREASE_FACTOR
+- below the target while the limit was reached: limit + 1
+
+The limit always stays between min_limit and max_limit.
+
+Per-class settings come from ROUTE_CLASSES and can be overridden with
+ADMISSION_<CLASS>_MAX_CONCURRENCY, _MIN_CONCURRENCY, _QUEUE and
+_TARGET_SECONDS (e.g. ADMISSION_HEAVY_READS_QUEUE=32).
+"""
+import asyncio
+import json
+import math
+import os
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+from starlette.routing import compile_path
+
+from . import metrics
+
+ADMISSION_CONTROL_ENABLED = os.getenv('ADMISSION_CONTROL_ENABLED', 'true').lower() in ('1', 'true', 'yes', 'on')
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv('ADMISSION_QUEUE_TIMEOUT_SECONDS', '5'))
+ADMISSION_WINDOW_REQUESTS = int(os.getenv('ADMISSION_WINDOW_REQUESTS', '20'))
+ADMISSION_DECREASE_FACTOR = float(os.getenv('ADMISSION_DECREASE_FACTOR', '0.8'))
+ADMISSION_MAX_RETRY_AFTER_SECONDS = 30
+
+ROUTE_CLASSES = {
+    "heavy_reads": {
+        "routes": [
+            ("GET", "/admin/appointments-list"),
+            ("GET", "/patient/{patient_id}/complete-history"),
+        ],
+        "min_limit": 2,
+        "max_limit": 8,
+        "max_queue": 16,
+        "target_seconds": 1.0,
+    },
+    "uploads": {
+        "routes": [
+            ("POST", "/reports/upload"),
+            ("PUT", "/reports/uploads/{upload_id}/chunks/{chunk_number}"),
+            ("POST", "/reports/uploads/{upload_id}/complete"),
+        ],
+        "min_limit": 2,
+        "max_limit": 8,
+        "max_queue": 16,
+        "target_seconds": 5.0,
+    },
+}
+
+admission_in_flight = metrics.registry.gauge(
+    "curanet_admission_in_flight",
+    "Requests admitted and running, per route class",
+    ("route_class",),
+)
+admission_queued = metrics.registry.gauge(
+    "curanet_admission_queued",
+    "Requests waiting for admission, per route class",
+    ("route_class",),
+)
+admission_limit = metrics.registry.gauge(
+    "curanet_admission_limit",
+    "Current adaptive concurrency limit, per route class",
+    ("route_class",),
+)
+admission_shed = metrics.registry.counter(
+    "curanet_admission_shed_total",
+    "Requests rejected with 503 by admission control",
+    ("route_class", "reason"),
+)
+admission_wait = metrics.registry.histogram(
+    "curanet_admission_queue_wait_seconds",
+    "Time admitted requests spent queued",
+    ("route_class",),
+)
+
+
+def _setting(name: str, key: str, default):
+    value = os.getenv(f"ADMISSION_{name.upper()}_{key}")
+    return type(default)(value) if value else default
+
+
+class RouteClass:
+    """Adaptive concurrency limit and bounded FIFO queue of one route class (one event loop)"""
+
+    def __init__(self, name: str, max_limit: int, min_limit: int = 1, max_queue: int = 16,
+                 target_seconds: float = 1.0):
+        self.name = name
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.max_queue = max_queue
+        self.target_seconds = target_seconds
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self._waiters = deque()
+        self._window: List[float] = []
+        self._saturated = False
+        self._mean_seconds = target_seconds
+        admission_limit.set(self.limit, route_class=name)
+
+    def retry_after(self) -> int:
+        """Rough time for the queue ahead to drain"""
+        estimate = (len(self._waiters) + 1) * self._mean_seconds / max(1, int(self.limit))
+        return max(1, min(ADMISSION_MAX_RETRY_AFTER_SECONDS, math.ceil(estimate)))
+
+    def _admit(self):
+        self.in_flight += 1
+        if self.in_flight >= int(self.limit):
+            self._saturated = True
+        admission_in_flight.set(self.in_flight, route_class=self.name)
+
+    async def acquire(self) -> Optional[str]:
+        """Wait for a slot; returns the reason when the request is shed instead"""
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self._admit()
+            return None
+        if len(self._waiters) >= self.max_queue:
+            return "queue_full"
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        admission_queued.set(len(self._waiters), route_class=self.name)
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), ADMISSION_QUEUE_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # Admitted at the same moment the wait timed out; pass the slot on
+                self.release(None)
+            return "queue_timeout"
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release(None)
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            admission_queued.set(len(self._waiters), route_class=self.name)
+        admission_wait.observe(time.perf_counter() - started, route_class=self.name)
+        return None
+
+    def release(self, service_seconds: Optional[float]):
+        self.in_flight -= 1
+        if service_seconds is not None:
+            self._observe(service_seconds)
+        # Hand free slots to the oldest waiters
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self._admit()
+                waiter.set_result(True)
+        admission_in_flight.set(self.in_flight, route_class=self.name)
+
+    def _observe(self, seconds: float):
+        self._window.append(seconds)
+        if len(self._window) < ADMISSION_WINDOW_REQUESTS:
+            return
+        window = sorted(self._window)
+        self._window = []
+        p90 = window[min(len(window) - 1, int(len(window) * 0.9))]
+        self._mean_seconds = sum(window) / len(window)
+        previous = int(self.limit)
+        if p90 > self.target_seconds:
+            self.limit = max(self.min_limit, self.limit * ADMISSION_DECREASE_FACTOR)
+        elif self._saturated:
+            self.limit = min(self.max_limit, self.limit + 1)
+        self._saturated = False
+        if int(self.limit) != previous:
+            print(f"⚖️  Admission limit of {self.name}: {previous} -> {int(self.limit)} (p90 {p90 * 1000:.0f} ms)")
+        admission_limit.set(int(self.limit), route_class=self.name)
+
+
+def build_classes(config: Dict[str, dict] = None):
+    """[(method, compiled path regex, RouteClass)] from ROUTE_CLASSES plus environment overrides"""
+    matchers = []
+    for name, options in (config or ROUTE_CLASSES).items():
+        route_class = RouteClass(
+            name,
+            max_limit=_setting(name, "MAX_CONCURRENCY", options["max_limit"]),
+            min_limit=_setting(name, "MIN_CONCURRENCY", options.get("min_limit", 1)),
+            max_queue=_setting(name, "QUEUE", options.get("max_queue", 16)),
+            target_seconds=_setting(name, "TARGET_SECONDS", float(options.get("target_seconds", 1.0))),
+        )
+        for method, path in options["routes"]:
+            matchers.append((method, compile_path(path)[0], route_class))
+    return matchers
+
+
+def _shed_body(route_class: RouteClass) -> bytes:
+    return json.dumps({"detail": "Server is busy, please retry", "route_class": route_class.name}).encode()
+
+
+class AdmissionMiddleware:
+    """Pure ASGI middleware applying the route class limits before a request reaches the router"""
+
+    def __init__(self, app, config: Dict[str, dict] = None, enabled: bool = None):
+        self.app = app
+        # None follows ADMISSION_CONTROL_ENABLED, which can be flipped at runtime (benchmarks)
+        self.enabled = enabled
+        self.matchers = build_classes(config)
+
+    def classify(self, method: str, path: str) -> Optional[RouteClass]:
+        for route_method, regex, route_class in self.matchers:
+            if route_method == method and regex.match(path):
+                return route_class
+        return None
+
+    async def __call__(self, scope, receive, send):
+        route_class = None
+        enabled = ADMISSION_CONTROL_ENABLED if self.enabled is None else self.enabled
+        if scope["type"] == "http" and enabled:
+            route_class = self.classify(scope["method"], scope["path"])
+        if route_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        reason = await route_class.acquire()
+        if reason is not None:
+            admission_shed.inc(route_class=route_class.name, reason=reason)
+            body = _shed_body(route_class)
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(route_class.retry_after()).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        started = time.perf_counter()
+        failed = False
+        try:
+            await self.app(scope, receive, send)
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            # Failures often return fast; they say nothing about how loaded the database is
+            route_class.release(None if failed else time.perf_counter() - started)
@@ -0,0 +1,315 @@
+"""
+Cascade removal of patients and doctors with their records and stored files.
+
+Removing a patient or doctor deletes everything that references them:
+upload sessions, medical reports, medical sessions with their child rows
+(prescriptions, symptoms, diagnoses, vital signs, treatment plans) and
+appointments, then the row itself.
+
+Rows are deleted in chunks of CASCADE_BATCH_SIZE primary keys, each in its
+own short transaction, so a large purge never holds locks on a big range of
+rows. A chunk of reports deletes the storage objects no other report
+references before it commits, while the reports sharing their content are
+locked (as delete_report does): an upload of the same content waits, then
+finds it gone and stores it again. Objects are deleted in batches of up to
+1000 keys (one S3 DeleteObjects call each), at most CASCADE_DELETE_CONCURRENCY
+batches at a time.
+
+Removals run in a background thread; their progress is kept in memory and
+served by GET /admin/cleanup/{cleanup_id}. An interrupted removal can simply
+be started again: every step only deletes what is still there.
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from sqlalchemy import or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import metrics
+from . import models
+from . import resumable_uploads
+from .crud import medical_reports
+from .database import SessionLocal
+from .storage import DELETE_OBJECTS_BATCH_SIZE, get_storage
+
+CASCADE_BATCH_SIZE = int(os.getenv('CASCADE_BATCH_SIZE', '500'))
+CASCADE_DELETE_CONCURRENCY = max(1, int(os.getenv('CASCADE_DELETE_CONCURRENCY', '4')))
+# How long DELETE /admin/patient|doctor/{id} waits before answering 202 with a progress URL
+CASCADE_SYNC_WAIT_SECONDS = float(os.getenv('CASCADE_SYNC_WAIT_SECONDS', '10'))
+# Finished removals kept for progress lookups
+CASCADE_JOB_RETENTION_SECONDS = 3600
+
+SESSION_CHILD_MODELS = (
+    models.Prescription,
+    models.Symptom,
+    models.Diagnosis,
+    models.VitalSign,
+    models.TreatmentPlan,
+)
+
+ENTITY_MODELS = {
+    "patient": (models.Patient, "patient_id"),
+    "doctor": (models.Doctor, "doctor_id"),
+}
+
+cascade_rows_deleted = metrics.registry.counter(
+    "curanet_cascade_rows_deleted_total",
+    "Rows deleted by cascade removals",
+    ("table",),
+)
+cascade_objects_deleted = metrics.registry.counter(
+    "curanet_cascade_objects_deleted_total",
+    "Storage objects deleted by cascade removals, by outcome",
+    ("outcome",),
+)
+
+
+class CleanupJob:
+    """Progress of one cascade removal"""
+
+    def __init__(self, entity: str, entity_id: int):
+        self.cleanup_id = str(uuid.uuid4())
+        self.entity = entity
+        self.entity_id = entity_id
+        self.status = "pending"
+        self.phase = None
+        self.rows_deleted = {}
+        self.objects_deleted = 0
+        self.objects_failed = {}
+        self.error = None
+        self.started_at = datetime.utcnow()
+        self.finished_at = None
+        self.done = threading.Event()
+        self._lock = threading.Lock()
+
+    def add_rows(self, table: str, count: int):
+        if not count:
+            return
+        with self._lock:
+            self.rows_deleted[table] = self.rows_deleted.get(table, 0) + count
+        cascade_rows_deleted.inc(count, table=table)
+
+    def add_objects(self, deleted: int, failed: dict):
+        with self._lock:
+            self.objects_deleted += deleted
+            self.objects_failed.update(failed)
+        cascade_objects_deleted.inc(deleted, outcome="deleted")
+        if failed:
+            cascade_objects_deleted.inc(len(failed), outcome="failed")
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "cleanup_id": self.cleanup_id,
+                "entity": self.entity,
+                "entity_id": self.entity_id,
+                "status": self.status,
+                "phase": self.phase,
+                "rows_deleted": dict(self.rows_deleted),
+                "objects_deleted": self.objects_deleted,
+                "objects_failed": len(self.objects_failed),
+                "failed_keys": sorted(self.objects_failed)[:20],
+                "error": self.error,
+                "started_at": self.started_at.isoformat(),
+                "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            }
+
+
+class _ObjectDeleter:
+    """Delete keys in batches on a bounded thread pool, waiting for them"""
+
+    def __init__(self, storage, job: CleanupJob):
+        self.storage = storage
+        self.job = job
+        self._executor = ThreadPoolExecutor(max_workers=CASCADE_DELETE_CONCURRENCY, thread_name_prefix="curanet-cascade")
+
+    def delete(self, file_keys):
+        batches = [file_keys[start:start + DELETE_OBJECTS_BATCH_SIZE]
+                   for start in range(0, len(file_keys), DELETE_OBJECTS_BATCH_SIZE)]
+        for future in [self._executor.submit(self._delete, batch) for batch in batches]:
+            future.result()
+
+    def _delete(self, batch):
+        try:
+            failed = self.storage.delete_objects(batch)
+        except Exception as e:
+            failed = {key: str(e) for key in batch}
+        self.job.add_objects(len(batch) - len(failed), failed)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+def _id_batches(db: Session, id_column, condition):
+    """Yield lists of primary keys matching condition, CASCADE_BATCH_SIZE at a time"""
+    last_id = None
+    while True:
+        query = db.query(id_column).filter(condition)
+        if last_id is not None:
+            query = query.filter(id_column > last_id)
+        ids = [row[0] for row in query.order_by(id_column).limit(CASCADE_BATCH_SIZE).all()]
+        if not ids:
+            return
+        yield ids
+        last_id = ids[-1]
+
+
+def _delete_upload_sessions(db: Session, job: CleanupJob, condition):
+    Upload = models.UploadSession
+    for ids in _id_batches(db, Upload.upload_id, condition):
+        uploads = db.query(Upload).filter(Upload.upload_id.in_(ids)).all()
+        resumable_uploads.abort_sessions(db, uploads)
+        deleted = db.query(Upload).filter(Upload.upload_id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+        job.add_rows("upload_sessions", deleted)
+
+
+def _delete_reports(db: Session, job: CleanupJob, deleter: _ObjectDeleter, condition):
+    Report = models.MedicalReport
+    for ids in _id_batches(db, Report.report_id, condition):
+        file_keys, contents = set(), set()
+        for row in db.query(Report.file_key, Report.thumbnail_key, Report.content_sha256).filter(
+            Report.report_id.in_(ids)
+        ).all():
+            file_keys.add(row.file_key)
+            if row.thumbnail_key:
+                file_keys.add(row.thumbnail_key)
+            if row.content_sha256:
+                contents.add(row.content_sha256)
+        # Uploads reusing this content wait for the commit, when the objects are gone
+        for content_sha256 in sorted(contents):
+            medical_reports.lock_content(db, content_sha256)
+        # Upload sessions point at the report they created
+        db.query(models.UploadSession).filter(
+            models.UploadSession.report_id.in_(ids)
+        ).delete(synchronize_session=False)
+        db.query(models.Job).filter(models.Job.report_id.in_(ids)).delete(synchronize_session=False)
+        deleted = db.query(Report).filter(Report.report_id.in_(ids)).delete(synchronize_session=False)
+        # Identical uploads share an object; keep it while another report uses it
+        deleter.delete(sorted(file_keys - medical_reports.referenced_keys(db, file_keys, lock=True)))
+        db.commit()
+        job.add_rows("medical_reports", deleted)
+
+
+def _delete_sessions(db: Session, job: CleanupJob, deleter: _ObjectDeleter, condition):
+    Session_ = models.MedicalSession
+    for ids in _id_batches(db, Session_.session_id, condition):
+        _delete_upload_sessions(db, job, models.UploadSession.session_id.in_(ids))
+        _delete_reports(db, job, deleter, models.MedicalReport.session_id.in_(ids))
+        for child in SESSION_CHILD_MODELS:
+            deleted = db.query(child).filter(child.session_id.in_(ids)).delete(synchronize_session=False)
+            job.add_rows(child.__tablename__, deleted)
+        deleted = db.query(Session_).filter(Session_.session_id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+        job.add_rows("medical_sessions", deleted)
+
+
+def _delete_appointments(db: Session, job: CleanupJob, condition):
+    Appointment = models.Appointment
+    for ids in _id_batches(db, Appointment.id, condition):
+        deleted = db.query(Appointment).filter(Appointment.id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+        job.add_rows("appointments", deleted)
+
+
+def _set_phase(job: CleanupJob, phase: str):
+    job.phase = phase
+    print(f"🧹 Removing {job.entity} {job.entity_id}: {phase} ({sum(job.rows_deleted.values())} rows, "
+          f"{job.objects_deleted} files deleted so far)")
+
+
+def _delete_dependents(db: Session, job: CleanupJob, deleter: _ObjectDeleter):
+    column = ENTITY_MODELS[job.entity][1]
+    entity_id = job.entity_id
+    appointment_ids = select(models.Appointment.id).where(getattr(models.Appointment, column) == entity_id)
+
+    _set_phase(job, "upload_sessions")
+    _delete_upload_sessions(db, job, getattr(models.UploadSession, column) == entity_id)
+    _set_phase(job, "medical_reports")
+    _delete_reports(db, job, deleter, getattr(models.MedicalReport, column) == entity_id)
+    _set_phase(job, "medical_sessions")
+    _delete_sessions(db, job, deleter, or_(
+        getattr(models.MedicalSession, column) == entity_id,
+        models.MedicalSession.appointment_id.in_(appointment_ids),
+    ))
+    _set_phase(job, "appointments")
+    _delete_appointments(db, job, getattr(models.Appointment, column) == entity_id)
+
+
+def run_cleanup(db: Session, job: CleanupJob, storage=None):
+    """Remove the job's entity and everything referencing it, updating job as it goes"""
+    model = ENTITY_MODELS[job.entity][0]
+    deleter = _ObjectDeleter(storage or get_storage(), job)
+    job.status = "running"
+    try:
+        try:
+            for attempt in range(2):
+                _delete_dependents(db, job, deleter)
+                _set_phase(job, job.entity)
+                try:
+                    deleted = db.query(model).filter(model.id == job.entity_id).delete(synchronize_session=False)
+                    db.commit()
+                    job.add_rows(model.__tablename__, deleted)
+                    break
+                except IntegrityError:
+                    # Something was added for the entity meanwhile; sweep once more
+                    db.rollback()
+                    if attempt:
+                        raise
+        finally:
+            deleter.close()
+        job.status = "completed_with_errors" if job.objects_failed else "completed"
+        if job.objects_failed:
+            print(f"⚠️  {len(job.objects_failed)} file(s) of {job.entity} {job.entity_id} could not be deleted")
+    except Exception as e:
+        db.rollback()
+        job.status = "failed"
+        job.error = str(e)
+        print(f"❌ Removing {job.entity} {job.entity_id} failed: {e}")
+    finally:
+        job.phase = None
+        job.finished_at = datetime.utcnow()
+        job.done.set()
+    return job
+
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+def _forget_finished():
+    cutoff = time.time() - CASCADE_JOB_RETENTION_SECONDS
+    for cleanup_id, job in list(_jobs.items()):
+        if job.finished_at and job.finished_at.timestamp() < cutoff:
+            del _jobs[cleanup_id]
+
+
+def _run_in_background(job: CleanupJob):
+    db = SessionLocal()
+    try:
+        run_cleanup(db, job)
+    finally:
+        db.close()
+
+
+def start_cleanup(entity: str, entity_id: int) -> CleanupJob:
+    """Start removing an entity in a background thread; a removal already running is reused"""
+    with _jobs_lock:
+        _forget_finished()
+        for job in _jobs.values():
+            if job.entity == entity and job.entity_id == entity_id and not job.done.is_set():
+                return job
+        job = CleanupJob(entity, entity_id)
+        _jobs[job.cleanup_id] = job
+    threading.Thread(target=_run_in_background, args=(job,), name="curanet-cascade", daemon=True).start()
+    return job
+
+
+def get_cleanup(cleanup_id: str):
+    with _jobs_lock:
+        return _jobs.get(cleanup_id)
@@ -0,0 +1,296 @@
+"""
+Change feed of appointments, medical sessions, prescriptions and reports.
+
+Downstream systems (billing, analytics) used to poll /admin/appointments-list
+and /admin/patients-list and diff the dumps. They now read only what changed:
+
+    GET /changes?since=0&limit=500
+    -> {"changes": [{"seq": 1, "entity": "appointment", "entity_id": 42,
+                     "operation": "insert", "data": {...}, "created_at": ...}, ...],
+        "next": 500, "has_more": true, "head": 18342}
+
+and pass "next" back as since= until has_more is false, then keep polling
+with the last cursor. head is the newest seq handed out so far. data is the
+whole row after the change (deferred columns such as a report's
+extracted_text left out), null for deletes.
+
+Every change is appended to the change_events outbox in the transaction that
+makes it, so a change is in the feed if and only if it was committed. Session
+events collect the inserted, updated and deleted rows of each flush; bulk
+UPDATE/DELETE statements (cascade cleanup, the upload spool) are recorded
+row by row by selecting the rows they touch around the statement, a
+single-row insert(Model).values(...) (new reports) by reading back the row
+it inserted, and bulk INSERTs from their parameters (without entity_id when
+the rows didn't give their ids). Just before commit the transaction takes a block of sequence
+numbers from change_sequences, whose row stays locked until it commits:
+writers commit in seq order, so a reader never sees seq N+1 before N and
+since= can't skip a change that commits late.
+
+Changes are recorded by sessions in processes that import this module: the
+API (with its jobs, cleanup and upload spool). Writes made with raw SQL text, or
+by scripts that don't import it such as the benchmark dataset generator,
+aren't in the feed. Old events are removed with
+
+    python -m backend.change_feed prune --days 30
+
+after which a since= older than the pruned range answers 410, with
+{"pruned_through": ..., "head": ...} in its detail: the consumer notes
+head, resyncs from the full lists and continues with since=head.
+"""
+import argparse
+import json
+import os
+from datetime import datetime, timedelta
+from itertools import chain
+from typing import Optional
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import delete, event, func, insert, inspect, select, update
+from sqlalchemy.orm import Session
+
+from . import metrics
+from . import models
+
+CHANGES_PAGE_SIZE = int(os.getenv('CHANGES_PAGE_SIZE', '500'))
+CHANGES_MAX_PAGE_SIZE = int(os.getenv('CHANGES_MAX_PAGE_SIZE', '5000'))
+CHANGE_FEED_RETENTION_DAYS = int(os.getenv('CHANGE_FEED_RETENTION_DAYS', '30'))
+
+# Tracked models and their entity names in the feed
+FEED_ENTITIES = {
+    models.Appointment: "appointment",
+    models.MedicalSession: "medical_session",
+    models.Prescription: "prescription",
+    models.MedicalReport: "medical_report",
+}
+# change_sequences rows: the last seq handed out, and the last seq removed by prune
+SEQUENCE = "changes"
+PRUNED = "changes_pruned"
+INSERT_BATCH_SIZE = 1000
+
+change_events = metrics.registry.counter(
+    "curanet_change_events_total",
+    "Rows appended to the change feed outbox by committing transactions",
+    ("entity", "operation"),
+)
+
+
+def _entity(mapper) -> Optional[str]:
+    return FEED_ENTITIES.get(mapper.class_) if mapper is not None else None
+
+
+def _row(mapper, values) -> dict:
+    """JSON-ready columns of a row from a mapping of attribute (or column) names"""
+    return jsonable_encoder({
+        attribute.key: values[attribute.key]
+        for attribute in mapper.column_attrs
+        if not attribute.deferred and attribute.key in values
+    })
+
+
+def _record(session, entity: str, entity_id, operation: str, data: Optional[dict]):
+    session.info.setdefault("change_feed", []).append((entity, entity_id, operation, data))
+
+
+def _read_rows(session, mapper, ids) -> dict:
+    """Rows as they are now in the transaction by primary key, as JSON-ready columns"""
+    key = mapper.primary_key[0]
+    rows = {}
+    for row in session.connection().execute(select(mapper.local_table).where(key.in_(ids))):
+        values = {attribute.key: row._mapping[attribute.columns[0]] for attribute in mapper.column_attrs}
+        rows[values[key.key]] = _row(mapper, values)
+    return rows
+
+
+def _record_rows(session, entity: str, mapper, ids, operation: str):
+    for entity_id, data in _read_rows(session, mapper, ids).items():
+        _record(session, entity, entity_id, operation, data)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changes(session, flush_context):
+    changes = []
+    for obj, operation in chain(
+        ((obj, "insert") for obj in session.new),
+        ((obj, "update") for obj in session.dirty),
+        ((obj, "delete") for obj in session.deleted),
+    ):
+        state = inspect(obj)
+        entity = _entity(state.mapper)
+        if entity is None:
+            continue
+        if operation == "update" and not session.is_modified(obj, include_collections=False):
+            continue
+        changes.append((state.mapper, entity, state.mapper.primary_key_from_instance(obj)[0], operation))
+    # Inserted and updated rows are read back whole: the objects lack expired and unloaded
+    # attributes, and server-side defaults
+    rows = {}
+    for mapper in {mapper for mapper, _, _, operation in changes if operation != "delete"}:
+        rows[mapper] = _read_rows(session, mapper, [
+            entity_id for changed, _, entity_id, operation in changes if changed is mapper and operation != "delete"
+        ])
+    for mapper, entity, entity_id, operation in changes:
+        _record(session, entity, entity_id, operation, None if operation == "delete" else rows[mapper].get(entity_id))
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _record_bulk_writes(state):
+    if not (state.is_insert or state.is_update or state.is_delete):
+        return None
+    mapper = state.bind_mapper
+    entity = _entity(mapper)
+    if entity is None:
+        return None
+    session = state.session
+    key = mapper.primary_key[0]
+    if state.is_insert:
+        parameters = state.parameters
+        if not parameters:
+            # insert(Model).values(...): the values are in the statement, the id in the result
+            result = state.invoke_statement()
+            ids = [row[0] for row in result.inserted_primary_key_rows if row and row[0] is not None]
+            if ids:
+                _record_rows(session, entity, mapper, ids, "insert")
+            return result
+        rows = parameters if isinstance(parameters, list) else [parameters]
+        for row in rows:
+            _record(session, entity, row.get(key.key), "insert", _row(mapper, row))
+        return None
+    # The rows a bulk UPDATE/DELETE touches, read in its transaction before it runs
+    where = state.statement.whereclause
+    query = select(key) if where is None else select(key).where(where)
+    ids = list(session.connection().execute(query).scalars())
+    result = state.invoke_statement()
+    if state.is_delete:
+        for entity_id in ids:
+            _record(session, entity, entity_id, "delete", None)
+    elif ids:
+        _record_rows(session, entity, mapper, ids, "update")
+    return result
+
+
+def _reserve(session, count: int) -> int:
+    """Take count sequence numbers, locking the counter until commit; returns the first"""
+    table = models.ChangeSequence.__table__
+    updated = session.execute(
+        update(table).where(table.c.name == SEQUENCE).values(value=table.c.value + count)
+    )
+    if updated.rowcount == 0:
+        # Tables created without the migration's seed rows
+        session.execute(insert(table).values(name=SEQUENCE, value=count))
+        return 1
+    last = session.execute(select(table.c.value).where(table.c.name == SEQUENCE)).scalar()
+    return last - count + 1
+
+
+@event.listens_for(Session, "before_commit")
+def _append_changes(session):
+    # Changes not flushed yet belong to this commit too (commit() would flush them after this)
+    if session.new or session.dirty or session.deleted:
+        session.flush()
+    changes = session.info.pop("change_feed", None)
+    if not changes:
+        return
+    first = _reserve(session, len(changes))
+    now = datetime.utcnow()
+    rows = [
+        {"seq": first + offset, "entity": entity, "entity_id": entity_id, "operation": operation,
+         "data": json.dumps(data, separators=(",", ":")) if data is not None else None, "created_at": now}
+        for offset, (entity, entity_id, operation, data) in enumerate(changes)
+    ]
+    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+        session.execute(insert(models.ChangeEvent.__table__), rows[start:start + INSERT_BATCH_SIZE])
+    for entity, _, operation, _ in changes:
+        change_events.inc(entity=entity, operation=operation)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _discard_changes(session, transaction):
+    # Changes of a transaction that was rolled back or abandoned don't carry over
+    if transaction.parent is None:
+        session.info.pop("change_feed", None)
+
+
+def get_changes(db: Session, since: int = 0, limit: int = CHANGES_PAGE_SIZE, entity: Optional[str] = None) -> dict:
+    """A page of changes after the since cursor, oldest first"""
+    if since < 0:
+        raise HTTPException(status_code=422, detail="since must be 0 or a seq from a previous page")
+    if not 1 <= limit <= CHANGES_MAX_PAGE_SIZE:
+        raise HTTPException(status_code=422, detail=f"limit must be between 1 and {CHANGES_MAX_PAGE_SIZE}")
+    if entity is not None and entity not in FEED_ENTITIES.values():
+        raise HTTPException(status_code=422, detail=f"entity must be one of {', '.join(FEED_ENTITIES.values())}")
+
+    sequences = models.ChangeSequence.__table__
+    counters = dict(db.execute(
+        select(sequences.c.name, sequences.c.value).where(sequences.c.name.in_((SEQUENCE, PRUNED)))
+    ).all())
+    head, pruned = counters.get(SEQUENCE, 0), counters.get(PRUNED, 0)
+    if since < pruned:
+        raise HTTPException(status_code=410, detail={
+            "message": f"Changes up to seq {pruned} were pruned; resync from the full lists, then continue from head",
+            "pruned_through": pruned,
+            "head": head,
+        })
+
+    events = models.ChangeEvent.__table__
+    query = select(events).where(events.c.seq > since)
+    if entity is not None:
+        query = query.where(events.c.entity == entity)
+    rows = db.execute(query.order_by(events.c.seq).limit(limit + 1)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        "changes": [
+            {
+                "seq": row.seq,
+                "entity": row.entity,
+                "entity_id": row.entity_id,
+                "operation": row.operation,
+                "data": json.loads(row.data) if row.data is not None else None,
+                "created_at": row.created_at,
+            }
+            for row in rows
+        ],
+        "next": rows[-1].seq if rows else since,
+        "has_more": has_more,
+        "head": head,
+    }
+
+
+def prune(db: Session, days: int) -> int:
+    """Delete events older than days; returns how many. Consumers behind them get 410."""
+    events = models.ChangeEvent.__table__
+    sequences = models.ChangeSequence.__table__
+    through = db.execute(
+        select(func.max(events.c.seq)).where(events.c.created_at < datetime.utcnow() - timedelta(days=days))
+    ).scalar()
+    if through is None:
+        return 0
+    deleted = db.execute(delete(events).where(events.c.seq <= through)).rowcount
+    recorded = db.execute(update(sequences).where(sequences.c.name == PRUNED).values(value=through))
+    if recorded.rowcount == 0:
+        db.execute(insert(sequences).values(name=PRUNED, value=through))
+    db.commit()
+    return deleted
+
+
+def main():
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    prune_parser = subcommands.add_parser("prune", help="delete events older than --days")
+    prune_parser.add_argument("--days", type=int, default=CHANGE_FEED_RETENTION_DAYS,
+                              help=f"keep this many days of events (default: {CHANGE_FEED_RETENTION_DAYS})")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        deleted = prune(db, args.days)
+    finally:
+        db.close()
+    print(f"✅ Pruned {deleted} change events older than {args.days} days")
+
+
+if __name__ == "__main__":
+    main()
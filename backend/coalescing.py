@@ -0,0 +1,153 @@
+"""
+Single-flight coalescing of identical concurrent reads.
+
+When many clients ask for the same thing at once (every doctor of a
+department opening the dashboard at 8:00), only the first request - the
+leader - runs the handler. Identical requests arriving while it is in
+flight wait for it and get a copy of its response. Nothing is kept once
+the leader finishes, so this never serves stale data the way a cache
+could: every response was computed after the request arrived.
+
+Requests are identical when method, route path and query parameters (in
+any order) match. Clients that currently read from the primary after a
+write (read_replicas) only share with each other. Only COALESCED_ROUTES
+take part; their responses must not depend on who is asking.
+
+If the leader fails with an unhandled error or is cancelled, its followers
+run the request themselves. curanet_coalesced_requests_total counts leaders
+and followers per route; requests / leaders is the collapse ratio, also
+exported as curanet_coalesce_collapse_ratio.
+"""
+import asyncio
+import os
+from typing import Optional
+from urllib.parse import parse_qsl, urlencode
+
+from starlette.routing import compile_path
+
+from . import metrics
+from . import read_replicas
+
+COALESCING_ENABLED = os.getenv('COALESCING_ENABLED', 'true').lower() in ('1', 'true', 'yes', 'on')
+
+COALESCED_ROUTES = (
+    "/api/doctors",
+    "/api/departments",
+    "/doctor/availability/{doctor_id}",
+    "/admin/recent-doctors",
+)
+
+coalesced_requests = metrics.registry.counter(
+    "curanet_coalesced_requests_total",
+    "Requests to coalesced routes that ran the handler (leader) or shared a leader's response (follower)",
+    ("route", "role"),
+)
+collapse_ratio = metrics.registry.gauge(
+    "curanet_coalesce_collapse_ratio",
+    "Requests served per handler execution on coalesced routes since start",
+    ("route",),
+)
+
+
+def _header(scope, name: bytes) -> str:
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value.decode("latin-1")
+    return ""
+
+
+def normalized_query(query_string: bytes) -> str:
+    return urlencode(sorted(parse_qsl(query_string.decode("latin-1"), keep_blank_values=True)))
+
+
+class _Flight:
+    """The leader's response, once complete, shared with the requests that joined it"""
+
+    def __init__(self):
+        self.done = asyncio.get_running_loop().create_future()
+        self.route = None
+
+
+class CoalescingMiddleware:
+    """Pure ASGI middleware running identical concurrent GETs of COALESCED_ROUTES once"""
+
+    def __init__(self, app, routes=COALESCED_ROUTES):
+        self.app = app
+        self.routes = [(path, compile_path(path)[0]) for path in routes]
+        self._flights = {}
+        self._counts = {}
+
+    def match(self, path: str) -> Optional[str]:
+        for template, regex in self.routes:
+            if regex.match(path):
+                return template
+        return None
+
+    def _count(self, template: str, role: str):
+        coalesced_requests.inc(route=template, role=role)
+        leaders, total = self._counts.get(template, (0, 0))
+        leaders, total = leaders + (role == "leader"), total + 1
+        self._counts[template] = (leaders, total)
+        collapse_ratio.set(total / max(1, leaders), route=template)
+
+    async def __call__(self, scope, receive, send):
+        template = None
+        if scope["type"] == "http" and scope["method"] in ("GET", "HEAD") and COALESCING_ENABLED:
+            template = self.match(scope["path"])
+        if template is None:
+            await self.app(scope, receive, send)
+            return
+
+        key = (
+            scope["method"],
+            scope["path"],
+            normalized_query(scope.get("query_string", b"")),
+            read_replicas.reads_from_primary(_header(scope, b"cookie")),
+        )
+        flight = self._flights.get(key)
+        if flight is not None:
+            try:
+                start, body = await asyncio.shield(flight.done)
+            except (Exception, asyncio.CancelledError):
+                if not flight.done.done():
+                    # This request was cancelled, not the leader
+                    raise
+                # The leader failed; answer this request on its own
+                await self.app(scope, receive, send)
+                return
+            self._count(template, "follower")
+            # Request metrics label followers with the route the leader matched
+            if flight.route is not None:
+                scope["route"] = flight.route
+            await send(dict(start, headers=list(start["headers"])))
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        flight = _Flight()
+        self._flights[key] = flight
+        self._count(template, "leader")
+        start, chunks = None, []
+
+        async def capture(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        try:
+            await self.app(scope, receive, capture)
+        except BaseException as e:
+            flight.done.set_exception(e)
+            raise
+        else:
+            flight.route = scope.get("route")
+            flight.done.set_result((start, b"".join(chunks)))
+        finally:
+            del self._flights[key]
+            # Followers handle a failure themselves; don't log it as never retrieved
+            flight.done.exception()
+
+        # Outer middlewares may add headers; keep the shared message untouched
+        await send(dict(start, headers=list(start["headers"])))
+        await send({"type": "http.response.body", "body": b"".join(chunks)})
@@ -57,19 +57,16 @@ def edit_doctor(db: Session, doctor_id: int, doctor_data: schemas.DoctorUpdate):
 
 def remove_doctor(db: Session, doctor_id: int):
     """
-    Remove a doctor from the database
+    Start removing a doctor with their appointments, sessions, reports and stored files
+    in the background; returns the doctor's name and the cleanup job
     """
-    try:
-        doctor = db.query(models.Doctor).filter(models.Doctor.id == doctor_id).first()
-        if not doctor:
-            raise HTTPException(status_code=404, detail="Doctor not found")
+    doctor = db.query(models.Doctor.id, models.Doctor.name).filter(models.Doctor.id == doctor_id).first()
+    if not doctor:
+        raise HTTPException(status_code=404, detail="Doctor not found")
 
-        db.delete(doctor)
-        db.commit()
-        return {"message": f"Doctor {doctor.name} successfully removed"}
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Error removing doctor: {str(e)}")
+    from ..cascade_cleanup import start_cleanup
+
+    return doctor.name, start_cleanup("doctor", doctor_id)
 
 
 def format_doctor_id(doctor_id: int) -> str:
@@ -55,23 +55,6 @@ def edit_doctor(db: Session, doctor_id: int, doctor_data: schemas.DoctorUpdate):
         raise HTTPException(status_code=500, detail=f"Error updating doctor: {str(e)}")
 
 
-def remove_doctor(db: Session, doctor_id: int):
-    """
-    Remove a doctor from the database
-    """
-    try:
-        doctor = db.query(models.Doctor).filter(models.Doctor.id == doctor_id).first()
-        if not doctor:
-            raise HTTPException(status_code=404, detail="Doctor not found")
-
-        db.delete(doctor)
-        db.commit()
-        return {"message": f"Doctor {doctor.name} successfully removed"}
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Error removing doctor: {str(e)}")
-
-
 def format_doctor_id(doctor_id: int) -> str:
     """
     Format doctor ID to display format (e.g., D000001)
@@ -0,0 +1,184 @@
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Iterator, List
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from ..models import Appointment, Patient, Doctor, MedicalSession
+
+# Rows fetched from the server-side cursor per round trip
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+APPOINTMENT_COLUMNS = [
+    "id", "appointment_id", "appointment_time", "patient_id",
+    "patient_name", "doctor_id", "doctor_name", "status",
+]
+
+PATIENT_COLUMNS = [
+    "id", "patient_id", "name", "age", "blood_group", "email", "phone", "medical_history",
+]
+
+SESSION_COLUMNS = [
+    "session_id", "appointment_id", "patient_id", "doctor_id", "session_date",
+    "status", "chief_complaint", "session_notes", "created_at", "updated_at",
+]
+
+
+def _isoformat(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _stream(db: Session, statement) -> Iterator:
+    """Execute a statement through a server-side cursor, yielding rows in batches"""
+    result = db.execute(statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+    try:
+        for row in result:
+            yield row
+    finally:
+        result.close()
+
+
+def iter_appointments(db: Session) -> Iterator[dict]:
+    """Stream all appointments with patient and doctor names"""
+    statement = (
+        select(
+            Appointment.id,
+            Appointment.appointment_time,
+            Appointment.patient_id,
+            Appointment.doctor_id,
+            Appointment.status,
+            Patient.name.label("patient_name"),
+            Doctor.name.label("doctor_name"),
+        )
+        .join(Patient, Appointment.patient_id == Patient.id)
+        .join(Doctor, Appointment.doctor_id == Doctor.id)
+        .order_by(Appointment.id)
+    )
+    for row in _stream(db, statement):
+        yield {
+            "id": row.id,
+            "appointment_id": f"A{str(row.id).zfill(6)}",
+            "appointment_time": _isoformat(row.appointment_time),
+            "patient_id": f"P{str(row.patient_id).zfill(6)}",
+            "patient_name": row.patient_name,
+            "doctor_id": row.doctor_id,
+            "doctor_name": row.doctor_name,
+            "status": row.status,
+        }
+
+
+def iter_patients(db: Session) -> Iterator[dict]:
+    """Stream all patients"""
+    statement = select(
+        Patient.id,
+        Patient.name,
+        Patient.age,
+        Patient.blood_group,
+        Patient.email,
+        Patient.phone,
+        Patient.medical_history,
+    ).order_by(Patient.id)
+    for row in _stream(db, statement):
+        yield {
+            "id": row.id,
+            "patient_id": f"P{str(row.id).zfill(6)}",
+            "name": row.name,
+            "age": row.age,
+            "blood_group": row.blood_group,
+            "email": row.email,
+            "phone": row.phone,
+            "medical_history": row.medical_history,
+        }
+
+
+def iter_sessions(db: Session) -> Iterator[dict]:
+    """Stream all medical sessions (without child rows)"""
+    statement = select(
+        MedicalSession.session_id,
+        MedicalSession.appointment_id,
+        MedicalSession.patient_id,
+        MedicalSession.doctor_id,
+        MedicalSession.session_date,
+        MedicalSession.status,
+        MedicalSession.chief_complaint,
+        MedicalSession.session_notes,
+        MedicalSession.created_at,
+        MedicalSession.updated_at,
+    ).order_by(MedicalSession.session_id)
+    for row in _stream(db, statement):
+        yield {
+            "session_id": row.session_id,
+            "appointment_id": row.appointment_id,
+            "patient_id": row.patient_id,
+            "doctor_id": row.doctor_id,
+            "session_date": _isoformat(row.session_date),
+            "status": row.status.value if row.status else None,
+            "chief_complaint": row.chief_complaint,
+            "session_notes": row.session_notes,
+            "created_at": _isoformat(row.created_at),
+            "updated_at": _isoformat(row.updated_at),
+        }
+
+
+EXPORTS = {
+    "appointments": (iter_appointments, APPOINTMENT_COLUMNS),
+    "patients": (iter_patients, PATIENT_COLUMNS),
+    "sessions": (iter_sessions, SESSION_COLUMNS),
+}
+
+
+def encode_ndjson(rows: Iterator[dict], batch_size: int = 500) -> Iterator[bytes]:
+    """Encode rows as newline-delimited JSON, a few hundred rows per chunk"""
+    lines: List[str] = []
+    for row in rows:
+        lines.append(json.dumps(row, default=str))
+        if len(lines) >= batch_size:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+            lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def encode_csv(rows: Iterator[dict], columns: List[str], batch_size: int = 500) -> Iterator[bytes]:
+    """Encode rows as CSV with a header line, a few hundred rows per chunk"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+    writer.writeheader()
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+        if count >= batch_size:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate(0)
+            count = 0
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def stream_export(session_factory, entity: str, export_format: str) -> Iterator[bytes]:
+    """
+    Stream an export as encoded chunks.
+
+    The generator owns its own database session because it keeps running after
+    the request's dependencies (and their session) have been torn down.
+    """
+    row_iterator, columns = EXPORTS[entity]
+    db = session_factory()
+    try:
+        rows = row_iterator(db)
+        if export_format == "csv":
+            yield from encode_csv(rows, columns)
+        else:
+            yield from encode_ndjson(rows)
+    finally:
+        db.close()
@@ -1,5 +1,6 @@
+from sqlalchemy import distinct, func, select
 from sqlalchemy.orm import Session
-from ..models import Patient, Appointment
+from ..models import Patient, Appointment, Doctor, MedicalSession, Prescription
 from ..schemas import PatientCreate, PatientResponse, PatientUpdate, AdminPatientResponse
 from typing import List, Optional
 from fastapi import HTTPException
@@ -80,18 +81,64 @@ def edit_patient(db: Session, patient_id: int, patient_data: PatientUpdate) -> d
             raise HTTPException(status_code=400, detail=str(e))
     return None
 
-def remove_patient(db: Session, patient_id: int) -> dict:
-    """Remove a patient and their associated appointments"""
-    patient = db.query(Patient).filter(Patient.id == patient_id).first()
+def remove_patient(db: Session, patient_id: int):
+    """Start removing a patient with their appointments, sessions, reports and stored files in the background"""
+    from ..cascade_cleanup import start_cleanup
+
+    patient = db.query(Patient.id).filter(Patient.id == patient_id).first()
     if patient:
-        try:
-            # First, delete associated appointments
-            db.query(Appointment).filter(Appointment.patient_id == patient_id).delete()
-            # Then delete the patient
-            db.delete(patient)
-            db.commit()
-            return {"message": "Patient and associated appointments removed successfully"}
-        except Exception as e:
-            db.rollback()
-            raise HTTPException(status_code=400, detail=str(e))
-    return {"error": "Patient not found"}
\ No newline at end of file
+        return start_cleanup("patient", patient_id)
+    return None
+
+def get_patient_summary(db: Session, patient_id: int) -> Optional[dict]:
+    """Admin summary of a patient: details, visit statistics, doctors seen and latest prescriptions"""
+    consulted = select(Doctor.id).join(Appointment, Appointment.doctor_id == Doctor.id)\
+        .where(Appointment.patient_id == patient_id)
+    # Patient and statistics in one statement, the counts as scalar subqueries
+    row = db.execute(select(
+        Patient.id, Patient.name, Patient.age, Patient.blood_group, Patient.email, Patient.phone,
+        select(func.count(Appointment.id)).where(Appointment.patient_id == patient_id)
+            .scalar_subquery().label("total_appointments"),
+        select(func.count(MedicalSession.session_id)).where(MedicalSession.patient_id == patient_id)
+            .scalar_subquery().label("total_sessions"),
+        consulted.with_only_columns(func.count(distinct(Doctor.id)))
+            .scalar_subquery().label("doctors_consulted"),
+    ).where(Patient.id == patient_id)).first()
+    if row is None:
+        return None
+
+    doctors = db.execute(
+        select(Doctor.name, Doctor.department).where(Doctor.id.in_(consulted)).order_by(Doctor.name)
+    ).all()
+    recent_prescriptions = db.execute(
+        select(Prescription.medication_name, Prescription.dosage, Prescription.frequency)
+        .join(MedicalSession, MedicalSession.session_id == Prescription.session_id)
+        .where(MedicalSession.patient_id == patient_id)
+        .order_by(MedicalSession.session_date.desc())
+        .limit(5)
+    ).all()
+
+    return {
+        "patient_info": {
+            "id": row.id,
+            "name": row.name,
+            "age": row.age,
+            "blood_group": row.blood_group,
+            "email": row.email,
+            "phone": row.phone
+        },
+        "statistics": {
+            "total_appointments": row.total_appointments,
+            "total_sessions": row.total_sessions,
+            "doctors_consulted": row.doctors_consulted
+        },
+        "doctors": [{
+            "name": doctor.name,
+            "department": doctor.department
+        } for doctor in doctors],
+        "recent_prescriptions": [{
+            "medication_name": p.medication_name,
+            "dosage": p.dosage,
+            "frequency": p.frequency
+        } for p in recent_prescriptions]
+    }
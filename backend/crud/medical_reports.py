@@ -0,0 +1,123 @@
+from sqlalchemy import func, insert
+from sqlalchemy.orm import Session
+from typing import Callable, List, Optional
+from datetime import datetime
+
+from .. import models
+
+
+def lock_content(db: Session, content_sha256: str) -> List:
+    """
+    Lock the reports holding this content until the transaction ends; returns
+    their (report_id, file_key, storage_status) as committed.
+
+    Uploads linking a new report to a stored object and deletes removing the
+    object with its last report both take these locks, so an object is never
+    deleted after a new report was linked to it. The rows are locked by
+    primary key: a locking read on the content_sha256 index would also take
+    gap locks, and two uploads of new content would deadlock on the insert.
+    """
+    Report = models.MedicalReport
+    report_ids = [row.report_id for row in db.query(Report.report_id).filter(Report.content_sha256 == content_sha256)]
+    if not report_ids:
+        return []
+    return db.query(Report.report_id, Report.file_key, Report.storage_status).filter(
+        Report.report_id.in_(report_ids),
+        # A row deleted (or changed) since the read above is gone from the locked set
+        Report.content_sha256 == content_sha256,
+    ).with_for_update().all()
+
+
+def find_stored_object(db: Session, content_sha256: str, lock: bool = False) -> Optional[str]:
+    """
+    Return the storage key already holding this content, if any report references it.
+
+    With lock=True the reports holding it stay locked (lock_content) until the
+    caller commits the report that reuses the key.
+    """
+    # Content still waiting in the upload spool doesn't count: the object may not exist yet
+    if lock:
+        rows = lock_content(db, content_sha256)
+        return next((row.file_key for row in rows if row.storage_status == "stored"), None)
+    row = db.query(models.MedicalReport.file_key).filter(
+        models.MedicalReport.content_sha256 == content_sha256,
+        models.MedicalReport.storage_status == "stored",
+    ).first()
+    return row.file_key if row else None
+
+
+def create_report(db: Session, patient_id: int, doctor_id: int, session_id: Optional[int],
+                  report_name: str, file_key: str, file_size: int, content_type: str,
+                  content_sha256: Optional[str], shared_with: str = "[]",
+                  storage_status: str = "stored", commit: bool = True) -> int:
+    """Insert a medical_reports row and return its report_id; commit=False leaves committing to the caller"""
+    # An INSERT statement rather than a new object keeps the insert independent of the
+    # ORM relationships on MedicalReport; unlike raw SQL it still reaches the change feed
+    result = db.execute(insert(models.MedicalReport).values(
+        patient_id=patient_id,
+        doctor_id=doctor_id,
+        session_id=session_id,
+        report_name=report_name,
+        file_key=file_key,
+        file_size=file_size,
+        content_type=content_type,
+        content_sha256=content_sha256,
+        uploaded_at=datetime.utcnow(),
+        shared_with=shared_with,
+        storage_status=storage_status,
+    ))
+    if commit:
+        db.commit()
+    return result.inserted_primary_key[0]
+
+
+def count_references(db: Session, file_key: str) -> int:
+    """Number of reports pointing at a storage object"""
+    return db.query(func.count(models.MedicalReport.report_id)).filter(
+        models.MedicalReport.file_key == file_key
+    ).scalar()
+
+
+def delete_report(db: Session, report: models.MedicalReport, delete_object: Callable[[str], bool]) -> bool:
+    """
+    Delete a report row, and its storage object with the last report referencing it.
+
+    delete_object(file_key) is called before the delete commits, while the
+    reports sharing the content are locked (lock_content): an upload reusing
+    the object waits, then finds it gone and stores the content again.
+    Returns what delete_object returned, False when the object is still referenced.
+    """
+    file_key = report.file_key
+    if report.content_sha256:
+        lock_content(db, report.content_sha256)
+    db.delete(report)
+    db.flush()
+    object_deleted = False
+    if count_references(db, file_key) == 0:
+        object_deleted = delete_object(file_key)
+    db.commit()
+    return object_deleted
+
+
+def referenced_keys(db: Session, file_keys, lock: bool = False) -> set:
+    """
+    The subset of file_keys still referenced by at least one report, as its file or thumbnail.
+
+    With lock=True the check is a locking read: it sees reports committed after
+    the transaction's snapshot, and reports inserted with these keys wait until
+    the caller commits.
+    """
+    file_keys = list(set(file_keys))
+    if not file_keys:
+        return set()
+    rows = db.query(models.MedicalReport.file_key).filter(
+        models.MedicalReport.file_key.in_(file_keys)
+    )
+    thumbnails = db.query(models.MedicalReport.thumbnail_key).filter(
+        models.MedicalReport.thumbnail_key.in_(file_keys)
+    )
+    if lock:
+        rows, thumbnails = rows.with_for_update(read=True).all(), thumbnails.with_for_update(read=True).all()
+    else:
+        rows, thumbnails = rows.distinct().all(), thumbnails.distinct().all()
+    return {row.file_key for row in rows} | {row.thumbnail_key for row in thumbnails}
@@ -4,6 +4,7 @@ from typing import List, Optional
 from datetime import datetime
 
 from .. import models, schemas
+from . import session_sections
 
 
 def create_medical_session(db: Session, session_data: schemas.MedicalSessionCreate, patient_id: int, doctor_id: int):
@@ -175,85 +176,45 @@ def get_session_treatment_plans(db: Session, session_id: int):
     return db.query(models.TreatmentPlan).filter(models.TreatmentPlan.session_id == session_id).all()
 
 
-def format_medical_session_response(session: models.MedicalSession, db: Session):
-    """Format medical session for API response"""
+# Top-level fields of a formatted session; patient_name/doctor_name cost a query each
+SESSION_FIELDS = {
+    "session_id": lambda session, names: session.session_id,
+    "appointment_id": lambda session, names: session.appointment_id,
+    "patient_id": lambda session, names: session.patient_id,
+    "doctor_id": lambda session, names: session.doctor_id,
+    "session_date": lambda session, names: session.session_date.isoformat() if session.session_date else None,
+    "status": lambda session, names: session.status.value if session.status else None,
+    "chief_complaint": lambda session, names: session.chief_complaint,
+    "session_notes": lambda session, names: session.session_notes,
+    "patient_name": lambda session, names: names["patient_name"],
+    "doctor_name": lambda session, names: names["doctor_name"],
+}
+
+
+def select_session_fields(fields: Optional[str] = None, include: Optional[str] = None) -> session_sections.Selection:
+    """Validated fields=/include= selection for format_medical_session_response"""
+    return session_sections.select_sessions(fields, include, SESSION_FIELDS, session_sections.SESSION_SECTIONS)
+
+
+def format_medical_session_response(session: models.MedicalSession, db: Session,
+                                    selection: Optional[session_sections.Selection] = None):
+    """Format medical session for API response (only the selected fields and sections)"""
+    if selection is None:
+        selection = select_session_fields()
+
     # Get patient and doctor names
-    patient = db.query(models.Patient).filter(models.Patient.id == session.patient_id).first()
-    doctor = db.query(models.Doctor).filter(models.Doctor.id == session.doctor_id).first()
-    
-    # Get all related data
-    vital_signs = get_session_vital_signs(db, session.session_id)
-    symptoms = get_session_symptoms(db, session.session_id)
-    prescriptions = get_session_prescriptions(db, session.session_id)
-    diagnoses = get_session_diagnoses(db, session.session_id)
-    treatment_plans = get_session_treatment_plans(db, session.session_id)
-    
-    return {
-        "session_id": session.session_id,
-        "appointment_id": session.appointment_id,
-        "patient_id": session.patient_id,
-        "doctor_id": session.doctor_id,
-        "session_date": session.session_date.isoformat() if session.session_date else None,
-        "status": session.status.value if session.status else None,
-        "chief_complaint": session.chief_complaint,
-        "session_notes": session.session_notes,
-        "patient_name": patient.name if patient else "Unknown",
-        "doctor_name": doctor.name if doctor else "Unknown",
-        "vital_signs": [
-            {
-                "vital_id": vs.vital_id,
-                "blood_pressure": f"{vs.blood_pressure_systolic}/{vs.blood_pressure_diastolic}" if vs.blood_pressure_systolic and vs.blood_pressure_diastolic else None,
-                "heart_rate": vs.heart_rate,
-                "temperature": float(vs.temperature) if vs.temperature else None,
-                "respiratory_rate": vs.respiratory_rate,
-                "oxygen_saturation": vs.oxygen_saturation,
-                "weight": float(vs.weight) if vs.weight else None,
-                "height": float(vs.height) if vs.height else None,
-                "recorded_at": vs.recorded_at.isoformat() if vs.recorded_at else None
-            } for vs in vital_signs
-        ],
-        "symptoms": [
-            {
-                "symptom_id": s.symptom_id,
-                "description": s.symptom_description,
-                "severity": s.severity.value if s.severity else None,
-                "duration": s.duration,
-                "notes": s.notes,
-                "recorded_at": s.recorded_at.isoformat() if s.recorded_at else None
-            } for s in symptoms
-        ],
-        "prescriptions": [
-            {
-                "prescription_id": p.prescription_id,
-                "medication_name": p.medication_name,
-                "dosage": p.dosage,
-                "frequency": p.frequency,
-                "duration": p.duration,
-                "instructions": p.instructions,
-                "prescribed_date": p.prescribed_date.isoformat() if p.prescribed_date else None
-            } for p in prescriptions
-        ],
-        "diagnoses": [
-            {
-                "diagnosis_id": d.diagnosis_id,
-                "code": d.diagnosis_code,
-                "description": d.diagnosis_description,
-                "type": d.diagnosis_type.value if d.diagnosis_type else None,
-                "confidence": d.confidence_level.value if d.confidence_level else None,
-                "notes": d.notes,
-                "diagnosed_at": d.diagnosed_at.isoformat() if d.diagnosed_at else None
-            } for d in diagnoses
-        ],
-        "treatment_plans": [
-            {
-                "plan_id": t.plan_id,
-                "description": t.treatment_description,
-                "start_date": t.start_date.isoformat() if t.start_date else None,
-                "end_date": t.end_date.isoformat() if t.end_date else None,
-                "status": t.status.value if t.status else None,
-                "follow_up_required": t.follow_up_required,
-                "follow_up_date": t.follow_up_date.isoformat() if t.follow_up_date else None,
-                "notes": t.notes
-            } for t in treatment_plans
-        ]
-    }
\ No newline at end of file
+    names = {}
+    if "patient_name" in selection.fields:
+        patient = db.query(models.Patient.name).filter(models.Patient.id == session.patient_id).first()
+        names["patient_name"] = patient.name if patient else "Unknown"
+    if "doctor_name" in selection.fields:
+        doctor = db.query(models.Doctor.name).filter(models.Doctor.id == session.doctor_id).first()
+        names["doctor_name"] = doctor.name if doctor else "Unknown"
+
+    # Get the related data that was asked for
+    sections = session_sections.load_sections(db, [session.session_id], selection, session_sections.SESSION_SECTIONS)
+
+    response = {name: SESSION_FIELDS[name](session, names) for name in selection.fields}
+    for section, entries in sections.items():
+        response[section] = entries[session.session_id]
+    return response
@@ -1,9 +1,50 @@
 from sqlalchemy.orm import Session
 from ..models import Patient, Appointment, Doctor
 from ..schemas import PatientResponse
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from datetime import datetime
 
+# Most patients one /api/patients request may ask for
+MAX_PATIENTS_PER_REQUEST = 200
+
+
+def parse_patient_id(value: str) -> int:
+    """Numeric patient id from 'P000123', 'P123' or '123'; raises ValueError otherwise"""
+    value = value.strip()
+    return int(value[1:] if value.startswith('P') else value)
+
+
+def patient_card(patient: Patient) -> Dict[str, Any]:
+    """Basic patient fields shown in sidebars and detail headers"""
+    return {
+        "id": patient.id,
+        "name": patient.name,
+        "age": patient.age,
+        "blood_group": patient.blood_group,
+        "email": patient.email,
+        "phone": patient.phone,
+        "medical_history": patient.medical_history or "No medical history recorded"
+    }
+
+
+def get_patients_by_ids(db: Session, ids: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    Look up many patients with one IN query. The result is keyed by the ids
+    as requested (either format); ids without a patient map to None.
+    """
+    numeric_ids = {patient_id: parse_patient_id(patient_id) for patient_id in ids}
+    patients = {}
+    if numeric_ids:
+        patients = {
+            patient.id: patient
+            for patient in db.query(Patient).filter(Patient.id.in_(set(numeric_ids.values()))).all()
+        }
+    return {
+        patient_id: patient_card(patients[numeric_id]) if numeric_id in patients else None
+        for patient_id, numeric_id in numeric_ids.items()
+    }
+
+
 def get_patient_detail(db: Session, patient_id: int) -> Optional[Dict[Any, Any]]:
     """
     Get comprehensive patient details including appointments, medical history, etc.
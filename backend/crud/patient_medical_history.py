@@ -1,6 +1,8 @@
+from fastapi import HTTPException
 from sqlalchemy.orm import Session
 from .. import models
-from typing import Optional, List
+from . import session_sections
+from typing import Optional, List, Dict
 from datetime import datetime
 
 def get_patient_by_name(db: Session, username: str) -> Optional[models.Patient]:
@@ -52,4 +54,90 @@ def format_medical_history_response(patient: models.Patient, appointments: List[
             }
             for appointment in appointments
         ]
-    }
\ No newline at end of file
+    }
+
+
+# Fields of each session in the complete-history and admin medical-history responses
+HISTORY_SESSION_FIELDS = {
+    "session_id": lambda session, doctor: session.session_id,
+    "session_date": lambda session, doctor: session.session_date.isoformat(),
+    "doctor_name": lambda session, doctor: doctor.name if doctor else "Unknown Doctor",
+    "doctor_department": lambda session, doctor: doctor.department if doctor else "Unknown",
+    "chief_complaint": lambda session, doctor: session.chief_complaint,
+    "session_notes": lambda session, doctor: session.session_notes,
+    "status": lambda session, doctor: session.status,
+}
+DOCTOR_FIELDS = ("doctor_name", "doctor_department")
+
+APPOINTMENT_FIELDS = ("appointment_id", "date_time", "doctor_name", "doctor_department", "status")
+
+
+def select_history_fields(fields: Optional[str] = None, include: Optional[str] = None,
+                          appointments: bool = False) -> session_sections.Selection:
+    """
+    Validated fields=/include= selection for session history. With
+    appointments=True the response also offers an "appointments" section.
+    """
+    sections = list(session_sections.HISTORY_SECTIONS) + (["appointments"] if appointments else [])
+    selection = session_sections.parse_selection(fields, include, HISTORY_SESSION_FIELDS, sections)
+    unknown = [name for name in selection.sections.get("appointments") or [] if name not in APPOINTMENT_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Unknown field appointments.{unknown[0]}; available: {', '.join(APPOINTMENT_FIELDS)}"
+        )
+    session_sections.validate_section_fields(selection, session_sections.HISTORY_SECTIONS)
+    return selection
+
+
+def format_session_history(db: Session, sessions: List[models.MedicalSession],
+                           selection: session_sections.Selection) -> List[Dict]:
+    """Sessions with the selected fields and sections; one query per selected section"""
+    doctors = {}
+    if any(name in selection.fields for name in DOCTOR_FIELDS):
+        doctor_ids = {session.doctor_id for session in sessions}
+        doctors = {
+            doctor.id: doctor
+            for doctor in db.query(models.Doctor.id, models.Doctor.name, models.Doctor.department)
+                            .filter(models.Doctor.id.in_(doctor_ids)).all()
+        } if doctor_ids else {}
+
+    sections = session_sections.load_sections(
+        db, [session.session_id for session in sessions], selection, session_sections.HISTORY_SECTIONS
+    )
+
+    history = []
+    for session in sessions:
+        doctor = doctors.get(session.doctor_id)
+        entry = {name: HISTORY_SESSION_FIELDS[name](session, doctor) for name in selection.fields}
+        for section, entries in sections.items():
+            entry[section] = entries[session.session_id]
+        history.append(entry)
+    return history
+
+
+def format_appointment_history(db: Session, patient_id: int, names: Optional[List[str]] = None) -> List[Dict]:
+    """A patient's appointments, newest first, with their doctors in the same query"""
+    names = [name for name in APPOINTMENT_FIELDS if names is None or name in names]
+    rows = db.query(
+        models.Appointment.id,
+        models.Appointment.appointment_time,
+        models.Appointment.status,
+        models.Doctor.id.label("doctor_id"),
+        models.Doctor.name.label("doctor_name"),
+        models.Doctor.department.label("doctor_department"),
+    ).outerjoin(models.Doctor, models.Doctor.id == models.Appointment.doctor_id)\
+     .filter(models.Appointment.patient_id == patient_id)\
+     .order_by(models.Appointment.appointment_time.desc())\
+     .all()
+    history = []
+    for row in rows:
+        entry = {
+            "appointment_id": row.id,
+            "date_time": row.appointment_time.isoformat(),
+            "doctor_name": row.doctor_name if row.doctor_id is not None else "Unknown Doctor",
+            "doctor_department": row.doctor_department if row.doctor_id is not None else "Unknown",
+            "status": row.status,
+        }
+        history.append({name: entry[name] for name in names})
+    return history
@@ -0,0 +1,244 @@
+"""
+Sparse fieldsets for medical session payloads.
+
+Session responses (complete history, admin medical history, a single
+session) nest child tables: vital signs, prescriptions, symptoms, diagnoses
+and treatment plans. Callers choose what they need with two query
+parameters:
+
+- include=prescriptions,symptoms - sections to assemble
+- fields=session_date,prescriptions.medication_name - fields to return;
+  a dotted name keeps only that field of a section's entries (and includes
+  the section)
+
+Without either parameter every field and section is returned, as before.
+For a single session the selection is applied while planning the queries: a
+section that isn't requested is never queried, requested sections are
+loaded with one query for all sessions, and only the columns the requested
+fields need are selected. Patient histories are cut from the stored
+timeline instead (patient_timeline.py).
+"""
+from collections import namedtuple
+from typing import Callable, Dict, Iterable, List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .. import models
+
+# A response field: the model columns it reads and how it is computed from a row
+Field = namedtuple("Field", ["columns", "value"])
+
+Selection = namedtuple("Selection", ["fields", "sections"])
+
+
+def column(name: str, convert: Callable = None) -> Field:
+    if convert is None:
+        return Field((name,), lambda row: getattr(row, name))
+    return Field((name,), lambda row: convert(getattr(row, name)))
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
+def _enum_value(value):
+    return value.value if value else None
+
+
+def _float(value):
+    return float(value) if value else None
+
+
+def _blood_pressure(row):
+    if row.blood_pressure_systolic and row.blood_pressure_diastolic:
+        return f"{row.blood_pressure_systolic}/{row.blood_pressure_diastolic}"
+    return None
+
+
+BLOOD_PRESSURE = Field(("blood_pressure_systolic", "blood_pressure_diastolic"), _blood_pressure)
+
+
+class SectionSpec:
+    """A child table of medical_sessions and the fields of its entries"""
+
+    def __init__(self, model, fields: Dict[str, Field]):
+        self.model = model
+        self.fields = fields
+        self.primary_key = model.__mapper__.primary_key[0]
+
+    def load(self, db: Session, session_ids: List[int], names: Iterable[str]) -> Dict[int, List[dict]]:
+        """Entries of these sessions with the given fields, by session id, in one query"""
+        names = [name for name in self.fields if name in set(names)]
+        wanted = {"session_id"}
+        for name in names:
+            wanted.update(self.fields[name].columns)
+        columns = [getattr(self.model, name) for name in sorted(wanted)]
+        rows = db.execute(
+            select(*columns)
+            .where(self.model.session_id.in_(session_ids))
+            .order_by(self.primary_key)
+        )
+        entries = {session_id: [] for session_id in session_ids}
+        for row in rows:
+            entries[row.session_id].append({name: self.fields[name].value(row) for name in names})
+        return entries
+
+
+# Shapes used by the patient history endpoints
+HISTORY_SECTIONS = {
+    "vital_signs": SectionSpec(models.VitalSign, {
+        "blood_pressure": BLOOD_PRESSURE,
+        "heart_rate": column("heart_rate"),
+        "temperature": column("temperature"),
+        "weight": column("weight"),
+        "height": column("height"),
+    }),
+    "prescriptions": SectionSpec(models.Prescription, {
+        "medication_name": column("medication_name"),
+        "dosage": column("dosage"),
+        "frequency": column("frequency"),
+        "duration": column("duration"),
+        "instructions": column("instructions"),
+    }),
+    "symptoms": SectionSpec(models.Symptom, {
+        "description": column("symptom_description"),
+        "severity": column("severity"),
+        "duration": column("duration"),
+        "notes": column("notes"),
+    }),
+}
+
+# Shapes used by GET /medical-sessions/{id}
+SESSION_SECTIONS = {
+    "vital_signs": SectionSpec(models.VitalSign, {
+        "vital_id": column("vital_id"),
+        "blood_pressure": BLOOD_PRESSURE,
+        "heart_rate": column("heart_rate"),
+        "temperature": column("temperature", _float),
+        "respiratory_rate": column("respiratory_rate"),
+        "oxygen_saturation": column("oxygen_saturation"),
+        "weight": column("weight", _float),
+        "height": column("height", _float),
+        "recorded_at": column("recorded_at", _isoformat),
+    }),
+    "symptoms": SectionSpec(models.Symptom, {
+        "symptom_id": column("symptom_id"),
+        "description": column("symptom_description"),
+        "severity": column("severity", _enum_value),
+        "duration": column("duration"),
+        "notes": column("notes"),
+        "recorded_at": column("recorded_at", _isoformat),
+    }),
+    "prescriptions": SectionSpec(models.Prescription, {
+        "prescription_id": column("prescription_id"),
+        "medication_name": column("medication_name"),
+        "dosage": column("dosage"),
+        "frequency": column("frequency"),
+        "duration": column("duration"),
+        "instructions": column("instructions"),
+        "prescribed_date": column("prescribed_date", _isoformat),
+    }),
+    "diagnoses": SectionSpec(models.Diagnosis, {
+        "diagnosis_id": column("diagnosis_id"),
+        "code": column("diagnosis_code"),
+        "description": column("diagnosis_description"),
+        "type": column("diagnosis_type", _enum_value),
+        "confidence": column("confidence_level", _enum_value),
+        "notes": column("notes"),
+        "diagnosed_at": column("diagnosed_at", _isoformat),
+    }),
+    "treatment_plans": SectionSpec(models.TreatmentPlan, {
+        "plan_id": column("plan_id"),
+        "description": column("treatment_description"),
+        "start_date": column("start_date", _isoformat),
+        "end_date": column("end_date", _isoformat),
+        "status": column("status", _enum_value),
+        "follow_up_required": column("follow_up_required"),
+        "follow_up_date": column("follow_up_date", _isoformat),
+        "notes": column("notes"),
+    }),
+}
+
+
+def _split(value: Optional[str]) -> Optional[List[str]]:
+    if value is None:
+        return None
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+def parse_selection(fields: Optional[str], include: Optional[str],
+                    field_names: Iterable[str], sections: Iterable[str]) -> Selection:
+    """
+    Validate fields=/include= against what a response offers. Returns the
+    top-level fields to return and {section: entry fields, or None for all}.
+    """
+    field_names, sections = list(field_names), list(sections)
+    requested_fields, requested_sections = _split(fields), _split(include)
+
+    unknown = [name for name in requested_sections or [] if name not in sections]
+    if unknown:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Unknown include {', '.join(unknown)}; available: {', '.join(sections)}"
+        )
+
+    if requested_fields is None:
+        selected_fields = field_names
+        selected = {name: None for name in (sections if requested_sections is None else requested_sections)}
+    else:
+        requested, selected = set(), {}
+        for name in requested_fields:
+            section, _, entry_field = name.partition('.')
+            if name in field_names:
+                requested.add(name)
+            elif section in sections and not entry_field:
+                selected[section] = None
+            elif section in sections:
+                if selected.get(section, []) is not None:
+                    selected.setdefault(section, []).append(entry_field)
+            else:
+                raise HTTPException(
+                    status_code=422,
+                    detail=f"Unknown field {name}; available: {', '.join(field_names + sections)}"
+                )
+        for name in requested_sections or []:
+            selected.setdefault(name, None)
+        # Keep the response's field order whatever order they were asked in
+        selected_fields = [name for name in field_names if name in requested]
+
+    return Selection(selected_fields, {name: selected[name] for name in sections if name in selected})
+
+
+def validate_section_fields(selection: Selection, specs: Dict[str, SectionSpec]):
+    """Check the entry fields asked for in the sections that specs describe"""
+    for section, names in selection.sections.items():
+        if section not in specs:
+            continue
+        unknown = [name for name in names or [] if name not in specs[section].fields]
+        if unknown:
+            raise HTTPException(
+                status_code=422,
+                detail=f"Unknown field {section}.{unknown[0]}; available: {', '.join(specs[section].fields)}"
+            )
+
+
+def select_sessions(fields: Optional[str], include: Optional[str],
+                    session_fields: Iterable[str], specs: Dict[str, SectionSpec]) -> Selection:
+    """parse_selection() for session payloads, including the fields of section entries"""
+    selection = parse_selection(fields, include, session_fields, specs)
+    validate_section_fields(selection, specs)
+    return selection
+
+
+def load_sections(db: Session, session_ids: List[int], selection: Selection,
+                  specs: Dict[str, SectionSpec]) -> Dict[str, Dict[int, List[dict]]]:
+    """{section: {session id: entries}} for the selected sections that specs describe"""
+    selected = {section: names for section, names in selection.sections.items() if section in specs}
+    if not session_ids:
+        return {section: {} for section in selected}
+    return {
+        section: specs[section].load(db, session_ids, names or specs[section].fields)
+        for section, names in selected.items()
+    }
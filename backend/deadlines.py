@@ -0,0 +1,204 @@
+"""
+End-to-end request deadlines.
+
+Every request gets a time budget when it arrives: REQUEST_DEADLINE_SECONDS,
+or the route's entry in ROUTE_DEADLINES / REQUEST_DEADLINES. The remaining
+budget follows the request into the work it does:
+
+- get_db refuses to start a request whose budget ran out while it waited
+  for a worker thread (503 with Retry-After), so a backlog drains instead
+  of every queued request being served too late
+- MySQL SELECTs carry a MAX_EXECUTION_TIME(<remaining ms>) optimizer hint,
+  so the server aborts a slow query instead of holding the connection;
+  any statement is refused once the budget is spent
+- S3 calls use a client whose connect/read timeouts fit the remaining
+  budget, with fewer retries
+
+A request that runs out of time part way answers 504. Both outcomes are
+counted in curanet_request_deadline_exceeded_total by route and stage.
+
+Deadlines only bound the work done before a response starts; streamed
+bodies (ZIP bundles, downloads) are not cut off.
+"""
+import os
+import re
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import event
+
+from . import metrics
+
+REQUEST_DEADLINE_SECONDS = float(os.getenv('REQUEST_DEADLINE_SECONDS', '30'))
+# Seconds clients are asked to wait before retrying a request shed by its deadline
+DEADLINE_RETRY_AFTER_SECONDS = int(os.getenv('DEADLINE_RETRY_AFTER_SECONDS', '2'))
+
+# Route template -> seconds; 0 disables the deadline. Overridden per route with
+# REQUEST_DEADLINES="/patient/{patient_id}/complete-history=5,/reports/upload=600"
+ROUTE_DEADLINES = {
+    "/patient/{patient_id}/complete-history": 10,
+    "/reports/upload": 300,
+    "/reports/uploads/{upload_id}/chunks/{chunk_number}": 300,
+    "/reports/uploads/{upload_id}/complete": 300,
+    "/metrics": 0,
+    "/health/ready": 0,
+}
+
+
+def _parse_overrides(value: str) -> dict:
+    overrides = {}
+    for item in value.split(','):
+        route, _, seconds = item.strip().rpartition('=')
+        if route and seconds:
+            try:
+                overrides[route.strip()] = float(seconds)
+            except ValueError:
+                print(f"⚠️  Ignoring REQUEST_DEADLINES entry {item!r}")
+    return overrides
+
+
+ROUTE_DEADLINES.update(_parse_overrides(os.getenv('REQUEST_DEADLINES', '')))
+
+deadline_exceeded = metrics.registry.counter(
+    "curanet_request_deadline_exceeded_total",
+    "Requests that ran out of their deadline, by route and where (queued, db, storage)",
+    ("route", "stage"),
+)
+
+
+class DeadlineExceeded(HTTPException):
+    """503 when the request never started, 504 when it ran out of time part way"""
+
+    def __init__(self, stage: str, started: bool):
+        if started:
+            super().__init__(status_code=504, detail=f"Request took too long ({stage})")
+        else:
+            super().__init__(
+                status_code=503,
+                detail="Server is busy, please retry",
+                headers={"Retry-After": str(DEADLINE_RETRY_AFTER_SECONDS)},
+            )
+        self.stage = stage
+
+
+class Deadline:
+    """Budget of one request; the route (and so the budget) is resolved once routing is done"""
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.started_at = time.monotonic()
+        self._expires_at = None
+        self.started = False
+
+    @property
+    def route(self) -> str:
+        return metrics.route_label(self.scope)
+
+    @property
+    def expires_at(self) -> Optional[float]:
+        if self._expires_at is None:
+            seconds = ROUTE_DEADLINES.get(f"{self.scope['method']} {self.route}",
+                                          ROUTE_DEADLINES.get(self.route, REQUEST_DEADLINE_SECONDS))
+            self._expires_at = self.started_at + seconds if seconds > 0 else float("inf")
+        return self._expires_at
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    def finish(self):
+        self._expires_at = float("inf")
+
+    def exceeded(self, stage: str) -> DeadlineExceeded:
+        deadline_exceeded.inc(route=self.route, stage=stage)
+        return DeadlineExceeded(stage, self.started)
+
+
+_current: ContextVar[Optional[Deadline]] = ContextVar("curanet_deadline", default=None)
+
+
+def current() -> Optional[Deadline]:
+    return _current.get()
+
+
+def remaining() -> Optional[float]:
+    """Seconds left for the current request; None outside a request or without a deadline"""
+    deadline = _current.get()
+    if deadline is None:
+        return None
+    left = deadline.remaining()
+    return None if left == float("inf") else left
+
+
+def check(stage: str):
+    """Raise DeadlineExceeded if the current request is out of time"""
+    deadline = _current.get()
+    if deadline is not None and deadline.remaining() <= 0:
+        raise deadline.exceeded(stage)
+
+
+def start_work():
+    """Called when a request gets a worker; sheds it with 503 if it waited past its deadline"""
+    check("queued")
+    deadline = _current.get()
+    if deadline is not None:
+        deadline.started = True
+
+
+class DeadlineMiddleware:
+    """Pure ASGI middleware starting each request's deadline clock on arrival"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        deadline = Deadline(scope)
+        token = _current.set(deadline)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                # The response is under way; don't cut off a streamed body
+                deadline.finish()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+
+
+_SELECT = re.compile(r"^(\s*SELECT)\b", re.IGNORECASE)
+# ER_QUERY_TIMEOUT: "maximum statement execution time exceeded"
+_MYSQL_QUERY_TIMEOUT = 3024
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    deadline = _current.get()
+    if deadline is None:
+        return statement, parameters
+    left = deadline.remaining()
+    if left == float("inf"):
+        return statement, parameters
+    if left <= 0:
+        raise deadline.exceeded("db")
+    if conn.dialect.name == "mysql" and _SELECT.match(statement):
+        statement = _SELECT.sub(rf"\1 /*+ MAX_EXECUTION_TIME({max(1, int(left * 1000))}) */", statement, count=1)
+    return statement, parameters
+
+
+def _handle_error(context):
+    deadline = _current.get()
+    original = context.original_exception
+    if deadline is not None and getattr(original, "args", None) and original.args[0] == _MYSQL_QUERY_TIMEOUT:
+        raise deadline.exceeded("db") from original
+
+
+def install(engine):
+    """Propagate request deadlines into an engine's statements (idempotent)"""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute, retval=True)
+        event.listen(engine, "handle_error", _handle_error)
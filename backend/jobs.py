@@ -0,0 +1,339 @@
+"""
+In-process background jobs backed by the jobs table.
+
+Work that shouldn't hold up a request is enqueued as a row (enqueue()) and
+picked up by a runner in every app worker:
+
+- a dispatcher thread claims due jobs with a conditional UPDATE (queued ->
+  running), so each job runs on exactly one worker even with many processes
+- handlers run on a thread pool (JOB_THREAD_WORKERS) suited to I/O; CPU-bound
+  steps are handed to a process pool (JOB_PROCESS_WORKERS) with run_cpu()
+- a failing job is retried with exponential backoff up to its max_attempts,
+  then marked failed; raising JobSkipped ends it without retries (e.g. an
+  optional dependency isn't installed)
+- jobs left running by a worker that died are requeued after JOB_LEASE_SECONDS
+
+Handlers are registered with @job("kind") and called as handler(db, payload).
+Set JOB_RUNNER_ENABLED=false to keep web workers from running jobs and start
+dedicated runners with `python -m backend.jobs`.
+"""
+import json
+import multiprocessing
+import os
+import random
+import socket
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+
+from sqlalchemy.orm import Session
+
+from . import metrics
+from . import models
+from .database import SessionLocal
+
+JOB_RUNNER_ENABLED = os.getenv('JOB_RUNNER_ENABLED', 'true').lower() in ('1', 'true', 'yes', 'on')
+JOB_THREAD_WORKERS = max(1, int(os.getenv('JOB_THREAD_WORKERS', '4')))
+JOB_PROCESS_WORKERS = max(1, int(os.getenv('JOB_PROCESS_WORKERS', '2')))
+JOB_POLL_INTERVAL_SECONDS = float(os.getenv('JOB_POLL_INTERVAL_SECONDS', '2'))
+JOB_RETRY_BASE_SECONDS = float(os.getenv('JOB_RETRY_BASE_SECONDS', '10'))
+JOB_RETRY_MAX_SECONDS = float(os.getenv('JOB_RETRY_MAX_SECONDS', '3600'))
+JOB_LEASE_SECONDS = float(os.getenv('JOB_LEASE_SECONDS', '900'))
+
+Status = models.JobStatus
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+job_runs = metrics.registry.counter(
+    "curanet_job_runs_total",
+    "Background job attempts by kind and outcome",
+    ("kind", "outcome"),
+)
+job_duration = metrics.registry.histogram(
+    "curanet_job_duration_seconds",
+    "Time spent running background jobs",
+    ("kind",),
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0),
+)
+
+
+class JobSkipped(Exception):
+    """Raised by a handler when the job can't or needn't run; it is not retried"""
+
+
+_handlers: Dict[str, Callable] = {}
+_max_attempts: Dict[str, int] = {}
+
+
+def job(kind: str, max_attempts: int = 5):
+    """Register handler(db, payload) -> result dict for jobs of this kind"""
+    def register(handler):
+        _handlers[kind] = handler
+        _max_attempts[kind] = max_attempts
+        return handler
+    return register
+
+
+def enqueue(db: Session, kind: str, payload: Optional[dict] = None, report_id: Optional[int] = None,
+            delay_seconds: float = 0, commit: bool = True) -> models.Job:
+    """Add a job to the queue; it runs once committed"""
+    if kind not in _handlers:
+        raise ValueError(f"Unknown job kind: {kind}")
+    queued = models.Job(
+        kind=kind,
+        payload=json.dumps(payload or {}),
+        report_id=report_id,
+        status=Status.queued,
+        attempts=0,
+        max_attempts=_max_attempts[kind],
+        run_after=datetime.utcnow() + timedelta(seconds=delay_seconds),
+    )
+    db.add(queued)
+    if commit:
+        db.commit()
+        _wake.set()
+    return queued
+
+
+def wake():
+    """Have this worker's dispatcher look for due jobs now, e.g. after enqueue(commit=False) and a commit"""
+    _wake.set()
+
+
+def describe(queued: models.Job) -> dict:
+    return {
+        "job_id": queued.job_id,
+        "kind": queued.kind,
+        "report_id": queued.report_id,
+        "status": queued.status.value,
+        "attempts": queued.attempts,
+        "max_attempts": queued.max_attempts,
+        "run_after": queued.run_after.isoformat() if queued.run_after else None,
+        "last_error": queued.last_error,
+        "result": json.loads(queued.result) if queued.result else None,
+        "created_at": queued.created_at.isoformat() if queued.created_at else None,
+        "updated_at": queued.updated_at.isoformat() if queued.updated_at else None,
+    }
+
+
+def retry(db: Session, job_id: int) -> Optional[models.Job]:
+    """Queue a failed or skipped job again with a fresh set of attempts"""
+    changed = db.query(models.Job).filter(
+        models.Job.job_id == job_id,
+        models.Job.status.in_([Status.failed, Status.skipped]),
+    ).update({
+        "status": Status.queued,
+        "attempts": 0,
+        "run_after": datetime.utcnow(),
+        "locked_by": None,
+        "updated_at": datetime.utcnow(),
+    }, synchronize_session=False)
+    db.commit()
+    if changed:
+        _wake.set()
+    return db.query(models.Job).filter(models.Job.job_id == job_id).first()
+
+
+# Process pool for CPU-bound steps; spawned rather than forked because the
+# parent runs threads (forking those can deadlock the child)
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+
+def run_cpu(fn, *args):
+    """Run a picklable top-level function in the job process pool and wait for its result"""
+    global _process_pool
+    if _process_pool is None:
+        with _process_pool_lock:
+            if _process_pool is None:
+                _process_pool = ProcessPoolExecutor(
+                    max_workers=JOB_PROCESS_WORKERS, mp_context=multiprocessing.get_context("spawn")
+                )
+    return _process_pool.submit(fn, *args).result()
+
+
+def _backoff_seconds(attempts: int) -> float:
+    delay = min(JOB_RETRY_MAX_SECONDS, JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def _finish(db: Session, job_id: int, values: dict):
+    values["updated_at"] = datetime.utcnow()
+    # Only the worker holding the job records its outcome
+    db.query(models.Job).filter(
+        models.Job.job_id == job_id,
+        models.Job.status == Status.running,
+        models.Job.locked_by == WORKER_ID,
+    ).update(values, synchronize_session=False)
+    db.commit()
+
+
+def run_job(job_id: int):
+    """Run a claimed job and record the outcome"""
+    db = SessionLocal()
+    started = time.perf_counter()
+    kind = "unknown"
+    try:
+        claimed = db.query(models.Job).filter(models.Job.job_id == job_id).first()
+        if claimed is None:
+            return
+        kind = claimed.kind
+        handler = _handlers.get(kind)
+        try:
+            if handler is None:
+                raise JobSkipped(f"No handler registered for {kind}")
+            result = handler(db, json.loads(claimed.payload or "{}"))
+        except JobSkipped as e:
+            db.rollback()
+            _finish(db, job_id, {"status": Status.skipped, "last_error": str(e)})
+            job_runs.inc(kind=kind, outcome="skipped")
+            return
+        except Exception as e:
+            db.rollback()
+            error = f"{type(e).__name__}: {e}"
+            if claimed.attempts >= claimed.max_attempts:
+                _finish(db, job_id, {"status": Status.failed, "last_error": error})
+                job_runs.inc(kind=kind, outcome="failed")
+                print(f"❌ Job {job_id} ({kind}) failed after {claimed.attempts} attempts: {error}")
+            else:
+                _finish(db, job_id, {
+                    "status": Status.queued,
+                    "last_error": error,
+                    "run_after": datetime.utcnow() + timedelta(seconds=_backoff_seconds(claimed.attempts)),
+                })
+                job_runs.inc(kind=kind, outcome="retry")
+                print(f"⚠️  Job {job_id} ({kind}) attempt {claimed.attempts} failed, will retry: {error}")
+            return
+        _finish(db, job_id, {
+            "status": Status.succeeded,
+            "last_error": None,
+            "result": json.dumps(result, default=str) if result is not None else None,
+        })
+        job_runs.inc(kind=kind, outcome="succeeded")
+    except Exception as e:
+        print(f"⚠️  Job {job_id} could not be recorded: {e}")
+    finally:
+        job_duration.observe(time.perf_counter() - started, kind=kind)
+        db.close()
+
+
+def _claim(db: Session, job_id: int) -> bool:
+    """queued -> running for this worker; False if another worker claimed it first"""
+    now = datetime.utcnow()
+    changed = db.query(models.Job).filter(
+        models.Job.job_id == job_id,
+        models.Job.status == Status.queued,
+    ).update({
+        "status": Status.running,
+        "locked_by": WORKER_ID,
+        "locked_at": now,
+        "attempts": models.Job.attempts + 1,
+        "updated_at": now,
+    }, synchronize_session=False)
+    db.commit()
+    return bool(changed)
+
+
+def requeue_stale(db: Session) -> int:
+    """Put back jobs whose worker stopped while running them"""
+    cutoff = datetime.utcnow() - timedelta(seconds=JOB_LEASE_SECONDS)
+    changed = db.query(models.Job).filter(
+        models.Job.status == Status.running,
+        models.Job.locked_at < cutoff,
+    ).update({
+        "status": Status.queued,
+        "run_after": datetime.utcnow(),
+        "last_error": "Worker stopped while running the job",
+        "updated_at": datetime.utcnow(),
+    }, synchronize_session=False)
+    db.commit()
+    return changed
+
+
+_wake = threading.Event()
+_runner_started = threading.Event()
+_runner_stop = threading.Event()
+_in_flight = 0
+_in_flight_lock = threading.Lock()
+
+
+def _job_done(_future):
+    global _in_flight
+    with _in_flight_lock:
+        _in_flight -= 1
+    _wake.set()
+
+
+def _dispatch(db: Session, executor: ThreadPoolExecutor) -> int:
+    """Claim as many due jobs as there are free threads"""
+    global _in_flight
+    with _in_flight_lock:
+        free = JOB_THREAD_WORKERS - _in_flight
+    if free <= 0:
+        return 0
+    due = [row.job_id for row in db.query(models.Job.job_id).filter(
+        models.Job.status == Status.queued,
+        models.Job.run_after <= datetime.utcnow(),
+    ).order_by(models.Job.run_after).limit(free * 2).all()]
+
+    started = 0
+    for job_id in due:
+        if started >= free:
+            break
+        if _claim(db, job_id):
+            with _in_flight_lock:
+                _in_flight += 1
+            executor.submit(run_job, job_id).add_done_callback(_job_done)
+            started += 1
+    return started
+
+
+def _run_dispatcher():
+    # Make sure the handlers are registered in this process
+    from . import report_processing  # noqa: F401
+    from . import resumable_uploads  # noqa: F401
+
+    executor = ThreadPoolExecutor(max_workers=JOB_THREAD_WORKERS, thread_name_prefix="curanet-job")
+    last_reap = 0.0
+    while not _runner_stop.is_set():
+        try:
+            db = SessionLocal()
+            try:
+                if time.monotonic() - last_reap > 60:
+                    last_reap = time.monotonic()
+                    requeued = requeue_stale(db)
+                    if requeued:
+                        print(f"⚠️  Requeued {requeued} job(s) left running by a stopped worker")
+                _dispatch(db, executor)
+            finally:
+                db.close()
+        except Exception as e:
+            print(f"⚠️  Job dispatcher error: {e}")
+        _wake.wait(JOB_POLL_INTERVAL_SECONDS)
+        _wake.clear()
+    executor.shutdown(wait=True)
+
+
+def start_runner(force: bool = False):
+    """Start the dispatcher thread (once per process) unless JOB_RUNNER_ENABLED is off"""
+    if _runner_started.is_set() or not (JOB_RUNNER_ENABLED or force):
+        return
+    _runner_started.set()
+    threading.Thread(target=_run_dispatcher, name="curanet-job-dispatcher", daemon=True).start()
+
+
+def main():
+    """Run only the job runner, e.g. on a dedicated worker host"""
+    start_runner(force=True)
+    print(f"✅ Job runner {WORKER_ID}: {JOB_THREAD_WORKERS} threads, {JOB_PROCESS_WORKERS} processes")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        _runner_stop.set()
+        _wake.set()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+"""
+Local-disk storage backend for sites without S3 (STORAGE_BACKEND=local).
+
+Objects live under LOCAL_STORAGE_DIR/objects/<aa>/<bb>/<sha256 of key>, next
+to a JSON sidecar holding the key, content type and content hash. Files are
+written into LOCAL_STORAGE_DIR/tmp, fsynced and renamed into place, so a
+crash never leaves a partial object behind a valid key.
+
+Downloads use expiring HMAC-signed URLs served by GET /storage/local/{key},
+which answers HTTP Range requests. With LOCAL_STORAGE_ACCEL_REDIRECT set, the
+response is handed to nginx (X-Accel-Redirect) so the file is sent with
+sendfile without passing through the app worker.
+"""
+import base64
+import hashlib
+import heapq
+import hmac
+import json
+import os
+import secrets
+import tempfile
+import time
+from datetime import datetime, timezone
+from urllib.parse import quote, urlencode
+
+from .storage import StorageBackend, content_key
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LOCAL_STORAGE_DIR = os.getenv('LOCAL_STORAGE_DIR', os.path.join(BASE_DIR, 'storage'))
+# Shared by all workers; defaults to a random secret kept in LOCAL_STORAGE_DIR
+LOCAL_STORAGE_URL_SECRET = os.getenv('LOCAL_STORAGE_URL_SECRET', '')
+# nginx internal location aliased to LOCAL_STORAGE_DIR, e.g. /protected-storage/
+LOCAL_STORAGE_ACCEL_REDIRECT = os.getenv('LOCAL_STORAGE_ACCEL_REDIRECT', '')
+DOWNLOAD_PATH = '/storage/local/'
+COPY_CHUNK_SIZE = 1024 * 1024
+# Keys sorted in memory at a time by iter_keys before spilling a run to disk
+KEY_SORT_RUN_SIZE = 100000
+
+
+def _fsync_directory(path):
+    # Persist the rename itself, not just the file contents
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _key_order(item):
+    # S3 lists keys by their UTF-8 bytes
+    return item[0].encode('utf-8')
+
+
+def _read_run(path):
+    with open(path, 'r') as run:
+        for line in run:
+            yield tuple(json.loads(line))
+
+
+class LocalDiskStorage(StorageBackend):
+    def __init__(self, root=None, download_path=DOWNLOAD_PATH):
+        self.root = os.path.abspath(root or LOCAL_STORAGE_DIR)
+        # Route serving this instance's signed URLs
+        self.download_path = download_path
+        self.objects_dir = os.path.join(self.root, 'objects')
+        self.tmp_dir = os.path.join(self.root, 'tmp')
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self._secret = self._load_secret()
+
+    def _load_secret(self):
+        if LOCAL_STORAGE_URL_SECRET:
+            return LOCAL_STORAGE_URL_SECRET.encode('utf-8')
+        path = os.path.join(self.root, '.url-secret')
+        if not os.path.exists(path):
+            fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+            with os.fdopen(fd, 'wb') as tmp:
+                tmp.write(secrets.token_bytes(32))
+            try:
+                # link() fails if another worker created it first; everyone then uses that one
+                os.link(tmp_path, path)
+            except FileExistsError:
+                pass
+            finally:
+                os.remove(tmp_path)
+        with open(path, 'rb') as secret:
+            return secret.read()
+
+    def object_path(self, file_key):
+        """Sharded location of an object: objects/<aa>/<bb>/<sha256 of key>"""
+        digest = hashlib.sha256(file_key.encode('utf-8')).hexdigest()
+        return os.path.join(self.objects_dir, digest[:2], digest[2:4], digest)
+
+    def _write_atomic(self, path, write):
+        """Write through a temp file, fsync and rename into place"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                write(tmp)
+                tmp.flush()
+                os.fsync(tmp.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        _fsync_directory(os.path.dirname(path))
+
+    def _read_meta(self, file_key):
+        try:
+            with open(self.object_path(file_key) + '.json', 'r') as meta:
+                return json.load(meta)
+        except FileNotFoundError:
+            return None
+
+    def store_object(self, file_obj, content_sha256, content_type, prefix='reports'):
+        file_key = content_key(content_sha256, prefix)
+        path = self.object_path(file_key)
+        if os.path.exists(path) and self._read_meta(file_key):
+            return file_key
+
+        def copy_verified(tmp):
+            digest = hashlib.sha256()
+            while True:
+                chunk = file_obj.read(COPY_CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                tmp.write(chunk)
+            if digest.hexdigest() != content_sha256:
+                raise Exception("Failed to store file: content does not match its SHA-256")
+
+        self._write_atomic(path, copy_verified)
+        # The sidecar goes last: an object only exists once its metadata does
+        meta = json.dumps({
+            'key': file_key,
+            'content_type': content_type,
+            'content_sha256': content_sha256,
+            'stored_at': datetime.utcnow().isoformat(),
+        }).encode('utf-8')
+        self._write_atomic(path + '.json', lambda tmp: tmp.write(meta))
+        return file_key
+
+    def head_object(self, file_key):
+        meta = self._read_meta(file_key)
+        if meta is None:
+            return None
+        try:
+            file_size = os.path.getsize(self.object_path(file_key))
+        except FileNotFoundError:
+            return None
+        checksum = meta.get('content_sha256')
+        return {
+            'file_size': file_size,
+            'content_type': meta.get('content_type'),
+            'checksum_sha256': base64.b64encode(bytes.fromhex(checksum)).decode('ascii') if checksum else None,
+        }
+
+    def iter_object(self, file_key, chunk_size=1024 * 1024):
+        try:
+            stored = open(self.object_path(file_key), 'rb')
+        except FileNotFoundError:
+            raise Exception(f"Object not found: {file_key}")
+        with stored:
+            while True:
+                chunk = stored.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def delete_file(self, file_key):
+        path = self.object_path(file_key)
+        for name in (path + '.json', path):
+            try:
+                os.remove(name)
+            except FileNotFoundError:
+                pass
+        return True
+
+    def copy_object(self, source_key, file_key, content_type=None):
+        meta = self._read_meta(source_key)
+        if meta is None:
+            raise Exception(f"Object not found: {source_key}")
+
+        def copy(tmp):
+            with open(self.object_path(source_key), 'rb') as source:
+                while True:
+                    chunk = source.read(COPY_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    tmp.write(chunk)
+
+        path = self.object_path(file_key)
+        self._write_atomic(path, copy)
+        meta = dict(meta, key=file_key, stored_at=datetime.utcnow().isoformat())
+        if content_type:
+            meta['content_type'] = content_type
+        encoded = json.dumps(meta).encode('utf-8')
+        self._write_atomic(path + '.json', lambda tmp: tmp.write(encoded))
+        return file_key
+
+    def _iter_sidecars(self):
+        for first in sorted(os.listdir(self.objects_dir)):
+            first_dir = os.path.join(self.objects_dir, first)
+            if not os.path.isdir(first_dir):
+                continue
+            for second in sorted(os.listdir(first_dir)):
+                with os.scandir(os.path.join(first_dir, second)) as entries:
+                    for entry in entries:
+                        if entry.name.endswith('.json'):
+                            yield entry.path
+
+    def _spill_run(self, run):
+        run.sort(key=_key_order)
+        fd, path = tempfile.mkstemp(dir=self.tmp_dir, suffix='.keys')
+        with os.fdopen(fd, 'w') as spill:
+            for item in run:
+                spill.write(json.dumps(item) + '\n')
+        return path
+
+    def iter_keys(self, prefix=''):
+        """
+        Objects are sharded by the hash of their key, so listing them in key
+        order needs a sort: runs of KEY_SORT_RUN_SIZE keys are sorted, spilled
+        to tmp/ and merged, keeping memory bounded for any number of objects.
+        """
+        runs, run = [], []
+        try:
+            for meta_path in self._iter_sidecars():
+                try:
+                    with open(meta_path, 'r') as meta_file:
+                        file_key = json.load(meta_file)['key']
+                    stat = os.stat(meta_path[:-len('.json')])
+                except (FileNotFoundError, ValueError, KeyError):
+                    continue
+                if file_key.startswith(prefix):
+                    run.append((file_key, stat.st_size, stat.st_mtime))
+                if len(run) >= KEY_SORT_RUN_SIZE:
+                    runs.append(self._spill_run(run))
+                    run = []
+
+            if runs:
+                if run:
+                    runs.append(self._spill_run(run))
+                    run = []
+                items = heapq.merge(*[_read_run(path) for path in runs], key=_key_order)
+            else:
+                run.sort(key=_key_order)
+                items = iter(run)
+            for file_key, size, mtime in items:
+                yield file_key, size, datetime.fromtimestamp(mtime, timezone.utc)
+        finally:
+            for path in runs:
+                os.remove(path)
+
+    def _signature(self, file_key, expires, file_name):
+        message = f"{file_key}\n{expires}\n{file_name}".encode('utf-8')
+        return hmac.new(self._secret, message, hashlib.sha256).hexdigest()
+
+    def generate_presigned_url(self, file_key, expiration=3600, file_name=None):
+        """Relative URL served by GET {download_path}{key}, valid for `expiration` seconds"""
+        expires = int(time.time()) + expiration
+        query = {'expires': expires}
+        if file_name:
+            query['name'] = file_name
+        query['signature'] = self._signature(file_key, expires, file_name or '')
+        return f"{self.download_path}{quote(file_key)}?{urlencode(query)}"
+
+    def verify_download(self, file_key, expires, file_name, signature):
+        if expires < time.time():
+            return False
+        return hmac.compare_digest(self._signature(file_key, expires, file_name or ''), signature)
+
+    def locate(self, file_key):
+        """(path, metadata) of a stored object for serving downloads, or None"""
+        meta = self._read_meta(file_key)
+        path = self.object_path(file_key)
+        if meta is None or not os.path.exists(path):
+            return None
+        return path, meta
@@ -1,17 +1,23 @@
-from fastapi import FastAPI, Depends, HTTPException, Security, UploadFile, File, Form, Request
+from fastapi import FastAPI, Depends, HTTPException, Security, UploadFile, File, Form, Request, Header
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse, PlainTextResponse, JSONResponse, Response, RedirectResponse
 from sqlalchemy.orm import Session
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from typing import Optional, List
+from contextlib import asynccontextmanager
 from datetime import datetime
 import os
 import json
+import hashlib
+import base64
+import uuid
 
 # Relative imports within backend package
 from . import schemas
-from .database import SessionLocal
+from .database import SessionLocal, on_engine_created
+from . import database
 from .crud import (
     patients,
     doctors,
@@ -33,12 +39,42 @@ from .crud import (
     doctor_patients,
     patient_detail,
     medical_sessions,
+    admin_exports,
+    medical_reports,
 )
 from .schemas import AdminAppointmentResponse, AppointmentCreate, AppointmentUpdate
-from .s3_service import S3Service
+from .storage import get_storage, content_key
+from .local_storage import LocalDiskStorage, LOCAL_STORAGE_ACCEL_REDIRECT
 from . import models
-
-app = FastAPI()
+from . import metrics
+from . import nplusone
+from . import readiness
+from . import deadlines
+from . import admission
+from . import coalescing
+from . import patient_summary_cache
+from . import patient_timeline
+from . import change_feed
+from . import read_replicas
+from . import resumable_uploads
+from . import report_bundles
+from . import cascade_cleanup
+from . import upload_spool
+from . import jobs
+from . import report_processing
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Connect to the database and build the S3 client off the startup path
+    readiness.start_warm_up()
+    resumable_uploads.start_garbage_collector()
+    upload_spool.start_drainer()
+    jobs.start_runner()
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Mount static files
 base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -50,6 +86,10 @@ app.mount("/pages", StaticFiles(directory=os.path.join(base_dir, "pages")), name
 def test_upload_page():
     return FileResponse(os.path.join(base_dir, "test_small_upload.html"))
 
+# Identical concurrent reads of the dashboard lists share one computation (see
+# backend/coalescing.py); innermost, so CORS and metrics still see every request
+app.add_middleware(coalescing.CoalescingMiddleware)
+
 # CORS middleware configuration
 app.add_middleware(
     CORSMiddleware,
@@ -59,14 +99,34 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-route latency / SQL instrumentation, exposed at /metrics
+on_engine_created(metrics.instrument_engine)
+on_engine_created(nplusone.install)
+app.add_middleware(metrics.MetricsMiddleware)
+
+# GET requests read from replicas when DB_REPLICA_HOSTS is set (see backend/read_replicas.py)
+app.add_middleware(read_replicas.StickyPrimaryMiddleware)
+
+# Concurrency limits with bounded queues for the expensive routes (see backend/admission.py)
+app.add_middleware(admission.AdmissionMiddleware)
+
+# Per-route time budgets carried into SQL and S3 calls (see backend/deadlines.py);
+# added last so the clock also runs while a request waits for admission
+on_engine_created(deadlines.install)
+app.add_middleware(deadlines.DeadlineMiddleware)
+
 # Security
 security = HTTPBearer()
 
 # Database dependency
-def get_db():
-    db = SessionLocal()
+def get_db(request: Request):
+    deadlines.start_work()
+    # Checks out a connection per read, not for the whole request (database.LazySession)
+    db = database.request_session()
+    read_replicas.route_reads(db, request)
     try:
         yield db
+        read_replicas.mark_written(db, request)
     finally:
         db.close()
 
@@ -90,6 +150,31 @@ def root():
 def api_root():
     return {"message": "CuraNet API is running"}
 
+@app.get("/health/live", include_in_schema=False)
+def liveness():
+    return {"status": "ok"}
+
+@app.get("/health/ready", include_in_schema=False)
+def readiness_endpoint():
+    status = readiness.report()
+    if not status["ready"]:
+        return JSONResponse(status_code=503, content=status)
+    return status
+
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint():
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+# N+1 query report (only when NPLUSONE_DETECTION is enabled)
+@app.get("/debug/n-plus-one", include_in_schema=False)
+def n_plus_one_report(reset: bool = False):
+    if not nplusone.NPLUSONE_ENABLED:
+        raise HTTPException(status_code=404, detail="N+1 detection is disabled")
+    report = nplusone.get_report()
+    if reset:
+        nplusone.reset()
+    return report
+
 @app.get("/test-upload")
 def test_upload_simple():
     """Test upload functionality with a simple file"""
@@ -98,7 +183,7 @@ def test_upload_simple():
         test_content = b"This is a test medical report file for testing upload functionality."
         
         # Test the upload process
-        file_key = s3_service.upload_file(
+        file_key = get_storage().upload_file(
             test_content, "test_report.txt", "text/plain", 1, 1
         )
         
@@ -123,7 +208,7 @@ def test_upload_simple():
             db.refresh(report)
             
             # Test download URL
-            download_url = s3_service.generate_presigned_url(file_key)
+            download_url = get_storage().generate_presigned_url(file_key)
             
             return {
                 "status": "success",
@@ -131,7 +216,7 @@ def test_upload_simple():
                 "report_id": report.report_id,
                 "file_key": file_key,
                 "download_url": download_url,
-                "s3_service_type": type(s3_service).__name__
+                "s3_service_type": type(get_storage()).__name__
             }
             
         finally:
@@ -141,7 +226,7 @@ def test_upload_simple():
         return {
             "status": "error",
             "message": str(e),
-            "s3_service_type": type(s3_service).__name__,
+            "s3_service_type": type(get_storage()).__name__,
             "error_type": type(e).__name__
         }
 
@@ -303,10 +388,25 @@ def update_doctor_endpoint(
 ):
     return admin_dashboard.edit_doctor(db, doctor_id, doctor_data)
 
-# Delete doctor
+def _cascade_removal_response(job: cascade_cleanup.CleanupJob, message: str):
+    """Answer when a background cascade removal finishes, or with 202 and a progress URL"""
+    entity, entity_id = job.entity, job.entity_id
+    if not job.done.wait(cascade_cleanup.CASCADE_SYNC_WAIT_SECONDS):
+        return JSONResponse(status_code=202, content={
+            "message": f"Removal of {entity} {entity_id} is in progress",
+            "cleanup_id": job.cleanup_id,
+            "progress_url": f"/admin/cleanup/{job.cleanup_id}",
+            "cleanup": job.to_dict(),
+        })
+    if job.status == "failed":
+        raise HTTPException(status_code=500, detail=f"Error removing {entity}: {job.error}")
+    return {"message": message, "cleanup": job.to_dict()}
+
+# Delete doctor with their appointments, sessions, reports and stored files
 @app.delete("/admin/doctor/{doctor_id}")
 def remove_doctor_endpoint(doctor_id: int, db: Session = Depends(get_db)):
-    return admin_dashboard.remove_doctor(db, doctor_id)
+    name, job = admin_dashboard.remove_doctor(db, doctor_id)
+    return _cascade_removal_response(job, f"Doctor {name} successfully removed")
 
 # Get doctor availability for a specific date
 @app.get("/doctor/availability/{doctor_id}")
@@ -406,18 +506,51 @@ def update_patient_endpoint(
         raise HTTPException(status_code=404, detail="Patient not found")
     return patient
 
-# Remove patient
+# Remove patient with their appointments, sessions, reports and stored files
 @app.delete("/admin/patient/{patient_id}")
 def remove_patient_endpoint(patient_id: int, db: Session = Depends(get_db)):
-    result = admin_patients.remove_patient(db, patient_id)
-    if "error" in result:
-        raise HTTPException(status_code=404, detail=result["error"])
-    return result
+    job = admin_patients.remove_patient(db, patient_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    return _cascade_removal_response(job, "Patient and associated records removed successfully")
+
+# Progress of a patient/doctor removal that answered 202
+@app.get("/admin/cleanup/{cleanup_id}")
+def get_cleanup_progress(cleanup_id: str):
+    job = cascade_cleanup.get_cleanup(cleanup_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Cleanup not found (finished over an hour ago or on another worker)")
+    return job.to_dict()
 
 @app.get("/admin/appointments-list", response_model=List[AdminAppointmentResponse])
 def get_all_appointments_endpoint(db: Session = Depends(get_db)):
     return admin_appointments.get_all_appointments(db)
 
+# Appointment, session, prescription and report changes after a cursor, for billing and analytics
+@app.get("/changes")
+def get_changes_endpoint(
+    since: int = 0,
+    limit: int = change_feed.CHANGES_PAGE_SIZE,
+    entity: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    return change_feed.get_changes(db, since, limit, entity)
+
+# Stream a full table export (NDJSON or CSV) through a server-side cursor
+@app.get("/admin/export/{entity}")
+def export_entity_endpoint(entity: str, format: str = "ndjson"):
+    if entity not in admin_exports.EXPORTS:
+        raise HTTPException(status_code=404, detail="Unknown export. Must be 'appointments', 'patients' or 'sessions'")
+    if format not in admin_exports.EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="Invalid format. Must be 'ndjson' or 'csv'")
+
+    filename = f"{entity}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{format}"
+    return StreamingResponse(
+        admin_exports.stream_export(SessionLocal, entity, format),
+        media_type=admin_exports.EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
 @app.get("/admin/appointment/{appointment_id}", response_model=AdminAppointmentResponse)
 def get_appointment_endpoint(appointment_id: int, db: Session = Depends(get_db)):
     appointment = admin_appointments.get_appointment_by_id(db, appointment_id)
@@ -452,152 +585,54 @@ def remove_appointment_endpoint(appointment_id: int, db: Session = Depends(get_d
 def get_available_doctors_endpoint(appointment_time: datetime, db: Session = Depends(get_db)):
     return admin_appointments.get_available_doctors(db, appointment_time)
 
-# Admin patient medical history access
+# Admin patient medical history access, from the patient's stored timeline
+# (patient_timeline.py); fields=/include= select what is returned
+# (see crud/session_sections.py), e.g. ?include=prescriptions&fields=session_date
 @app.get("/admin/patient/{patient_id}/medical-history")
-def get_admin_patient_medical_history(patient_id: int, db: Session = Depends(get_db)):
-    from . import models
+def get_admin_patient_medical_history(
+    patient_id: int,
+    fields: Optional[str] = None,
+    include: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    selection = patient_medical_history.select_history_fields(fields, include, appointments=True)
     
-    # Get patient info
-    patient = db.query(models.Patient).filter(models.Patient.id == patient_id).first()
-    if not patient:
+    # Patient info and all medical sessions in one lookup
+    timeline = patient_timeline.get_timeline(db, patient_id)
+    if timeline is None:
         raise HTTPException(status_code=404, detail="Patient not found")
+    version, document = timeline
     
-    # Get all medical sessions for this patient
-    sessions = db.query(models.MedicalSession).filter(
-        models.MedicalSession.patient_id == patient_id
-    ).order_by(models.MedicalSession.session_date.desc()).all()
-    
-    # Get all appointments for this patient
-    appointments = db.query(models.Appointment).filter(
-        models.Appointment.patient_id == patient_id
-    ).order_by(models.Appointment.appointment_time.desc()).all()
-    
-    session_history = []
-    for session in sessions:
-        doctor = db.query(models.Doctor).filter(models.Doctor.id == session.doctor_id).first()
-        
-        # Get detailed session data
-        vital_signs = db.query(models.VitalSign).filter(
-            models.VitalSign.session_id == session.session_id
-        ).all()
-        
-        prescriptions = db.query(models.Prescription).filter(
-            models.Prescription.session_id == session.session_id
-        ).all()
-        
-        symptoms = db.query(models.Symptom).filter(
-            models.Symptom.session_id == session.session_id
-        ).all()
-        
-        session_history.append({
-            "session_id": session.session_id,
-            "session_date": session.session_date.isoformat(),
-            "doctor_name": doctor.name if doctor else "Unknown Doctor",
-            "doctor_department": doctor.department if doctor else "Unknown",
-            "chief_complaint": session.chief_complaint,
-            "session_notes": session.session_notes,
-            "status": session.status,
-            "vital_signs": [{
-                "blood_pressure": f"{vs.blood_pressure_systolic}/{vs.blood_pressure_diastolic}" if vs.blood_pressure_systolic and vs.blood_pressure_diastolic else None,
-                "heart_rate": vs.heart_rate,
-                "temperature": vs.temperature,
-                "weight": vs.weight,
-                "height": vs.height
-            } for vs in vital_signs],
-            "prescriptions": [{
-                "medication_name": p.medication_name,
-                "dosage": p.dosage,
-                "frequency": p.frequency,
-                "duration": p.duration,
-                "instructions": p.instructions
-            } for p in prescriptions],
-            "symptoms": [{
-                "description": s.symptom_description,
-                "severity": s.severity,
-                "duration": s.duration,
-                "notes": s.notes
-            } for s in symptoms]
-        })
-    
-    appointment_history = []
-    for appointment in appointments:
-        doctor = db.query(models.Doctor).filter(models.Doctor.id == appointment.doctor_id).first()
-        appointment_history.append({
-            "appointment_id": appointment.id,
-            "date_time": appointment.appointment_time.isoformat(),
-            "doctor_name": doctor.name if doctor else "Unknown Doctor",
-            "doctor_department": doctor.department if doctor else "Unknown",
-            "status": appointment.status
-        })
+    session_history = patient_timeline.project_sessions(document, selection)
     
-    return {
-        "patient_info": {
-            "id": patient.id,
-            "name": patient.name,
-            "age": patient.age,
-            "blood_group": patient.blood_group,
-            "email": patient.email,
-            "phone": patient.phone,
-            "medical_history": patient.medical_history
-        },
-        "appointments": appointment_history,
-        "medical_sessions": session_history,
-        "total_appointments": len(appointment_history),
-        "total_sessions": len(session_history)
-    }
-
+    response = {"patient_info": document["patient_info"]}
+    appointment_history = None
+    if "appointments" in selection.sections:
+        # Get all appointments for this patient
+        appointment_history = patient_medical_history.format_appointment_history(
+            db, patient_id, selection.sections["appointments"]
+        )
+        response["appointments"] = appointment_history
+    response["medical_sessions"] = session_history
+    if appointment_history is not None:
+        response["total_appointments"] = len(appointment_history)
+    response["total_sessions"] = len(session_history)
+    # Everything above is JSON-ready; skip response validation and encoding
+    return JSONResponse(response)
+
+# Cached per patient until one of their appointments, sessions or prescriptions
+# changes (see patient_summary_cache.py)
 @app.get("/admin/patients/{patient_id}/summary")
 def get_admin_patient_summary(patient_id: int, db: Session = Depends(get_db)):
-    from . import models
-    from sqlalchemy import func
-    
-    patient = db.query(models.Patient).filter(models.Patient.id == patient_id).first()
-    if not patient:
+    def compute():
+        # Filled from the primary: a lagging replica would cache what an invalidation just dropped
+        db.info.pop("replica", None)
+        return admin_patients.get_patient_summary(db, patient_id)
+
+    summary = patient_summary_cache.get_or_compute(patient_id, compute)
+    if summary is None:
         raise HTTPException(status_code=404, detail="Patient not found")
-    
-    # Get statistics
-    total_appointments = db.query(func.count(models.Appointment.id)).filter(
-        models.Appointment.patient_id == patient_id
-    ).scalar()
-    
-    total_sessions = db.query(func.count(models.MedicalSession.session_id)).filter(
-        models.MedicalSession.patient_id == patient_id
-    ).scalar()
-    
-    # Get unique doctors who treated this patient
-    doctors = db.query(models.Doctor).join(models.Appointment).filter(
-        models.Appointment.patient_id == patient_id
-    ).distinct().all()
-    
-    # Get recent prescriptions
-    recent_prescriptions = db.query(models.Prescription).join(models.MedicalSession).filter(
-        models.MedicalSession.patient_id == patient_id
-    ).order_by(models.MedicalSession.session_date.desc()).limit(5).all()
-    
-    return {
-        "patient_info": {
-            "id": patient.id,
-            "name": patient.name,
-            "age": patient.age,
-            "blood_group": patient.blood_group,
-            "email": patient.email,
-            "phone": patient.phone
-        },
-        "statistics": {
-            "total_appointments": total_appointments,
-            "total_sessions": total_sessions,
-            "doctors_consulted": len(doctors)
-        },
-        "doctors": [{
-            "name": doctor.name,
-            "department": doctor.department
-        } for doctor in doctors],
-        "recent_prescriptions": [{
-            "medication_name": p.medication_name,
-            "dosage": p.dosage,
-            "frequency": p.frequency
-        } for p in recent_prescriptions]
-    }
+    return summary
 
 # Removed duplicate endpoints - keeping the ones below
 
@@ -615,25 +650,44 @@ def get_patient_detail(patient_id: str, db: Session = Depends(get_db)):
         if not patient:
             raise HTTPException(status_code=404, detail="Patient not found")
         
-        return {
-            "id": patient.id,
-            "name": patient.name,
-            "age": patient.age,
-            "blood_group": patient.blood_group,
-            "email": patient.email,
-            "phone": patient.phone,
-            "medical_history": patient.medical_history or "No medical history recorded"
-        }
+        return patient_detail.patient_card(patient)
     except ValueError:
         raise HTTPException(status_code=422, detail="Invalid patient ID format")
     except Exception as e:
         print(f"Patient detail error: {e}")
         raise HTTPException(status_code=500, detail=f"Error retrieving patient details: {str(e)}")
 
+# Many patients at once: /api/patients?ids=P000001,2,P000003 -> {"P000001": {...}, "2": {...}, "P000003": null}
+@app.get("/api/patients")
+def get_patients_by_ids(ids: str = "", db: Session = Depends(get_db)):
+    requested = list(dict.fromkeys(patient_id.strip() for patient_id in ids.split(',') if patient_id.strip()))
+    if len(requested) > patient_detail.MAX_PATIENTS_PER_REQUEST:
+        raise HTTPException(
+            status_code=422,
+            detail=f"At most {patient_detail.MAX_PATIENTS_PER_REQUEST} patient IDs per request"
+        )
+    try:
+        return patient_detail.get_patients_by_ids(db, requested)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Invalid patient ID format")
+
+def set_timeline_headers(response: Response, patient_id: int, version: int):
+    # Browsers revalidate on every load and get 304 while the timeline is unchanged
+    response.headers["ETag"] = patient_timeline.etag(patient_id, version)
+    response.headers["Cache-Control"] = "private, no-cache"
+
+def timeline_not_modified(patient_id: int, version: int) -> Response:
+    response = Response(status_code=304)
+    set_timeline_headers(response, patient_id, version)
+    return response
+
+# Served from the patient's stored timeline (patient_timeline.py); revalidate with If-None-Match
 @app.get("/patient/{patient_id}/medical-history")
-def get_patient_medical_history_by_id(patient_id: str, db: Session = Depends(get_db)):
-    from . import models
-    
+def get_patient_medical_history_by_id(
+    patient_id: str,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
     try:
         # Handle patient ID with 'P' prefix
         if patient_id.startswith('P'):
@@ -641,49 +695,33 @@ def get_patient_medical_history_by_id(patient_id: str, db: Session = Depends(get
         else:
             numeric_id = int(patient_id)
         
-        # Get all medical sessions for this patient (cross-doctor access)
-        sessions = db.query(models.MedicalSession).filter(
-            models.MedicalSession.patient_id == numeric_id
-        ).order_by(models.MedicalSession.session_date.desc()).all()
-        
-        history = []
-        for session in sessions:
-            doctor = db.query(models.Doctor).filter(models.Doctor.id == session.doctor_id).first()
-            
-            # Get prescriptions for this session
-            prescriptions = db.query(models.Prescription).filter(
-                models.Prescription.session_id == session.session_id
-            ).all()
-            
-            # Get diagnoses for this session (if diagnosis table exists)
-            diagnoses = []
-            try:
-                diagnoses = db.query(models.Diagnosis).filter(
-                    models.Diagnosis.session_id == session.session_id
-                ).all()
-            except:
-                pass  # Diagnosis table might not exist
-            
-            history.append({
-                "session_id": session.session_id,
-                "session_date": session.session_date.isoformat(),
-                "doctor_name": doctor.name if doctor else "Unknown Doctor",
-                "doctor_department": doctor.department if doctor else "Unknown",
-                "chief_complaint": session.chief_complaint or "Not recorded",
-                "session_notes": session.session_notes or "",
-                "status": session.status,
-                "prescriptions": [{
-                    "medication_name": p.medication_name,
-                    "dosage": p.dosage,
-                    "frequency": p.frequency,
-                    "duration": p.duration
-                } for p in prescriptions],
-                "diagnoses": [{
-                    "description": d.diagnosis_description
-                } for d in diagnoses]
-            })
+        # All medical sessions of this patient (cross-doctor access)
+        timeline = patient_timeline.get_timeline(db, numeric_id, if_none_match)
+        if timeline is None:
+            return []
+        version, document = timeline
+        if document is None:
+            return timeline_not_modified(numeric_id, version)
         
-        return history
+        # The document is JSON-ready; skip response validation and encoding
+        response = JSONResponse([{
+            "session_id": session["session_id"],
+            "session_date": session["session_date"],
+            "doctor_name": session["doctor_name"],
+            "doctor_department": session["doctor_department"],
+            "chief_complaint": session["chief_complaint"] or "Not recorded",
+            "session_notes": session["session_notes"] or "",
+            "status": session["status"],
+            "prescriptions": [{
+                "medication_name": p["medication_name"],
+                "dosage": p["dosage"],
+                "frequency": p["frequency"],
+                "duration": p["duration"]
+            } for p in session["prescriptions"]],
+            "diagnoses": session["diagnoses"]
+        } for session in document["medical_sessions"]])
+        set_timeline_headers(response, numeric_id, version)
+        return response
     except ValueError:
         raise HTTPException(status_code=422, detail="Invalid patient ID format")
     except Exception as e:
@@ -714,12 +752,19 @@ def start_medical_session(appointment_id: int, db: Session = Depends(get_db)):
     
     return {"session_id": session.session_id, "message": "Medical session started"}
 
+# fields=/include= select what is assembled, e.g. ?fields=patient_id or ?include=prescriptions
 @app.get("/medical-sessions/{session_id}")
-def get_medical_session(session_id: int, db: Session = Depends(get_db)):
+def get_medical_session(
+    session_id: int,
+    fields: Optional[str] = None,
+    include: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    selection = medical_sessions.select_session_fields(fields, include)
     session = medical_sessions.get_medical_session(db, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Medical session not found")
-    return medical_sessions.format_medical_session_response(session, db)
+    return medical_sessions.format_medical_session_response(session, db, selection)
 
 @app.put("/medical-sessions/{session_id}")
 def update_medical_session(
@@ -774,9 +819,18 @@ def get_doctor_active_sessions(doctor_id: int, db: Session = Depends(get_db)):
         for session in sessions
     ]
 
+# Served from the patient's stored timeline (patient_timeline.py); fields=/include=
+# select what is returned (see crud/session_sections.py),
+# e.g. ?include=prescriptions&fields=session_date,prescriptions.medication_name
 @app.get("/patient/{patient_id}/complete-history")
-def get_patient_complete_history(patient_id: str, db: Session = Depends(get_db)):
-    from . import models
+def get_patient_complete_history(
+    patient_id: str,
+    fields: Optional[str] = None,
+    include: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    selection = patient_medical_history.select_history_fields(fields, include)
     
     try:
         # Handle patient ID with 'P' prefix
@@ -785,102 +839,47 @@ def get_patient_complete_history(patient_id: str, db: Session = Depends(get_db))
         else:
             numeric_id = int(patient_id)
         
-        # Get patient basic info
-        patient = db.query(models.Patient).filter(models.Patient.id == numeric_id).first()
-        if not patient:
+        # Patient info and all medical sessions (from any doctor) in one lookup
+        timeline = patient_timeline.get_timeline(db, numeric_id, if_none_match)
+        if timeline is None:
             raise HTTPException(status_code=404, detail="Patient not found")
+        version, document = timeline
+        if document is None:
+            return timeline_not_modified(numeric_id, version)
         
-        # Get all medical sessions for this patient (from any doctor)
-        sessions = db.query(models.MedicalSession).filter(
-            models.MedicalSession.patient_id == numeric_id
-        ).order_by(models.MedicalSession.session_date.desc()).all()
-        
-        session_history = []
-        for session in sessions:
-            doctor = db.query(models.Doctor).filter(models.Doctor.id == session.doctor_id).first()
-            
-            # Get vital signs for this session
-            vital_signs = db.query(models.VitalSign).filter(
-                models.VitalSign.session_id == session.session_id
-            ).all()
-            
-            # Get prescriptions for this session
-            prescriptions = db.query(models.Prescription).filter(
-                models.Prescription.session_id == session.session_id
-            ).all()
-            
-            # Get symptoms for this session
-            symptoms = db.query(models.Symptom).filter(
-                models.Symptom.session_id == session.session_id
-            ).all()
-            
-            session_history.append({
-                "session_id": session.session_id,
-                "session_date": session.session_date.isoformat(),
-                "doctor_name": doctor.name if doctor else "Unknown Doctor",
-                "doctor_department": doctor.department if doctor else "Unknown",
-                "chief_complaint": session.chief_complaint,
-                "session_notes": session.session_notes,
-                "status": session.status,
-                "vital_signs": [{
-                    "blood_pressure": f"{vs.blood_pressure_systolic}/{vs.blood_pressure_diastolic}" if vs.blood_pressure_systolic and vs.blood_pressure_diastolic else None,
-                    "heart_rate": vs.heart_rate,
-                    "temperature": vs.temperature,
-                    "weight": vs.weight,
-                    "height": vs.height
-                } for vs in vital_signs],
-                "prescriptions": [{
-                    "medication_name": p.medication_name,
-                    "dosage": p.dosage,
-                    "frequency": p.frequency,
-                    "duration": p.duration,
-                    "instructions": p.instructions
-                } for p in prescriptions],
-                "symptoms": [{
-                    "description": s.symptom_description,
-                    "severity": s.severity,
-                    "duration": s.duration,
-                    "notes": s.notes
-                } for s in symptoms]
-            })
-        
-        return {
-            "patient_info": {
-                "id": patient.id,
-                "name": patient.name,
-                "age": patient.age,
-                "blood_group": patient.blood_group,
-                "email": patient.email,
-                "phone": patient.phone,
-                "medical_history": patient.medical_history
-            },
-            "medical_sessions": session_history
-        }
+        # The document is JSON-ready; skip response validation and encoding
+        response = JSONResponse({
+            "patient_info": document["patient_info"],
+            "medical_sessions": patient_timeline.project_sessions(document, selection)
+        })
+        set_timeline_headers(response, numeric_id, version)
+        return response
     except ValueError:
         raise HTTPException(status_code=422, detail="Invalid patient ID format")
+    except HTTPException:
+        # 404 for unknown patients, and deadline errors
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving complete history: {str(e)}")
 
-# File Sharing Endpoints - Mock S3 service for testing
-class MockS3Service:
-    def upload_file(self, file_content, filename, content_type, patient_id, doctor_id):
-        # Generate a mock file key
-        import uuid
-        return f"mock/patient_{patient_id}/doctor_{doctor_id}/{uuid.uuid4()}_{filename}"
-    
-    def generate_presigned_url(self, file_key, expiration=3600):
-        # Return a mock download URL
-        return f"https://mock-s3-url.com/download/{file_key}?expires={expiration}"
-    
-    def delete_file(self, file_key):
-        return True
-
-try:
-    s3_service = S3Service()
-    print("✅ S3 service initialized successfully")
-except Exception as e:
-    print(f"⚠️  S3 service failed, using mock service: {e}")
-    s3_service = MockS3Service()
+# File Sharing Endpoints
+MAX_UPLOAD_SIZE = 50 * 1024 * 1024  # 50MB
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+async def hash_upload(file: UploadFile):
+    """SHA-256 hex digest and size of an upload, read chunk by chunk; rewinds the file"""
+    digest = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > MAX_UPLOAD_SIZE:
+            raise HTTPException(status_code=413, detail="File too large. Maximum size is 50MB.")
+        digest.update(chunk)
+    await file.seek(0)
+    return digest.hexdigest(), size
 
 @app.post("/reports/upload")
 async def upload_report(
@@ -894,63 +893,204 @@ async def upload_report(
     try:
         print(f"Upload attempt: file={file.filename}, patient={patient_id}, doctor={doctor_id}")
         
-        # Validate file size (50MB limit)
-        file_content = await file.read()
-        print(f"File size: {len(file_content)} bytes")
-        
-        if len(file_content) > 50 * 1024 * 1024:  # 50MB
-            raise HTTPException(status_code=413, detail="File too large. Maximum size is 50MB.")
+        # Hash while reading; the 50MB limit is enforced without buffering the whole file
+        content_sha256, file_size = await hash_upload(file)
+        print(f"File size: {file_size} bytes, sha256: {content_sha256}")
         
-        # Upload to S3
-        print("Uploading to S3...")
-        file_key = s3_service.upload_file(
-            file_content, file.filename, file.content_type, patient_id, doctor_id
-        )
-        print(f"S3 upload successful: {file_key}")
+        # Identical content is stored once; duplicates reference the existing object
+        # Locked until the report is saved, so a concurrent delete can't remove the object first
+        file_key = await run_in_threadpool(medical_reports.find_stored_object, db, content_sha256, True)
+        deduplicated = file_key is not None
+        storage_status = upload_spool.STORED
+        if deduplicated:
+            print(f"Duplicate content, reusing {file_key}")
+        else:
+            print("Uploading to S3...")
+            # Falls back to the local spool when storage fails or its circuit is open
+            file_key, storage_status = await run_in_threadpool(
+                upload_spool.store_or_spool, file.file, content_sha256, file.content_type
+            )
+            if storage_status == upload_spool.PENDING_STORAGE:
+                print(f"Storage unavailable, spooled: {file_key}")
+            else:
+                print(f"S3 upload successful: {file_key}")
         
-        # Save to database using raw SQL to avoid model issues
         print("Saving to database...")
         try:
-            from sqlalchemy import text
-            result = db.execute(text("""
-                INSERT INTO medical_reports 
-                (patient_id, doctor_id, session_id, report_name, file_key, file_size, content_type, shared_with)
-                VALUES (:patient_id, :doctor_id, :session_id, :report_name, :file_key, :file_size, :content_type, :shared_with)
-            """), {
-                'patient_id': patient_id,
-                'doctor_id': doctor_id,
-                'session_id': session_id,
-                'report_name': file.filename,
-                'file_key': file_key,
-                'file_size': len(file_content),
-                'content_type': file.content_type,
-                'shared_with': '[]'
-            })
-            db.commit()
+            report_id = await run_in_threadpool(
+                medical_reports.create_report, db,
+                patient_id, doctor_id, session_id, file.filename, file_key,
+                file_size, file.content_type, content_sha256,
+                storage_status=storage_status
+            )
+            if not report_id:
+                raise RuntimeError("Insert returned no report_id")
             print("Database save successful")
             
+            # Thumbnails and text extraction happen in the background
+            job_ids = await run_in_threadpool(
+                report_processing.queue_processing, db, report_id, file.content_type
+            )
+            
             return {
-                "report_id": result.lastrowid or 1,
+                "report_id": report_id,
                 "message": "Report uploaded successfully",
-                "file_name": file.filename
+                "file_name": file.filename,
+                "deduplicated": deduplicated,
+                "storage_status": storage_status,
+                "jobs": job_ids
             }
             
         except Exception as db_error:
             print(f"Database error: {db_error}")
             db.rollback()
-            # Return success since S3 upload worked
-            return {
-                "report_id": 999,
-                "message": "Report uploaded to S3 (database pending)",
-                "file_name": file.filename
-            }
+            # Without a row nobody can reach the object; don't leave it behind
+            # (storage_reconcile catches any that a failed delete leaves)
+            if not deduplicated:
+                try:
+                    if await run_in_threadpool(medical_reports.count_references, db, file_key) == 0:
+                        if storage_status == upload_spool.PENDING_STORAGE:
+                            await run_in_threadpool(upload_spool.discard, file_key)
+                        else:
+                            await run_in_threadpool(get_storage().delete_file, file_key)
+                except Exception as cleanup_error:
+                    print(f"⚠️  Could not remove unreferenced object {file_key}: {cleanup_error}")
+            raise HTTPException(status_code=503, detail="Report could not be saved, please try again")
             
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Upload error: {type(e).__name__}: {str(e)}")
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
+# Direct-to-S3 uploads: the browser posts the file to S3 with a presigned policy,
+# then asks the API to verify the object and record the report
+DIRECT_UPLOAD_EXPIRATION = 900  # seconds
+DIRECT_UPLOAD_PREFIX = "uploads/direct/"
+
+@app.post("/reports/upload/initiate")
+def initiate_report_upload(upload: schemas.ReportUploadInitiate):
+    if upload.file_size > MAX_UPLOAD_SIZE:
+        raise HTTPException(status_code=413, detail="File too large. Maximum size is 50MB.")
+    
+    # Always uploaded, even when the content is stored already: knowing a file's
+    # hash must not be enough to get a report pointing at it. Each upload gets its
+    # own unguessable key; /complete moves it to the content-addressed key.
+    upload_key = DIRECT_UPLOAD_PREFIX + uuid.uuid4().hex
+    try:
+        presigned = get_storage().create_presigned_post(
+            upload.content_sha256, upload.content_type, upload.file_size, DIRECT_UPLOAD_EXPIRATION,
+            file_key=upload_key
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Upload initiation failed: {str(e)}")
+    
+    if presigned is None:
+        # Storage can't accept direct uploads (mock mode); use POST /reports/upload
+        return {"direct": False, "upload": None, "deduplicated": False}
+    return {
+        "direct": True,
+        "upload": presigned,
+        "deduplicated": False,
+        "expires_in": DIRECT_UPLOAD_EXPIRATION
+    }
+
+@app.post("/reports/upload/complete")
+def complete_report_upload(upload: schemas.ReportUploadComplete, db: Session = Depends(get_db)):
+    storage = get_storage()
+    stored = storage.head_object(upload.upload_key)
+    if stored is None:
+        # Never uploaded, expired, or already completed
+        raise HTTPException(status_code=409, detail="Uploaded file not found in storage")
+    
+    # S3 verified the checksum the policy pinned; both must match what is recorded
+    expected_checksum = base64.b64encode(bytes.fromhex(upload.content_sha256)).decode("ascii")
+    if stored["file_size"] != upload.file_size or stored["checksum_sha256"] != expected_checksum:
+        storage.delete_file(upload.upload_key)
+        raise HTTPException(status_code=422, detail="Uploaded file does not match the announced size or checksum")
+    
+    # Locked until the report is saved, so a concurrent delete can't remove the object first
+    file_key = medical_reports.find_stored_object(db, upload.content_sha256, lock=True)
+    deduplicated = file_key is not None
+    if not deduplicated:
+        file_key = storage.copy_object(upload.upload_key, content_key(upload.content_sha256), upload.content_type)
+    storage.delete_file(upload.upload_key)
+    
+    report_id = medical_reports.create_report(
+        db, upload.patient_id, upload.doctor_id, upload.session_id, upload.file_name,
+        file_key, upload.file_size, upload.content_type, upload.content_sha256,
+        shared_with=json.dumps(upload.shared_with)
+    )
+    return {
+        "report_id": report_id,
+        "message": "Report uploaded successfully",
+        "file_name": upload.file_name,
+        "deduplicated": deduplicated,
+        "jobs": report_processing.queue_processing(db, report_id, upload.content_type)
+    }
+
+# Resumable chunked uploads for large files (see backend/resumable_uploads.py)
+def _upload_error(e: resumable_uploads.UploadSessionError):
+    return HTTPException(status_code=e.status_code, detail=e.detail)
+
+@app.post("/reports/uploads")
+def create_resumable_upload(request: schemas.ResumableUploadCreate, db: Session = Depends(get_db)):
+    try:
+        upload = resumable_uploads.start_upload(db, request)
+    except resumable_uploads.UploadSessionError as e:
+        raise _upload_error(e)
+    return resumable_uploads.describe(upload)
+
+@app.get("/reports/uploads/{upload_id}")
+def get_resumable_upload(upload_id: str, db: Session = Depends(get_db)):
+    try:
+        return resumable_uploads.describe(resumable_uploads.get_upload(db, upload_id))
+    except resumable_uploads.UploadSessionError as e:
+        raise _upload_error(e)
+
+@app.put("/reports/uploads/{upload_id}/chunks/{chunk_number}")
+async def put_upload_chunk(
+    upload_id: str,
+    chunk_number: int,
+    offset: int,
+    request: Request,
+    chunk_sha256: str = Header(..., alias="X-Chunk-SHA256"),
+    db: Session = Depends(get_db)
+):
+    # Read at most one chunk plus a byte, so oversized bodies are refused early
+    data = bytearray()
+    async for piece in request.stream():
+        data.extend(piece)
+        if len(data) > resumable_uploads.RESUMABLE_MAX_CHUNK_BYTES:
+            raise HTTPException(status_code=413, detail="Chunk too large")
+    try:
+        upload = await run_in_threadpool(
+            resumable_uploads.write_chunk, db, upload_id, chunk_number, offset, bytes(data), chunk_sha256
+        )
+    except resumable_uploads.UploadSessionError as e:
+        raise _upload_error(e)
+    return resumable_uploads.describe(upload)
+
+@app.post("/reports/uploads/{upload_id}/complete")
+def complete_resumable_upload(upload_id: str, db: Session = Depends(get_db)):
+    try:
+        upload = resumable_uploads.finalize_upload(db, upload_id)
+    except resumable_uploads.UploadSessionError as e:
+        raise _upload_error(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+    return resumable_uploads.describe(upload)
+
+@app.delete("/reports/uploads/{upload_id}")
+def abort_resumable_upload(upload_id: str, db: Session = Depends(get_db)):
+    try:
+        upload = resumable_uploads.abort_upload(db, upload_id)
+    except resumable_uploads.UploadSessionError as e:
+        raise _upload_error(e)
+    return resumable_uploads.describe(upload)
+
 @app.get("/reports/patient/{patient_id}")
 def get_patient_reports(patient_id: int, doctor_id: int, db: Session = Depends(get_db)):
     try:
@@ -967,6 +1107,7 @@ def get_patient_reports(patient_id: int, doctor_id: int, db: Session = Depends(g
                 "report_name": report.report_name,
                 "uploaded_at": report.uploaded_at.isoformat(),
                 "file_size": report.file_size,
+                "storage_status": report.storage_status,
                 "uploaded_by": doctor.name if doctor else "Unknown Doctor"
             })
         
@@ -975,6 +1116,23 @@ def get_patient_reports(patient_id: int, doctor_id: int, db: Session = Depends(g
         print(f"Error getting patient reports: {e}")
         return []
 
+# All of a patient's reports as one ZIP, assembled while it is streamed
+@app.get("/reports/patient/{patient_id}/bundle.zip")
+def download_patient_report_bundle(patient_id: int, doctor_id: int, db: Session = Depends(get_db)):
+    patient = db.query(models.Patient.id, models.Patient.name).filter(models.Patient.id == patient_id).first()
+    if not patient:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    entries = report_bundles.list_bundle_entries(db, patient_id)
+    if not entries:
+        raise HTTPException(status_code=404, detail="No reports found for this patient")
+
+    filename = f"P{str(patient_id).zfill(6)}_reports_{datetime.now().strftime('%Y%m%d')}.zip"
+    return StreamingResponse(
+        report_bundles.stream_bundle(entries),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
 @app.get("/reports/{report_id}/download")
 def download_report(report_id: int, doctor_id: int, db: Session = Depends(get_db)):
     report = db.query(models.MedicalReport).filter(models.MedicalReport.report_id == report_id).first()
@@ -983,12 +1141,95 @@ def download_report(report_id: int, doctor_id: int, db: Session = Depends(get_db
     
     # All doctors can download patient reports (removed access restriction)
     try:
-        # Generate presigned URL
-        download_url = s3_service.generate_presigned_url(report.file_key)
+        # Generate presigned URL (served from the upload spool until the file reaches storage)
+        if report.storage_status == upload_spool.PENDING_STORAGE:
+            download_url = upload_spool.download_url(report.file_key, file_name=report.report_name)
+        else:
+            download_url = get_storage().generate_presigned_url(report.file_key, file_name=report.report_name)
         return {"download_url": download_url, "file_name": report.report_name}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Download failed: {str(e)}")
 
+@app.get("/reports/{report_id}/thumbnail")
+def get_report_thumbnail(report_id: int, doctor_id: int, db: Session = Depends(get_db)):
+    report = db.query(models.MedicalReport.thumbnail_key).filter(models.MedicalReport.report_id == report_id).first()
+    if not report:
+        raise HTTPException(status_code=404, detail="Report not found")
+    if not report.thumbnail_key:
+        # Not an image, not processed yet, or the thumbnail job was skipped
+        raise HTTPException(status_code=404, detail="No thumbnail for this report")
+    try:
+        return {"thumbnail_url": get_storage().generate_presigned_url(report.thumbnail_key)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Thumbnail failed: {str(e)}")
+
+# Background processing of reports (see backend/jobs.py)
+@app.get("/reports/{report_id}/jobs")
+def get_report_jobs(report_id: int, db: Session = Depends(get_db)):
+    queued = db.query(models.Job).filter(models.Job.report_id == report_id).order_by(models.Job.job_id).all()
+    return [jobs.describe(job) for job in queued]
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: int, db: Session = Depends(get_db)):
+    job = db.query(models.Job).filter(models.Job.job_id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return jobs.describe(job)
+
+@app.post("/jobs/{job_id}/retry")
+def retry_job(job_id: int, db: Session = Depends(get_db)):
+    job = jobs.retry(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status not in (models.JobStatus.queued, models.JobStatus.running):
+        raise HTTPException(status_code=409, detail=f"Job is {job.status.value}")
+    return jobs.describe(job)
+
+def _serve_local_object(storage: LocalDiskStorage, file_key: str, expires: int, signature: str,
+                        name: Optional[str], accel_redirect: str = ""):
+    if not storage.verify_download(file_key, expires, name, signature):
+        raise HTTPException(status_code=403, detail="Download link is invalid or has expired")
+    
+    located = storage.locate(file_key)
+    if not located:
+        return None
+    path, meta = located
+    
+    if accel_redirect:
+        # nginx sends the file itself (sendfile, Range support); the worker is free immediately
+        relative = os.path.relpath(path, storage.root).replace(os.sep, "/")
+        headers = {"X-Accel-Redirect": accel_redirect.rstrip("/") + "/" + relative}
+        if name:
+            safe_name = name.replace('"', '')
+            headers["Content-Disposition"] = f'attachment; filename="{safe_name}"'
+        return Response(headers=headers, media_type=meta.get("content_type"))
+    # FileResponse answers Range requests with 206 partial content
+    return FileResponse(path, media_type=meta.get("content_type"), filename=name)
+
+# Signed download URLs of the local-disk storage backend (STORAGE_BACKEND=local)
+@app.get("/storage/local/{file_key:path}", include_in_schema=False)
+def download_local_object(file_key: str, expires: int, signature: str, name: Optional[str] = None):
+    storage = get_storage()
+    if not isinstance(storage, LocalDiskStorage):
+        raise HTTPException(status_code=404, detail="Local storage is not enabled")
+    response = _serve_local_object(storage, file_key, expires, signature, name, LOCAL_STORAGE_ACCEL_REDIRECT)
+    if response is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    return response
+
+# Reports whose upload is still in the spool, waiting for storage
+@app.get("/storage/spool/{file_key:path}", include_in_schema=False)
+def download_spooled_object(file_key: str, expires: int, signature: str, name: Optional[str] = None):
+    response = _serve_local_object(upload_spool.get_spool(), file_key, expires, signature, name)
+    if response is None:
+        # Drained since the link was handed out: the object is in storage now
+        try:
+            url = get_storage().generate_presigned_url(file_key, file_name=name)
+        except Exception as e:
+            raise HTTPException(status_code=404, detail=f"File not found: {str(e)}")
+        return RedirectResponse(url, status_code=307)
+    return response
+
 @app.put("/reports/{report_id}/share")
 def share_report(
     report_id: int,
@@ -1009,3 +1250,34 @@ def share_report(
     
     return {"message": "Report sharing updated successfully"}
 
+@app.delete("/reports/{report_id}")
+def delete_report(report_id: int, doctor_id: int, db: Session = Depends(get_db)):
+    report = db.query(models.MedicalReport).filter(models.MedicalReport.report_id == report_id).first()
+    if not report:
+        raise HTTPException(status_code=404, detail="Report not found")
+    
+    # Only owner can delete
+    if report.doctor_id != doctor_id:
+        raise HTTPException(status_code=403, detail="Only report owner can delete")
+    
+    thumbnail_key = report.thumbnail_key
+    
+    # The object is shared by every report with the same content; remove it with the last one
+    def delete_object(file_key):
+        try:
+            upload_spool.discard(file_key)
+            return get_storage().delete_file(file_key)
+        except Exception as e:
+            # storage_reconcile removes it later
+            print(f"⚠️  Report {report_id} deleted but object {file_key} was not: {e}")
+            return False
+    
+    object_deleted = medical_reports.delete_report(db, report, delete_object)
+    if thumbnail_key and not medical_reports.referenced_keys(db, [thumbnail_key]):
+        try:
+            get_storage().delete_file(thumbnail_key)
+        except Exception as e:
+            print(f"⚠️  Report {report_id} deleted but thumbnail {thumbnail_key} was not: {e}")
+    
+    return {"message": "Report deleted successfully", "object_deleted": object_deleted}
+
@@ -0,0 +1,392 @@
+"""
+Lightweight request and database instrumentation.
+
+Records per-route latency histograms, status codes, in-flight requests and the
+number/time of SQL statements issued while serving each request, and renders
+everything in the Prometheus text exposition format for GET /metrics.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+
+# Latency buckets in seconds, shared by request and query histograms
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple([labels.get(name, "") for name in self.labelnames])
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self):
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        self._inc_key(self._key(labels), amount)
+
+    def _inc_key(self, key, amount):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def labels(self, **labels) -> "_BoundMetric":
+        """Pre-resolve a label set for hot paths"""
+        return _BoundMetric(self, self._key(labels))
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [bucket counts..., +Inf count, sum, count]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        self._observe_key(self._key(labels), value)
+
+    def labels(self, **labels) -> "_BoundMetric":
+        """Pre-resolve a label set for hot paths"""
+        return _BoundMetric(self, self._key(labels))
+
+    def _observe_key(self, key, value):
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 3)
+            # Index len(buckets) is the implicit +Inf bucket
+            state[bisect_left(self.buckets, value)] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def _samples(self):
+        with self._lock:
+            items = [(key, list(state)) for key, state in self._values.items()]
+        lines = []
+        for key, state in items:
+            cumulative = 0
+            for index, bound in enumerate(self.buckets):
+                cumulative += state[index]
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            inf_labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{inf_labels} {state[-1]}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{labels} {state[-1]}")
+        return lines
+
+
+class _BoundMetric:
+    __slots__ = ("_metric", "_key")
+
+    def __init__(self, metric, key):
+        self._metric = metric
+        self._key = key
+
+    def inc(self, amount: float = 1):
+        self._metric._inc_key(self._key, amount)
+
+    def observe(self, value: float):
+        self._metric._observe_key(self._key, value)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+http_requests_total = registry.counter(
+    "curanet_http_requests_total", "HTTP requests by route and status code",
+    ("method", "route", "status"),
+)
+http_request_duration = registry.histogram(
+    "curanet_http_request_duration_seconds", "HTTP request latency by route",
+    ("method", "route"),
+)
+http_requests_in_flight = registry.gauge(
+    "curanet_http_requests_in_flight", "HTTP requests currently being served",
+)
+db_queries_per_request = registry.histogram(
+    "curanet_db_queries_per_request", "SQL statements executed per HTTP request",
+    ("method", "route"), buckets=QUERY_COUNT_BUCKETS,
+)
+db_query_time_per_request = registry.histogram(
+    "curanet_db_query_seconds_per_request", "Total SQL time spent per HTTP request",
+    ("method", "route"),
+)
+db_queries_total = registry.counter(
+    "curanet_db_queries_total", "SQL statements executed, including outside requests",
+)
+db_query_seconds_total = registry.counter(
+    "curanet_db_query_seconds_total", "Time spent in SQL statements, including outside requests",
+)
+db_pool_in_use = registry.gauge(
+    "curanet_db_pool_connections_in_use", "Connections checked out of the pool", ("pool",),
+)
+db_pool_capacity = registry.gauge(
+    "curanet_db_pool_capacity", "Connections the pool can hand out (pool size + max overflow)", ("pool",),
+)
+db_connection_hold = registry.histogram(
+    "curanet_db_connection_hold_seconds", "Time a connection stays checked out per checkout", ("pool",),
+)
+
+
+class RequestContext:
+    """Per-request counters, shared with worker threads through a context variable"""
+    __slots__ = ("method", "path", "route", "db_queries", "db_seconds", "query_fingerprints")
+
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.route = None
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        # Populated only when the N+1 detector is enabled (see nplusone.py)
+        self.query_fingerprints = None
+
+
+_current_request: ContextVar[Optional[RequestContext]] = ContextVar("curanet_request", default=None)
+
+
+def current_request() -> Optional[RequestContext]:
+    """Return the instrumentation context of the request being served, if any"""
+    return _current_request.get()
+
+
+_finished_callbacks: List[Callable[[RequestContext, int, float], None]] = []
+
+
+def on_request_finished(callback: Callable[[RequestContext, int, float], None]):
+    """Register callback(request, status_code, elapsed) to run after each HTTP request"""
+    if callback not in _finished_callbacks:
+        _finished_callbacks.append(callback)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # A connection runs one statement at a time, so a single slot is enough
+    conn.info["curanet_query_start"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop("curanet_query_start", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    request = _current_request.get()
+    if request is not None:
+        # Folded into the global counters once, when the request finishes
+        request.db_queries += 1
+        request.db_seconds += elapsed
+    else:
+        db_queries_total.inc()
+        db_query_seconds_total.inc(elapsed)
+
+
+def pool_label(engine) -> str:
+    # host:port only; the URL carries the password
+    url = engine.url
+    if not url.host:
+        return url.database or url.drivername
+    return url.host if url.port is None else f"{url.host}:{url.port}"
+
+
+def _instrument_pool(engine):
+    label = pool_label(engine)
+    in_use = db_pool_in_use.labels(pool=label)
+    hold = db_connection_hold.labels(pool=label)
+    pool = engine.pool
+    if hasattr(pool, "size") and hasattr(pool, "_max_overflow"):
+        db_pool_capacity.set(pool.size() + max(0, pool._max_overflow), pool=label)
+
+    def on_checkout(dbapi_connection, record, proxy):
+        record.info["curanet_checked_out_at"] = time.perf_counter()
+        in_use.inc()
+
+    def on_checkin(dbapi_connection, record):
+        started = record.info.pop("curanet_checked_out_at", None)
+        if started is not None:
+            in_use.inc(-1)
+            hold.observe(time.perf_counter() - started)
+
+    event.listen(pool, "checkout", on_checkout)
+    event.listen(pool, "checkin", on_checkin)
+
+
+def instrument_engine(engine):
+    """Attach query counting/timing and pool occupancy listeners to a SQLAlchemy engine (idempotent)"""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+        _instrument_pool(engine)
+
+
+def route_label(scope) -> str:
+    """Use the matched route template as label so path parameters don't explode cardinality"""
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    return path if path else "unmatched"
+
+
+_in_flight = http_requests_in_flight.labels()
+_route_metrics: Dict[Tuple[str, str], tuple] = {}
+_status_counters: Dict[Tuple[str, str, int], _BoundMetric] = {}
+
+
+def _record_request(request: RequestContext, status_code: int, elapsed: float):
+    key = (request.method, request.route)
+    route_metrics = _route_metrics.get(key)
+    if route_metrics is None:
+        labels = {"method": request.method, "route": request.route}
+        route_metrics = _route_metrics.setdefault(key, (
+            http_request_duration.labels(**labels),
+            db_queries_per_request.labels(**labels),
+            db_query_time_per_request.labels(**labels),
+        ))
+    status_key = (request.method, request.route, status_code)
+    counter = _status_counters.get(status_key)
+    if counter is None:
+        counter = _status_counters.setdefault(status_key, http_requests_total.labels(
+            method=request.method, route=request.route, status=str(status_code)
+        ))
+
+    duration, queries, db_time = route_metrics
+    counter.inc()
+    duration.observe(elapsed)
+    queries.observe(request.db_queries)
+    db_time.observe(request.db_seconds)
+    if request.db_queries:
+        db_queries_total.inc(request.db_queries)
+        db_query_seconds_total.inc(request.db_seconds)
+    for callback in _finished_callbacks:
+        try:
+            callback(request, status_code, elapsed)
+        except Exception as e:
+            print(f"Request metrics callback failed: {e}")
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording latency, status and SQL usage per route"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request = RequestContext(scope["method"], scope["path"])
+        token = _current_request.set(request)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        _in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _in_flight.inc(-1)
+            _current_request.reset(token)
+            request.route = route_label(scope)
+            _record_request(request, status_code, elapsed)
@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Enum, Boolean, DECIMAL
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, BigInteger, String, Text, ForeignKey, DateTime, Enum, Boolean, DECIMAL, Index, LargeBinary
+from sqlalchemy.dialects.mysql import MEDIUMBLOB
+from sqlalchemy.orm import relationship, deferred
 from .database import Base
 from datetime import datetime
 import enum
@@ -220,12 +221,102 @@ class MedicalReport(Base):
     doctor_id = Column(Integer, ForeignKey("doctors.id"), nullable=False)
     session_id = Column(Integer, ForeignKey("medical_sessions.session_id"), nullable=True)
     report_name = Column(String(255), nullable=False)
-    file_key = Column(String(500), nullable=False)  # S3 object key
+    file_key = Column(String(500), nullable=False, index=True)  # S3 object key
     file_size = Column(Integer, nullable=False)
     content_type = Column(String(100), nullable=False)
+    content_sha256 = Column(String(64), index=True)  # Hex digest; identical uploads share one S3 object
+    # "stored", or "pending_storage" while the file waits in the upload spool (see upload_spool.py)
+    storage_status = Column(String(20), nullable=False, default="stored", server_default="stored", index=True)
+    # Filled in by background jobs after upload (see report_processing.py)
+    thumbnail_key = Column(String(500))
+    extracted_text = deferred(Column(Text))  # Not loaded with the report unless asked for
     uploaded_at = Column(DateTime, default=datetime.utcnow)
     shared_with = Column(Text)  # JSON array of doctor IDs who can access
     
     patient = relationship("Patient")
     doctor = relationship("Doctor")
-    session = relationship("MedicalSession")
\ No newline at end of file
+    session = relationship("MedicalSession")
+
+class UploadSessionStatus(enum.Enum):
+    active = "active"
+    finalizing = "finalizing"
+    completed = "completed"
+    aborted = "aborted"
+    expired = "expired"
+
+class UploadSession(Base):
+    """Resumable chunked upload in progress (see backend/resumable_uploads.py)"""
+    __tablename__ = "upload_sessions"
+    upload_id = Column(String(36), primary_key=True)  # UUID handed to the client
+    patient_id = Column(Integer, ForeignKey("patients.id"), nullable=False)
+    doctor_id = Column(Integer, ForeignKey("doctors.id"), nullable=False)
+    session_id = Column(Integer, ForeignKey("medical_sessions.session_id"), nullable=True)
+    file_name = Column(String(255), nullable=False)
+    content_type = Column(String(100), nullable=False)
+    file_size = Column(Integer, nullable=False)
+    chunk_size = Column(Integer, nullable=False)
+    content_sha256 = Column(String(64))  # Optional digest announced by the client, verified on finalize
+    received_bytes = Column(Integer, nullable=False, default=0)  # Current offset
+    staging = Column(String(20), nullable=False)  # "s3" (multipart upload) or "spool" (local file)
+    staging_key = Column(String(500), nullable=False)  # S3 key or spool file path
+    multipart_upload_id = Column(String(255))
+    parts = Column(Text, nullable=False, default="[]")  # JSON list of received chunks
+    status = Column(Enum(UploadSessionStatus), nullable=False, default=UploadSessionStatus.active, index=True)
+    report_id = Column(Integer, ForeignKey("medical_reports.report_id"), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+class JobStatus(enum.Enum):
+    queued = "queued"
+    running = "running"
+    succeeded = "succeeded"
+    failed = "failed"
+    skipped = "skipped"
+
+class Job(Base):
+    """Background job run by backend/jobs.py"""
+    __tablename__ = "jobs"
+    job_id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(50), nullable=False)
+    payload = Column(Text, nullable=False, default="{}")  # JSON arguments
+    # Report the job works on; no foreign key so removing a report never waits on its jobs
+    report_id = Column(Integer, index=True)
+    status = Column(Enum(JobStatus), nullable=False, default=JobStatus.queued)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    run_after = Column(DateTime, nullable=False, default=datetime.utcnow)  # Not picked up before this
+    locked_by = Column(String(100))  # host:pid of the worker running it
+    locked_at = Column(DateTime)
+    last_error = Column(Text)
+    result = Column(Text)  # JSON
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (Index("ix_jobs_status_run_after", "status", "run_after"),)
+
+class PatientTimeline(Base):
+    """Materialized medical history of a patient, maintained by backend/patient_timeline.py"""
+    __tablename__ = "patient_timelines"
+    # No foreign key: the row goes with its patient in the same transaction
+    patient_id = Column(Integer, primary_key=True, autoincrement=False)
+    version = Column(Integer, nullable=False, default=0)  # Bumped by every change; the ETag
+    format = Column(Integer, nullable=False, default=0)  # Document layout it was built with
+    document = Column(LargeBinary().with_variant(MEDIUMBLOB(), "mysql"))  # zlib-compressed JSON; NULL until built
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class ChangeEvent(Base):
+    """Outbox row of the change feed served at /changes, written by backend/change_feed.py"""
+    __tablename__ = "change_events"
+    # Taken from change_sequences in commit order, so a consumer reading seq > cursor never skips a row
+    seq = Column(BigInteger, primary_key=True, autoincrement=False)
+    entity = Column(String(30), nullable=False)  # appointment, medical_session, prescription, medical_report
+    entity_id = Column(Integer, index=True)  # NULL for a bulk insert that didn't give the id
+    operation = Column(String(10), nullable=False)  # insert, update, delete
+    data = Column(Text)  # JSON of the row's columns after the change; NULL for deletes
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class ChangeSequence(Base):
+    """Named counters; the change feed's row is locked by each committing writer until it commits"""
+    __tablename__ = "change_sequences"
+    name = Column(String(30), primary_key=True)
+    value = Column(BigInteger, nullable=False, default=0)
@@ -0,0 +1,160 @@
+"""
+N+1 query detector for development and staging.
+
+When NPLUSONE_DETECTION is enabled, every SQL statement executed while serving
+a request is normalized into a fingerprint (literals and IN-lists stripped).
+Fingerprints repeated at least NPLUSONE_THRESHOLD times within one request are
+reported with the endpoint and the application code that issued them, both in
+the log and through GET /debug/n-plus-one.
+"""
+import hashlib
+import os
+import re
+import sys
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Dict, List
+
+from sqlalchemy import event
+
+from . import metrics
+
+NPLUSONE_ENABLED = os.getenv("NPLUSONE_DETECTION", "false").lower() in ("1", "true", "yes")
+NPLUSONE_THRESHOLD = int(os.getenv("NPLUSONE_THRESHOLD", "5"))
+# Distinct call sites remembered per fingerprint, and findings kept for the report
+MAX_LOCATIONS = 3
+MAX_FINDINGS = 200
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+_IGNORED_FILES = {os.path.abspath(__file__), os.path.abspath(metrics.__file__)}
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN\s*\((?:\s*\?\s*,?)+\)", re.IGNORECASE)
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|:\w+|\?")
+_WHITESPACE = re.compile(r"\s+")
+
+_lock = threading.Lock()
+_findings = deque(maxlen=MAX_FINDINGS)
+_totals: Dict[tuple, dict] = {}
+
+nplusone_findings_total = metrics.registry.counter(
+    "curanet_nplusone_findings_total", "Requests that repeated one query fingerprint above the threshold",
+    ("route",),
+)
+
+
+def normalize_statement(statement: str) -> str:
+    """Strip literals and parameter styles so the same query shape maps to one string"""
+    normalized = _STRING_LITERAL.sub("?", statement)
+    normalized = _NUMBER_LITERAL.sub("?", normalized)
+    normalized = _PLACEHOLDER.sub("?", normalized)
+    normalized = _IN_LIST.sub("IN (...)", normalized)
+    return _WHITESPACE.sub(" ", normalized).strip()
+
+
+def _digest(normalized: str) -> str:
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:12]
+
+
+def _application_location() -> str:
+    """Innermost stack frame that belongs to the backend package (not SQLAlchemy or this module)"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if filename.startswith(BACKEND_DIR) and filename not in _IGNORED_FILES:
+            relative = os.path.relpath(filename, os.path.dirname(BACKEND_DIR))
+            return f"{relative}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return "unknown"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    request = metrics.current_request()
+    if request is None:
+        return
+    if request.query_fingerprints is None:
+        request.query_fingerprints = {}
+
+    key = normalize_statement(statement)
+    entry = request.query_fingerprints.get(key)
+    if entry is None:
+        entry = request.query_fingerprints[key] = {"count": 0, "locations": []}
+    entry["count"] += 1
+    if len(entry["locations"]) < MAX_LOCATIONS:
+        location = _application_location()
+        if location not in entry["locations"]:
+            entry["locations"].append(location)
+
+
+def _check_request(request: metrics.RequestContext, status_code: int, elapsed: float):
+    if not request.query_fingerprints:
+        return
+
+    endpoint = f"{request.method} {request.route}"
+    for statement, entry in request.query_fingerprints.items():
+        if entry["count"] < NPLUSONE_THRESHOLD:
+            continue
+
+        digest = _digest(statement)
+        finding = {
+            "endpoint": endpoint,
+            "path": request.path,
+            "fingerprint": digest,
+            "statement": statement,
+            "count": entry["count"],
+            "locations": entry["locations"],
+            "detected_at": datetime.utcnow().isoformat(),
+        }
+        with _lock:
+            _findings.append(finding)
+            total = _totals.setdefault((endpoint, digest), {
+                "endpoint": endpoint,
+                "fingerprint": digest,
+                "statement": statement,
+                "requests": 0,
+                "max_count": 0,
+                "locations": entry["locations"],
+            })
+            total["requests"] += 1
+            total["max_count"] = max(total["max_count"], entry["count"])
+        nplusone_findings_total.inc(route=request.route)
+        print(
+            f"⚠️  N+1 query: {endpoint} ran {entry['count']}x [{digest}] {statement[:120]} "
+            f"at {', '.join(entry['locations'])}"
+        )
+
+
+def get_report() -> dict:
+    """Aggregated findings per endpoint/fingerprint plus the most recent individual findings"""
+    with _lock:
+        totals: List[dict] = sorted(
+            (dict(total) for total in _totals.values()),
+            key=lambda total: (total["requests"], total["max_count"]),
+            reverse=True,
+        )
+        recent = list(_findings)
+    return {
+        "enabled": NPLUSONE_ENABLED,
+        "threshold": NPLUSONE_THRESHOLD,
+        "offenders": totals,
+        "recent": recent[::-1],
+    }
+
+
+def reset():
+    with _lock:
+        _findings.clear()
+        _totals.clear()
+
+
+def install(engine):
+    """Hook the detector into an engine when NPLUSONE_DETECTION is enabled"""
+    if not NPLUSONE_ENABLED:
+        return False
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        metrics.on_request_finished(_check_request)
+        print(f"🔎 N+1 query detection enabled (threshold {NPLUSONE_THRESHOLD})")
+    return True
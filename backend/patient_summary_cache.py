@@ -0,0 +1,181 @@
+"""
+Per-patient cache of the admin patient summary.
+
+GET /admin/patients/{id}/summary is built from the patient, their
+appointments, medical sessions and prescriptions, and the doctors they saw.
+The result is kept in process memory per patient until something it is
+built from changes: committing a session that inserted, updated or deleted
+a patient, appointment, medical session or prescription drops the entries
+of the patients involved, and changing a doctor drops those of the patients
+with an appointment with them. Bulk INSERT/UPDATE/DELETE statements on those tables
+(dataset generation, cascade cleanup) don't say which patients they touch
+and drop every entry.
+
+A summary computed while a write to its patient was being committed is not
+stored, so a fill racing an invalidation can't put the old data back. For
+the same reason summaries are computed on the primary: a replica may not
+have the write that invalidated the entry yet.
+Writes made outside this process (another worker, a script, SQL by hand)
+aren't seen; PATIENT_SUMMARY_CACHE_SECONDS bounds how long a summary can
+lag behind them. PATIENT_SUMMARY_CACHE_SIZE caps the number of patients
+kept, least recently used first out.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from itertools import chain
+from typing import Callable, Iterable, Optional
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+
+from . import metrics
+from . import models
+
+PATIENT_SUMMARY_CACHE_ENABLED = os.getenv('PATIENT_SUMMARY_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes', 'on')
+PATIENT_SUMMARY_CACHE_SECONDS = float(os.getenv('PATIENT_SUMMARY_CACHE_SECONDS', '300'))
+PATIENT_SUMMARY_CACHE_SIZE = int(os.getenv('PATIENT_SUMMARY_CACHE_SIZE', '10000'))
+
+# Tables a summary is built from
+SUMMARY_MODELS = (models.Patient, models.Appointment, models.MedicalSession, models.Prescription, models.Doctor)
+
+summary_lookups = metrics.registry.counter(
+    "curanet_patient_summary_cache_total",
+    "Admin patient summary lookups served from the cache (hit) or computed (miss)",
+    ("result",),
+)
+summary_invalidations = metrics.registry.counter(
+    "curanet_patient_summary_invalidations_total",
+    "Cached patient summaries dropped after a commit, per patient or all at once",
+    ("scope",),
+)
+
+
+class SummaryCache:
+    """LRU map of patient id -> summary with expiry and per-patient write generations"""
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        # Bumped by each invalidation; a fill stores its result only if they didn't move
+        self._generations = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+    def get(self, patient_id: int) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(patient_id)
+            if entry is None:
+                return None
+            expires_at, summary = entry
+            if expires_at <= time.monotonic():
+                del self._entries[patient_id]
+                return None
+            self._entries.move_to_end(patient_id)
+            return summary
+
+    def token(self, patient_id: int):
+        """Taken before computing a summary and handed back to put()"""
+        with self._lock:
+            return self._epoch, self._generations.get(patient_id, 0)
+
+    def put(self, patient_id: int, token, summary: dict) -> bool:
+        with self._lock:
+            if token != (self._epoch, self._generations.get(patient_id, 0)):
+                return False
+            self._entries[patient_id] = (time.monotonic() + self.ttl, summary)
+            self._entries.move_to_end(patient_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return True
+
+    def invalidate(self, patient_ids: Iterable[int]):
+        with self._lock:
+            for patient_id in patient_ids:
+                self._entries.pop(patient_id, None)
+                self._generations[patient_id] = self._generations.get(patient_id, 0) + 1
+            if len(self._generations) > 2 * self.max_entries:
+                # A new epoch voids every outstanding token, so the generations can start over
+                self._generations.clear()
+                self._epoch += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generations.clear()
+            self._epoch += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+
+cache = SummaryCache(PATIENT_SUMMARY_CACHE_SECONDS, PATIENT_SUMMARY_CACHE_SIZE)
+
+
+def get_or_compute(patient_id: int, compute: Callable[[], Optional[dict]]) -> Optional[dict]:
+    """The cached summary of a patient, or compute() it and cache it; None is not cached"""
+    if not PATIENT_SUMMARY_CACHE_ENABLED:
+        return compute()
+    summary = cache.get(patient_id)
+    if summary is not None:
+        summary_lookups.inc(result="hit")
+        return summary
+    summary_lookups.inc(result="miss")
+    token = cache.token(patient_id)
+    summary = compute()
+    if summary is not None:
+        cache.put(patient_id, token, summary)
+    return summary
+
+
+def _values(obj, attribute: str):
+    """Current and, for an updated row, previous values of an attribute"""
+    history = inspect(obj).attrs[attribute].history
+    return {value for value in chain(history.added, history.unchanged, history.deleted) if value is not None}
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_patients(session, flush_context):
+    patients = session.info.setdefault("summary_patients", set())
+    session_ids, doctor_ids = set(), set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, models.Patient):
+            patients.update(_values(obj, "id"))
+        elif isinstance(obj, (models.Appointment, models.MedicalSession)):
+            patients.update(_values(obj, "patient_id"))
+        elif isinstance(obj, models.Prescription):
+            session_ids.update(_values(obj, "session_id"))
+        elif isinstance(obj, models.Doctor) and obj not in session.new:
+            # A new doctor has no appointments yet
+            doctor_ids.update(_values(obj, "id"))
+    if session_ids:
+        patients.update(session.connection().execute(
+            select(models.MedicalSession.patient_id).where(models.MedicalSession.session_id.in_(session_ids))
+        ).scalars())
+    if doctor_ids:
+        patients.update(session.connection().execute(
+            select(models.Appointment.patient_id).where(models.Appointment.doctor_id.in_(doctor_ids)).distinct()
+        ).scalars())
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _collect_bulk_writes(state):
+    if not (state.is_insert or state.is_update or state.is_delete):
+        return
+    mapper = state.bind_mapper
+    if mapper is not None and issubclass(mapper.class_, SUMMARY_MODELS):
+        state.session.info["summary_patients_all"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session):
+    # Ids collected in a transaction that was rolled back only cost an extra miss here
+    patients = session.info.pop("summary_patients", None)
+    if session.info.pop("summary_patients_all", False):
+        cache.clear()
+        summary_invalidations.inc(scope="all")
+    elif patients:
+        cache.invalidate(patients)
+        summary_invalidations.inc(len(patients), scope="patient")
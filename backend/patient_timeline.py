@@ -0,0 +1,362 @@
+"""
+Materialized per-patient timeline.
+
+The history endpoints (complete history, admin medical history, the
+patient detail page's session list) used to assemble a patient's sessions
+from five tables on every request. Each patient's full history is now kept
+as one zlib-compressed JSON document in patient_timelines, so serving it is
+a single primary-key lookup; fields=/include= selections are cut from the
+document.
+
+The document is maintained in the transaction that changes the data it is
+built from. Session events collect the sessions touched by a flush (medical
+sessions, vital signs, prescriptions, symptoms, diagnoses, and the sessions
+of a doctor whose name or department changed) and, just before commit,
+rebuild only those sessions and splice them into their patients' documents;
+a changed patient gets new patient_info. Bulk UPDATE/DELETE statements on
+those tables (cascade cleanup) have the patients they touch selected before
+they run, and bulk INSERTs take them from their parameters; those patients'
+documents are dropped and rebuilt when next read (a removed patient's row is
+deleted). Only a bulk INSERT whose rows don't name their patient or session
+drops every document.
+
+Documents are built on first read. Writers and builders lock the patient's
+row (creating it if needed) before reading, so a document never misses a
+change committed while it was being built. Every change bumps the row's
+version, which the endpoints send as ETag: a client revalidating with
+If-None-Match gets 304 without the document being decoded. A document built
+with an older TIMELINE_FORMAT is rebuilt when read.
+
+Writes made with raw SQL outside the ORM aren't seen; after such a change
+delete the affected rows (or all of them) and they are rebuilt on demand.
+"""
+import json
+import zlib
+from itertools import chain
+from typing import Iterable, List, Optional, Set, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import delete, event, inspect, select, update
+from sqlalchemy.orm import Session
+
+from . import metrics
+from . import models
+from .crud import patient_medical_history, session_sections
+
+# Bump when the document layout changes; older documents are rebuilt when read
+TIMELINE_FORMAT = 1
+COMPRESSION_LEVEL = 6
+
+# Child tables whose rows appear in the document, by session
+SECTION_MODELS = (models.VitalSign, models.Prescription, models.Symptom, models.Diagnosis)
+TIMELINE_MODELS = (models.Patient, models.Doctor, models.MedicalSession) + SECTION_MODELS
+
+PATIENT_INFO_FIELDS = ("id", "name", "age", "blood_group", "email", "phone", "medical_history")
+
+# Every field and section of the history responses, plus the diagnoses the session list shows
+FULL_SELECTION = session_sections.Selection(
+    list(patient_medical_history.HISTORY_SESSION_FIELDS),
+    {name: None for name in session_sections.HISTORY_SECTIONS},
+)
+DIAGNOSES = session_sections.SectionSpec(models.Diagnosis, {
+    "description": session_sections.column("diagnosis_description"),
+})
+
+timeline_reads = metrics.registry.counter(
+    "curanet_patient_timeline_reads_total",
+    "Patient timeline reads: served from the stored document (hit), built first (built) or revalidated (not_modified)",
+    ("result",),
+)
+timeline_updates = metrics.registry.counter(
+    "curanet_patient_timeline_updates_total",
+    "Changes applied to stored patient timelines in writing transactions",
+    ("kind",),
+)
+
+
+def encode(document: dict) -> bytes:
+    return zlib.compress(json.dumps(document, separators=(",", ":"), ensure_ascii=False).encode("utf-8"),
+                         COMPRESSION_LEVEL)
+
+
+def decode(data: bytes) -> dict:
+    return json.loads(zlib.decompress(data))
+
+
+def etag(patient_id: int, version: int) -> str:
+    return f'W/"timeline-{patient_id}-{version}"'
+
+
+def _patient_info(db: Session, patient_id: int) -> Optional[dict]:
+    row = db.query(*(getattr(models.Patient, name) for name in PATIENT_INFO_FIELDS))\
+            .filter(models.Patient.id == patient_id).first()
+    return dict(row._mapping) if row else None
+
+
+def _sessions(db: Session, patient_id: int, session_ids: Optional[Iterable[int]] = None) -> List[dict]:
+    """Document entries of a patient's sessions (all, or just these), newest first"""
+    query = db.query(models.MedicalSession).filter(models.MedicalSession.patient_id == patient_id)
+    if session_ids is not None:
+        query = query.filter(models.MedicalSession.session_id.in_(session_ids))
+    sessions = query.order_by(models.MedicalSession.session_date.desc(),
+                              models.MedicalSession.session_id.desc()).all()
+    entries = patient_medical_history.format_session_history(db, sessions, FULL_SELECTION)
+    diagnoses = DIAGNOSES.load(db, [session.session_id for session in sessions], ["description"]) if sessions else {}
+    for entry in entries:
+        entry["diagnoses"] = diagnoses[entry["session_id"]]
+    return entries
+
+
+def _newest_first(entries: List[dict]) -> List[dict]:
+    return sorted(entries, key=lambda entry: (entry["session_date"], entry["session_id"]), reverse=True)
+
+
+def _lock(db: Session, patient_id: int):
+    """Create the patient's row if missing and hold its lock until the transaction ends; returns it"""
+    table = models.PatientTimeline.__table__
+    values = {"patient_id": patient_id, "version": 0, "format": TIMELINE_FORMAT}
+    if db.get_bind().dialect.name == "mysql":
+        from sqlalchemy.dialects.mysql import insert
+        statement = insert(table).values(**values).on_duplicate_key_update(version=table.c.version)
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+        statement = insert(table).values(**values).on_conflict_do_nothing()
+    db.execute(statement)
+    return db.execute(
+        select(table.c.version, table.c.format, table.c.document)
+        .where(table.c.patient_id == patient_id)
+        .with_for_update()
+    ).first()
+
+
+def _store(db: Session, patient_id: int, version: int, document: Optional[dict]):
+    """Write a JSON-ready document (or None: not built) and its new version"""
+    table = models.PatientTimeline.__table__
+    db.execute(update(table).where(table.c.patient_id == patient_id).values(
+        version=version,
+        format=TIMELINE_FORMAT,
+        document=encode(document) if document is not None else None,
+    ))
+
+
+def build(patient_id: int) -> Optional[Tuple[int, dict]]:
+    """Build and store a patient's document on the primary; (version, document), None if no such patient"""
+    from .database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        # Unknown ids are answered from a plain read, without an upsert and a row lock
+        exists = db.query(models.Patient.id).filter(models.Patient.id == patient_id).first() is not None
+        # Ends the read's snapshot: the build below must see everything committed before the lock
+        db.rollback()
+        if not exists:
+            return None
+        row = _lock(db, patient_id)
+        if row.document is not None and row.format == TIMELINE_FORMAT:
+            # Built by another request while this one waited for the lock
+            db.rollback()
+            return row.version, decode(row.document)
+        patient_info = _patient_info(db, patient_id)
+        if patient_info is None:
+            db.rollback()
+            return None
+        document = jsonable_encoder({"patient_info": patient_info, "medical_sessions": _sessions(db, patient_id)})
+        _store(db, patient_id, row.version + 1, document)
+        db.commit()
+        return row.version + 1, document
+    finally:
+        db.close()
+
+
+def get_timeline(db: Session, patient_id: int, if_none_match: Optional[str] = None) -> Optional[Tuple[int, Optional[dict]]]:
+    """
+    (version, document) of a patient, None if there is no such patient. When
+    if_none_match (the request header) names the current version the
+    document isn't decoded: (version, None).
+    """
+    table = models.PatientTimeline.__table__
+    row = db.execute(
+        select(table.c.version, table.c.format, table.c.document).where(table.c.patient_id == patient_id)
+    ).first()
+    if row is None or row.document is None or row.format != TIMELINE_FORMAT:
+        timeline_reads.inc(result="built")
+        return build(patient_id)
+    if if_none_match and etag(patient_id, row.version) in (tag.strip() for tag in if_none_match.split(",")):
+        timeline_reads.inc(result="not_modified")
+        return row.version, None
+    timeline_reads.inc(result="hit")
+    return row.version, decode(row.document)
+
+
+def project_sessions(document: dict, selection: session_sections.Selection) -> List[dict]:
+    """The document's sessions with the fields and sections of a fields=/include= selection"""
+    sections = [
+        (section, [name for name in spec.fields if names is None or name in names])
+        for section, spec in session_sections.HISTORY_SECTIONS.items()
+        if section in selection.sections
+        for names in [selection.sections[section]]
+    ]
+    history = []
+    for session in document["medical_sessions"]:
+        entry = {name: session[name] for name in selection.fields}
+        for section, names in sections:
+            entry[section] = [{name: item[name] for name in names} for item in session[section]]
+        history.append(entry)
+    return history
+
+
+def apply_changes(db: Session, patients: Set[int], session_ids: Set[int]):
+    """Bring the documents of these patients up to date with the given sessions, in db's transaction"""
+    for patient_id in sorted(patients):
+        row = _lock(db, patient_id)
+        patient_info = _patient_info(db, patient_id)
+        if patient_info is None:
+            db.execute(delete(models.PatientTimeline).where(models.PatientTimeline.patient_id == patient_id))
+            timeline_updates.inc(kind="removed")
+            continue
+        if row.document is None or row.format != TIMELINE_FORMAT:
+            # Nothing built yet (or outdated): only move the version so a concurrent build is redone
+            _store(db, patient_id, row.version + 1, None)
+            timeline_updates.inc(kind="invalidated")
+            continue
+        document = decode(row.document)
+        document["patient_info"] = jsonable_encoder(patient_info)
+        fresh = jsonable_encoder(_sessions(db, patient_id, session_ids)) if session_ids else []
+        kept = [entry for entry in document["medical_sessions"] if entry["session_id"] not in session_ids]
+        document["medical_sessions"] = _newest_first(kept + fresh)
+        _store(db, patient_id, row.version + 1, document)
+        timeline_updates.inc(kind="patched")
+
+
+def invalidate(db: Session, patients: Set[int]):
+    """Drop the documents of these patients in db's transaction; they are rebuilt when read"""
+    for patient_id in sorted(patients):
+        # Locked like a writer, so a build racing this transaction waits for it
+        row = _lock(db, patient_id)
+        if db.query(models.Patient.id).filter(models.Patient.id == patient_id).first() is None:
+            db.execute(delete(models.PatientTimeline).where(models.PatientTimeline.patient_id == patient_id))
+            timeline_updates.inc(kind="removed")
+        else:
+            _store(db, patient_id, row.version + 1, None)
+            timeline_updates.inc(kind="invalidated")
+
+
+def _values(obj, attribute: str) -> Set:
+    """Current and, for an updated row, previous values of an attribute"""
+    history = inspect(obj).attrs[attribute].history
+    return {value for value in chain(history.added, history.unchanged, history.deleted) if value is not None}
+
+
+def _changed(session, obj, attributes: Iterable[str]) -> bool:
+    """Whether a flushed object was deleted or changed one of these attributes"""
+    if obj in session.deleted:
+        return True
+    state = inspect(obj)
+    return any(state.attrs[name].history.has_changes() for name in attributes)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changes(session, flush_context):
+    patients, session_ids, doctor_ids = set(), set(), set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, models.MedicalSession):
+            patients.update(_values(obj, "patient_id"))
+            session_ids.update(_values(obj, "session_id"))
+        elif isinstance(obj, SECTION_MODELS):
+            session_ids.update(_values(obj, "session_id"))
+        elif isinstance(obj, models.Patient):
+            if obj not in session.new and _changed(session, obj, PATIENT_INFO_FIELDS):
+                patients.update(_values(obj, "id"))
+        elif isinstance(obj, models.Doctor):
+            if obj not in session.new and _changed(session, obj, ("name", "department")):
+                doctor_ids.update(_values(obj, "id"))
+    if session_ids or doctor_ids:
+        sessions = models.MedicalSession
+        condition = sessions.session_id.in_(session_ids) if session_ids else None
+        if doctor_ids:
+            by_doctor = sessions.doctor_id.in_(doctor_ids)
+            condition = by_doctor if condition is None else condition | by_doctor
+        for patient_id, session_id in session.connection().execute(
+            select(sessions.patient_id, sessions.session_id).where(condition)
+        ):
+            patients.add(patient_id)
+            session_ids.add(session_id)
+    if patients:
+        session.info.setdefault("timeline_patients", set()).update(patients)
+        session.info.setdefault("timeline_sessions", set()).update(session_ids)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _collect_bulk_writes(state):
+    if not (state.is_insert or state.is_update or state.is_delete):
+        return
+    mapper = state.bind_mapper
+    if mapper is None or not issubclass(mapper.class_, TIMELINE_MODELS):
+        return
+    patients = _bulk_patients(state, mapper.class_)
+    if patients is None:
+        state.session.info["timeline_all"] = True
+    elif patients:
+        state.session.info.setdefault("timeline_invalidated", set()).update(patients)
+
+
+def _bulk_patients(state, model) -> Optional[Set[int]]:
+    """Patients whose documents a bulk statement changes, read before it runs; None if it can't tell"""
+    sessions = models.MedicalSession
+    connection = state.session.connection()
+    if state.is_insert:
+        if model in (models.Patient, models.Doctor):
+            # Nothing in a document refers to a new patient or doctor yet
+            return set()
+        parameters = state.parameters
+        rows = parameters if isinstance(parameters, list) else [parameters] if parameters else []
+        column = "patient_id" if model is sessions else "session_id"
+        values = {row.get(column) for row in rows}
+        if not rows or None in values:
+            return None
+        if model is sessions:
+            return values
+        return set(connection.execute(select(sessions.patient_id).where(sessions.session_id.in_(values))).scalars())
+
+    where = state.statement.whereclause
+
+    def touched(column):
+        return select(column) if where is None else select(column).where(where)
+
+    if model is models.Patient:
+        query = touched(models.Patient.id)
+    elif model is sessions:
+        query = touched(sessions.patient_id)
+    elif model is models.Doctor:
+        query = select(sessions.patient_id).where(sessions.doctor_id.in_(touched(models.Doctor.id)))
+    else:
+        query = select(sessions.patient_id).where(sessions.session_id.in_(touched(model.session_id)))
+    return set(connection.execute(query.distinct()).scalars())
+
+
+@event.listens_for(Session, "before_commit")
+def _update_timelines(session):
+    # Changes not flushed yet belong to this commit too (commit() would flush them after this)
+    if session.new or session.dirty or session.deleted:
+        session.flush()
+    if not any(key in session.info for key in ("timeline_patients", "timeline_invalidated", "timeline_all")):
+        return
+    patients = session.info.pop("timeline_patients", set())
+    session_ids = session.info.pop("timeline_sessions", set())
+    invalidated = session.info.pop("timeline_invalidated", set())
+    if session.info.pop("timeline_all", False):
+        session.execute(delete(models.PatientTimeline))
+        timeline_updates.inc(kind="cleared")
+        return
+    if patients - invalidated:
+        apply_changes(session, patients - invalidated, session_ids)
+    if invalidated:
+        invalidate(session, invalidated)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _discard_changes(session, transaction):
+    # Changes of a transaction that was rolled back or abandoned don't carry over
+    if transaction.parent is None:
+        for key in ("timeline_patients", "timeline_sessions", "timeline_invalidated", "timeline_all"):
+            session.info.pop(key, None)
@@ -0,0 +1,238 @@
+"""
+Read-replica routing for read-only requests.
+
+With DB_REPLICA_HOSTS set, sessions of GET/HEAD requests (get_db) read from
+a replica; everything else uses the primary:
+
+- writes always go to the primary, and a session that wrote reads from the
+  primary from then on (database.RoutingSession)
+- after a request that changed data the client gets a short-lived cookie;
+  while it is valid (DB_REPLICA_STICKY_SECONDS) its reads stay on the
+  primary too, so a page reloaded right after saving shows the change
+- each replica's lag is checked every DB_REPLICA_LAG_CHECK_SECONDS; one
+  that is further behind than DB_REPLICA_MAX_LAG_SECONDS, not replicating
+  or unreachable is skipped, and with no usable replica reads fall back to
+  the primary
+
+The lag check reads Seconds_Behind_Source from SHOW REPLICA STATUS (SHOW
+SLAVE STATUS before MySQL 8.0.22), which needs the REPLICATION CLIENT
+privilege. Where that isn't available (e.g. managed replicas that don't
+report it) the lag counts as unknown and the replica is still used; the
+stickiness window alone then has to cover the replication delay.
+"""
+import itertools
+import os
+import threading
+import time
+from http.cookies import SimpleCookie
+from typing import List, Optional
+
+from sqlalchemy import event, text
+
+from . import database
+from . import metrics
+
+DB_REPLICA_MAX_LAG_SECONDS = float(os.getenv('DB_REPLICA_MAX_LAG_SECONDS', '2'))
+DB_REPLICA_LAG_CHECK_SECONDS = float(os.getenv('DB_REPLICA_LAG_CHECK_SECONDS', '5'))
+DB_REPLICA_STICKY_SECONDS = float(os.getenv('DB_REPLICA_STICKY_SECONDS', '10'))
+# A replica that failed is left alone for this long before it is checked again
+DB_REPLICA_RETRY_SECONDS = float(os.getenv('DB_REPLICA_RETRY_SECONDS', '30'))
+STICKY_COOKIE = "curanet_primary_until"
+
+READ_METHODS = ("GET", "HEAD")
+
+db_reads = metrics.registry.counter(
+    "curanet_db_read_sessions_total",
+    "Read-only request sessions by the database they read from and why",
+    ("target", "reason"),
+)
+replica_lag = metrics.registry.gauge(
+    "curanet_db_replica_lag_seconds",
+    "Replication lag at the last check (-1 when unknown)",
+    ("replica",),
+)
+replica_usable = metrics.registry.gauge(
+    "curanet_db_replica_usable",
+    "1 while a replica receives reads",
+    ("replica",),
+)
+
+
+def _replica_label(url: str) -> str:
+    # host:port only; the URL carries the password
+    return url.rsplit("@", 1)[-1].split("/", 1)[0]
+
+
+class Replica:
+    """One read replica with its engine and last health/lag check"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.label = _replica_label(url)
+        self.usable = False
+        self.lag = None
+        self._engine = None
+        self._next_check = 0.0
+        self._check_lock = threading.Lock()
+        self._lag_warned = False
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            engine = database.create_replica_engine(self.url)
+            event.listen(engine, "handle_error", self._on_error)
+            self._engine = engine
+        return self._engine
+
+    def _on_error(self, context):
+        # A dropped connection takes the replica out until its next check
+        if context.is_disconnect:
+            self.mark_down(str(context.original_exception))
+
+    def mark_down(self, reason: str):
+        if self.usable:
+            print(f"⚠️  Read replica {self.label} unavailable, reading from the primary: {reason}")
+        self.usable = False
+        self._next_check = time.monotonic() + DB_REPLICA_RETRY_SECONDS
+        replica_usable.set(0, replica=self.label)
+
+    def _read_lag(self, conn) -> Optional[float]:
+        """Seconds behind the primary; None when unknown. Raises if replication is stopped."""
+        if conn.dialect.name != "mysql":
+            return 0.0
+        for statement, column in (("SHOW REPLICA STATUS", "Seconds_Behind_Source"),
+                                  ("SHOW SLAVE STATUS", "Seconds_Behind_Master")):
+            try:
+                row = conn.execute(text(statement)).mappings().first()
+            except Exception:
+                continue
+            if row is None:
+                return None
+            if row.get(column) is None:
+                raise Exception("replication is not running")
+            return float(row[column])
+        return None
+
+    def check(self):
+        self._next_check = time.monotonic() + DB_REPLICA_LAG_CHECK_SECONDS
+        try:
+            with self.engine.connect() as conn:
+                lag = self._read_lag(conn)
+        except Exception as e:
+            self.mark_down(str(e))
+            return
+        self.lag = lag
+        replica_lag.set(-1 if lag is None else lag, replica=self.label)
+        if lag is None and not self._lag_warned:
+            self._lag_warned = True
+            print(f"⚠️  Replication lag of {self.label} is unknown; relying on the {DB_REPLICA_STICKY_SECONDS:g}s stickiness window")
+        usable = lag is None or lag <= DB_REPLICA_MAX_LAG_SECONDS
+        if usable != self.usable:
+            if usable:
+                print(f"✅ Read replica {self.label} in use")
+            else:
+                print(f"⚠️  Read replica {self.label} is {lag:.0f}s behind, reading from the primary")
+        self.usable = usable
+        replica_usable.set(1 if usable else 0, replica=self.label)
+
+    def refresh(self):
+        """Re-check when the last check is stale; one request does it while the others go on"""
+        if time.monotonic() < self._next_check:
+            return
+        if not self._check_lock.acquire(blocking=False):
+            return
+        try:
+            if time.monotonic() >= self._next_check:
+                self.check()
+        finally:
+            self._check_lock.release()
+
+
+_replicas: Optional[List[Replica]] = None
+_replicas_lock = threading.Lock()
+_round_robin = itertools.count()
+
+
+def get_replicas() -> List[Replica]:
+    global _replicas
+    if _replicas is None:
+        with _replicas_lock:
+            if _replicas is None:
+                _replicas = [Replica(url) for url in database.REPLICA_URLS]
+                if _replicas:
+                    print(f"✅ {len(_replicas)} read replica(s) configured")
+    return _replicas
+
+
+def pick_replica() -> Optional[Replica]:
+    """A usable replica, round robin; None when reads have to go to the primary"""
+    replicas = get_replicas()
+    if not replicas:
+        return None
+    for replica in replicas:
+        replica.refresh()
+    usable = [replica for replica in replicas if replica.usable]
+    if not usable:
+        return None
+    return usable[next(_round_robin) % len(usable)]
+
+
+def _sticky_until(cookie_header: str) -> float:
+    if not cookie_header or STICKY_COOKIE not in cookie_header:
+        return 0.0
+    cookie = SimpleCookie()
+    try:
+        cookie.load(cookie_header)
+        return float(cookie[STICKY_COOKIE].value)
+    except Exception:
+        return 0.0
+
+
+def reads_from_primary(cookie_header: str) -> bool:
+    """Whether a client's primary-reads cookie is still valid"""
+    return _sticky_until(cookie_header) > time.time()
+
+
+def route_reads(db, request):
+    """Point a request's session at a replica if the request may read from one"""
+    if request.method not in READ_METHODS or not get_replicas():
+        return
+    if reads_from_primary(request.headers.get("cookie", "")):
+        db_reads.inc(target="primary", reason="sticky")
+        return
+    replica = pick_replica()
+    if replica is None:
+        db_reads.inc(target="primary", reason="no_usable_replica")
+        return
+    db.info["replica"] = replica.engine
+    db_reads.inc(target="replica", reason="read_only")
+
+
+def mark_written(db, request):
+    """Record on the request that its session wrote, for StickyPrimaryMiddleware"""
+    if db.info.get("wrote"):
+        request.state.db_wrote = True
+
+
+class StickyPrimaryMiddleware:
+    """Pure ASGI middleware giving clients that changed data a primary-reads cookie"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not get_replicas():
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                wrote = scope["method"] not in READ_METHODS or scope.get("state", {}).get("db_wrote")
+                if wrote:
+                    until = time.time() + DB_REPLICA_STICKY_SECONDS
+                    cookie = (f"{STICKY_COOKIE}={until:.3f}; Max-Age={int(DB_REPLICA_STICKY_SECONDS) + 1}; "
+                              f"Path=/; HttpOnly; SameSite=Lax")
+                    message["headers"] = list(message.get("headers", [])) + [(b"set-cookie", cookie.encode("latin-1"))]
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
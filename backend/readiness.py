@@ -0,0 +1,91 @@
+"""
+Startup warm-up and readiness reporting.
+
+Workers start serving immediately; the database connection and the storage
+client are warmed up in a background thread from the lifespan hook, and
+GET /health/ready reports 503 until both are usable so load balancers only
+route traffic to warm workers.
+"""
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import text
+
+from .database import get_engine
+from .storage import get_storage
+from .s3_service import MockS3Service
+
+_lock = threading.Lock()
+_checks = {}
+_started_at = time.time()
+
+
+def mark(name: str, ready: bool, detail: str = ""):
+    with _lock:
+        _checks[name] = {
+            "ready": ready,
+            "detail": detail,
+            "checked_at": datetime.utcnow().isoformat(),
+        }
+
+
+def _check_database():
+    try:
+        with get_engine().connect() as conn:
+            conn.execute(text("SELECT 1"))
+        mark("database", True)
+    except Exception as e:
+        mark("database", False, str(e))
+
+
+def _check_storage():
+    try:
+        service = get_storage()
+        if isinstance(service, MockS3Service):
+            mark("storage", True, "mock storage (S3 unavailable)")
+        else:
+            mark("storage", True, type(service).__name__)
+    except Exception as e:
+        mark("storage", False, str(e))
+
+
+def warm_up():
+    """Create the costly resources; safe to call more than once"""
+    _check_database()
+    _check_storage()
+
+
+_warming = threading.Event()
+
+
+def _run_warm_up():
+    try:
+        warm_up()
+    finally:
+        _warming.clear()
+
+
+def start_warm_up():
+    """Warm up in a background thread unless a warm-up is already running"""
+    with _lock:
+        if _warming.is_set():
+            return
+        _warming.set()
+        for name in ("database", "storage"):
+            _checks.setdefault(name, {"ready": False, "detail": "warming up", "checked_at": None})
+    threading.Thread(target=_run_warm_up, name="curanet-warm-up", daemon=True).start()
+
+
+def report() -> dict:
+    with _lock:
+        checks = {name: dict(check) for name, check in _checks.items()}
+    ready = bool(checks) and all(check["ready"] for check in checks.values())
+    if not ready:
+        # Retry failed checks (e.g. database not reachable yet) in the background
+        start_warm_up()
+    return {
+        "ready": ready,
+        "uptime_seconds": round(time.time() - _started_at, 1),
+        "checks": checks,
+    }
@@ -0,0 +1,236 @@
+"""
+Streaming ZIP bundles of a patient's reports.
+
+GET /reports/patient/{patient_id}/bundle.zip writes the ZIP while it is being
+sent: entries are streamed from the storage backend chunk by chunk, with data
+descriptors instead of seeking back to patch sizes, so nothing is buffered as
+a whole file and the response starts immediately.
+
+Up to REPORT_BUNDLE_PREFETCH objects are fetched concurrently ahead of the
+entry being written, each through a queue of at most
+REPORT_BUNDLE_QUEUE_CHUNKS chunks, which bounds memory to roughly
+prefetch x queue chunks x chunk size however large the bundle gets.
+"""
+import os
+import queue
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Iterator, List, Optional
+
+from sqlalchemy.orm import Session
+
+from . import metrics
+from . import models
+from . import upload_spool
+from .storage import get_storage
+
+REPORT_BUNDLE_PREFETCH = max(1, int(os.getenv('REPORT_BUNDLE_PREFETCH', '4')))
+REPORT_BUNDLE_QUEUE_CHUNKS = max(1, int(os.getenv('REPORT_BUNDLE_QUEUE_CHUNKS', '4')))
+REPORT_BUNDLE_CHUNK_SIZE = int(os.getenv('REPORT_BUNDLE_CHUNK_SIZE', str(1024 * 1024)))
+# Seconds a fetch worker waits on a full queue before checking for cancellation
+_QUEUE_POLL_SECONDS = 0.5
+
+# Already-compressed formats are stored as they are; deflating them only costs CPU
+_COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/xml', 'application/rtf')
+
+bundle_bytes = metrics.registry.counter(
+    "curanet_report_bundle_bytes_total",
+    "Report bytes streamed into ZIP bundles",
+)
+bundle_missing = metrics.registry.counter(
+    "curanet_report_bundle_missing_total",
+    "Reports left out of ZIP bundles because their object could not be read",
+)
+
+_END = object()
+
+
+@dataclass
+class BundleEntry:
+    report_id: int
+    file_key: str
+    arcname: str
+    file_size: int
+    content_type: Optional[str]
+    uploaded_at: Optional[object]
+    # Still in the upload spool rather than in storage
+    pending: bool = False
+
+
+def _safe_name(name: str) -> str:
+    name = (name or "").replace("\\", "/").split("/")[-1].strip()
+    return name or "report"
+
+
+def _unique_name(name: str, used: set) -> str:
+    """Give reports sharing a name distinct entries: scan.pdf, scan (2).pdf, ..."""
+    candidate = name
+    stem, ext = os.path.splitext(name)
+    counter = 2
+    while candidate.lower() in used:
+        candidate = f"{stem} ({counter}){ext}"
+        counter += 1
+    used.add(candidate.lower())
+    return candidate
+
+
+def list_bundle_entries(db: Session, patient_id: int) -> List[BundleEntry]:
+    """Reports of a patient, oldest first, with unique file names inside the ZIP"""
+    rows = db.query(
+        models.MedicalReport.report_id,
+        models.MedicalReport.report_name,
+        models.MedicalReport.file_key,
+        models.MedicalReport.file_size,
+        models.MedicalReport.content_type,
+        models.MedicalReport.uploaded_at,
+        models.MedicalReport.storage_status,
+    ).filter(
+        models.MedicalReport.patient_id == patient_id
+    ).order_by(models.MedicalReport.uploaded_at, models.MedicalReport.report_id).all()
+
+    used = set()
+    return [
+        BundleEntry(
+            report_id=row.report_id,
+            file_key=row.file_key,
+            arcname=_unique_name(_safe_name(row.report_name), used),
+            file_size=row.file_size or 0,
+            content_type=row.content_type,
+            uploaded_at=row.uploaded_at,
+            pending=row.storage_status == upload_spool.PENDING_STORAGE,
+        )
+        for row in rows
+    ]
+
+
+class _ChunkSink:
+    """Write-only, unseekable file object collecting what ZipFile writes"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        if data:
+            self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class _Prefetcher:
+    """Fetch objects in worker threads into bounded per-object chunk queues"""
+
+    def __init__(self, storage, entries: List[BundleEntry]):
+        self.storage = storage
+        self.entries = entries
+        self.cancelled = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=REPORT_BUNDLE_PREFETCH, thread_name_prefix="curanet-bundle")
+        self._queues = {}
+        self._next = 0
+
+    def _put(self, chunks: queue.Queue, item) -> bool:
+        while not self.cancelled.is_set():
+            try:
+                chunks.put(item, timeout=_QUEUE_POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _fetch(self, entry: BundleEntry, chunks: queue.Queue):
+        try:
+            if entry.pending:
+                chunks_source = upload_spool.iter_object(entry.file_key, chunk_size=REPORT_BUNDLE_CHUNK_SIZE)
+            else:
+                chunks_source = self.storage.iter_object(entry.file_key, chunk_size=REPORT_BUNDLE_CHUNK_SIZE)
+            for chunk in chunks_source:
+                if not self._put(chunks, chunk):
+                    return
+            self._put(chunks, _END)
+        except Exception as e:
+            self._put(chunks, e)
+
+    def _schedule(self, upto: int):
+        while self._next < min(upto, len(self.entries)):
+            chunks = queue.Queue(maxsize=REPORT_BUNDLE_QUEUE_CHUNKS)
+            self._queues[self._next] = chunks
+            self._executor.submit(self._fetch, self.entries[self._next], chunks)
+            self._next += 1
+
+    def chunks(self, index: int) -> queue.Queue:
+        """Queue of entry `index`; also starts fetching the entries after it"""
+        self._schedule(index + REPORT_BUNDLE_PREFETCH)
+        return self._queues.pop(index)
+
+    def close(self):
+        self.cancelled.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _zip_info(entry: BundleEntry) -> zipfile.ZipInfo:
+    timestamp = entry.uploaded_at.timetuple()[:6] if entry.uploaded_at else time.localtime()[:6]
+    # ZIP timestamps start in 1980
+    info = zipfile.ZipInfo(entry.arcname, date_time=max(timestamp, (1980, 1, 1, 0, 0, 0)))
+    content_type = entry.content_type or ""
+    info.compress_type = zipfile.ZIP_DEFLATED if content_type.startswith(_COMPRESSIBLE_TYPES) else zipfile.ZIP_STORED
+    # Size hint from the database; decides whether the entry needs ZIP64 headers
+    info.file_size = entry.file_size
+    return info
+
+
+def stream_bundle(entries: List[BundleEntry], storage=None) -> Iterator[bytes]:
+    """
+    Yield a ZIP archive of the given reports.
+
+    A report whose object can't be read before any of it was written is left
+    out and listed in MISSING_FILES.txt at the end of the archive. A failure
+    in the middle of an object aborts the stream (the client sees a truncated
+    download) rather than ship a silently corrupted entry.
+    """
+    storage = storage or get_storage()
+    prefetcher = _Prefetcher(storage, entries)
+    sink = _ChunkSink()
+    missing = []
+    try:
+        with zipfile.ZipFile(sink, mode="w", allowZip64=True) as archive:
+            for index, entry in enumerate(entries):
+                chunks = prefetcher.chunks(index)
+                item = chunks.get()
+                if isinstance(item, Exception):
+                    print(f"⚠️  Bundle: report {entry.report_id} ({entry.file_key}) unavailable: {item}")
+                    bundle_missing.inc()
+                    missing.append(f"{entry.arcname}: {item}")
+                    continue
+
+                info = _zip_info(entry)
+                with archive.open(info, mode="w", force_zip64=info.file_size >= zipfile.ZIP64_LIMIT) as member:
+                    while item is not _END:
+                        if isinstance(item, Exception):
+                            raise item
+                        member.write(item)
+                        bundle_bytes.inc(len(item))
+                        data = sink.drain()
+                        if data:
+                            yield data
+                        item = chunks.get()
+                data = sink.drain()
+                if data:
+                    yield data
+
+            if missing:
+                archive.writestr(
+                    "MISSING_FILES.txt",
+                    "These reports could not be read from storage:\n" + "\n".join(missing) + "\n",
+                )
+        yield sink.drain()
+    finally:
+        prefetcher.close()
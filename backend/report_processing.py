@@ -0,0 +1,183 @@
+"""
+Post-upload processing of reports, run as background jobs.
+
+Uploads return as soon as the file is stored; enqueue_for_report() then
+queues the follow-up work for its content type:
+
+- report_thumbnail: a JPEG preview (THUMBNAIL_SIZE px on the long side) of
+  image reports, stored content-addressed under thumbnails/
+- report_pdf_text: the text layer of PDF reports, kept in
+  medical_reports.extracted_text for search
+
+Decoding and rendering run in the job process pool. Pillow and pypdf are
+optional: without them the jobs end as skipped and can be retried once the
+package is installed (POST /jobs/{job_id}/retry).
+
+Reports sharing content reuse the thumbnail and text of an already
+processed copy instead of processing it again.
+"""
+import hashlib
+import importlib.util
+import io
+import os
+import tempfile
+from typing import List
+
+from sqlalchemy.orm import Session
+
+from . import jobs
+from . import models
+from . import upload_spool
+from .storage import get_storage
+
+THUMBNAIL_SIZE = int(os.getenv('THUMBNAIL_SIZE', '320'))
+# Larger files are not processed; decoding them could exhaust a worker's memory
+REPORT_PROCESSING_MAX_BYTES = int(os.getenv('REPORT_PROCESSING_MAX_BYTES', str(50 * 1024 * 1024)))
+# Leaves room below MySQL's 64 KB TEXT limit for multi-byte characters
+EXTRACTED_TEXT_MAX_BYTES = 60000
+THUMBNAIL_PREFIX = 'thumbnails'
+
+THUMBNAIL_TYPES = ('image/jpeg', 'image/png', 'image/gif', 'image/webp', 'image/bmp', 'image/tiff')
+PDF_TYPES = ('application/pdf',)
+
+
+def render_thumbnail(path: str, size: int) -> bytes:
+    """JPEG thumbnail of an image file; runs in the job process pool"""
+    from PIL import Image, ImageOps
+
+    with Image.open(path) as image:
+        image.draft('RGB', (size, size))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size))
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        output = io.BytesIO()
+        image.save(output, format='JPEG', quality=80, optimize=True)
+        return output.getvalue()
+
+
+def extract_pdf_text(path: str, max_bytes: int) -> str:
+    """Text layer of a PDF, cut off at max_bytes of UTF-8; runs in the job process pool"""
+    from pypdf import PdfReader
+
+    pages = []
+    total = 0
+    for page in PdfReader(path).pages:
+        text = (page.extract_text() or '').strip()
+        if not text:
+            continue
+        pages.append(text)
+        total += len(text.encode('utf-8')) + 2
+        if total >= max_bytes:
+            break
+    return '\n\n'.join(pages).encode('utf-8')[:max_bytes].decode('utf-8', 'ignore')
+
+
+def _require(module: str, package: str):
+    if importlib.util.find_spec(module) is None:
+        raise jobs.JobSkipped(f"{package} is not installed (pip install {package})")
+
+
+def _load_report(db: Session, payload: dict) -> models.MedicalReport:
+    report = db.query(models.MedicalReport).filter(
+        models.MedicalReport.report_id == payload.get('report_id')
+    ).first()
+    if report is None:
+        raise jobs.JobSkipped("Report no longer exists")
+    if (report.file_size or 0) > REPORT_PROCESSING_MAX_BYTES:
+        raise jobs.JobSkipped(f"Report is larger than {REPORT_PROCESSING_MAX_BYTES} bytes")
+    return report
+
+
+def _processed_copy(db: Session, report: models.MedicalReport, column):
+    """Another report with the same content that already has this column filled"""
+    if not report.content_sha256:
+        return None
+    return db.query(column).filter(
+        models.MedicalReport.content_sha256 == report.content_sha256,
+        models.MedicalReport.report_id != report.report_id,
+        column.isnot(None),
+    ).first()
+
+
+def _download(report: models.MedicalReport) -> str:
+    """Copy the report's object to a temporary file for the worker process; the caller removes it"""
+    # Works for reports still waiting in the upload spool as well
+    with tempfile.NamedTemporaryFile(prefix='curanet-job-', delete=False) as tmp:
+        try:
+            for chunk in upload_spool.iter_object(report.file_key):
+                tmp.write(chunk)
+        except Exception:
+            os.unlink(tmp.name)
+            raise
+        return tmp.name
+
+
+@jobs.job("report_thumbnail")
+def make_thumbnail(db: Session, payload: dict) -> dict:
+    report = _load_report(db, payload)
+    existing = _processed_copy(db, report, models.MedicalReport.thumbnail_key)
+    if existing:
+        report.thumbnail_key = existing.thumbnail_key
+        db.commit()
+        return {"thumbnail_key": report.thumbnail_key, "reused": True}
+
+    _require('PIL', 'Pillow')
+    path = _download(report)
+    try:
+        data = jobs.run_cpu(render_thumbnail, path, THUMBNAIL_SIZE)
+    finally:
+        os.unlink(path)
+    sha = hashlib.sha256(data).hexdigest()
+    report.thumbnail_key = get_storage().store_object(io.BytesIO(data), sha, 'image/jpeg', prefix=THUMBNAIL_PREFIX)
+    db.commit()
+    return {"thumbnail_key": report.thumbnail_key, "bytes": len(data)}
+
+
+@jobs.job("report_pdf_text")
+def extract_text(db: Session, payload: dict) -> dict:
+    report = _load_report(db, payload)
+    existing = _processed_copy(db, report, models.MedicalReport.extracted_text)
+    if existing:
+        report.extracted_text = existing.extracted_text
+        db.commit()
+        return {"characters": len(report.extracted_text), "reused": True}
+
+    _require('pypdf', 'pypdf')
+    path = _download(report)
+    try:
+        text = jobs.run_cpu(extract_pdf_text, path, EXTRACTED_TEXT_MAX_BYTES)
+    finally:
+        os.unlink(path)
+    report.extracted_text = text
+    db.commit()
+    return {"characters": len(text)}
+
+
+def enqueue_for_report(db: Session, report_id: int, content_type: str) -> List[models.Job]:
+    """Queue the processing a new report's content type calls for"""
+    kinds = []
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if content_type in THUMBNAIL_TYPES:
+        kinds.append("report_thumbnail")
+    if content_type in PDF_TYPES:
+        kinds.append("report_pdf_text")
+    if not kinds:
+        return []
+    queued = [
+        jobs.enqueue(db, kind, {"report_id": report_id}, report_id=report_id, commit=False)
+        for kind in kinds
+    ]
+    db.commit()
+    jobs.wake()
+    return queued
+
+
+def queue_processing(db: Session, report_id: int, content_type: str) -> List[int]:
+    """enqueue_for_report() for upload endpoints: a failure is logged, never fails the upload"""
+    try:
+        return [queued.job_id for queued in enqueue_for_report(db, report_id, content_type)]
+    except Exception as e:
+        db.rollback()
+        print(f"⚠️  Could not queue processing for report {report_id}: {e}")
+        return []
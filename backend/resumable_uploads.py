@@ -0,0 +1,415 @@
+"""
+Resumable chunked report uploads.
+
+A client creates an upload session, PUTs fixed-size numbered chunks (each
+with its SHA-256), asks for the current offset after a dropped connection and
+resumes from there, then finalizes. Chunks are staged as S3 multipart upload
+parts, or written into a spool file when the storage backend can't do
+multipart uploads (mock mode).
+
+Finalizing verifies the SHA-256 of the whole file, stores it under its
+content-addressed key (reusing an existing object for duplicate content) and
+creates the medical_reports row. With S3 staging, finalize only completes the
+multipart upload: hashing means reading the assembled object back (up to
+RESUMABLE_MAX_UPLOAD_SIZE), which a background job (resumable_upload_verify)
+does while the session is "finalizing"; clients poll the session until it
+is "completed" (or "aborted" when the hash didn't match). Spooled chunks are
+verified in the request, from the local file.
+
+The spool is local to the host that received the chunks: behind more than
+one host, use S3 or put UPLOAD_SPOOL_DIR on a volume they all share.
+Sessions idle for UPLOAD_SESSION_TTL_HOURS are expired by a background
+sweeper that also discards their staged bytes.
+"""
+import base64
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy.orm import Session
+
+from . import jobs
+from . import models
+from . import report_processing
+from .crud import medical_reports
+from .database import SessionLocal
+from .storage import get_storage, content_key
+
+# S3 requires every part but the last to be at least 5MB
+MIN_MULTIPART_CHUNK_SIZE = 5 * 1024 * 1024
+RESUMABLE_CHUNK_SIZE = int(os.getenv('RESUMABLE_CHUNK_SIZE', str(8 * 1024 * 1024)))
+# medical_reports.file_size is a 32-bit INT and S3 copy_object stops at 5GB
+RESUMABLE_MAX_UPLOAD_SIZE = min(int(os.getenv('RESUMABLE_MAX_UPLOAD_SIZE', str(1024 ** 3))), 2 ** 31 - 1)
+# Largest request body a chunk PUT may carry
+RESUMABLE_MAX_CHUNK_BYTES = max(RESUMABLE_CHUNK_SIZE, MIN_MULTIPART_CHUNK_SIZE)
+UPLOAD_SPOOL_DIR = os.getenv('UPLOAD_SPOOL_DIR', os.path.join(tempfile.gettempdir(), 'curanet-upload-spool'))
+UPLOAD_SESSION_TTL_HOURS = float(os.getenv('UPLOAD_SESSION_TTL_HOURS', '24'))
+UPLOAD_GC_INTERVAL_SECONDS = float(os.getenv('UPLOAD_GC_INTERVAL_SECONDS', '3600'))
+VERIFY_JOB = "resumable_upload_verify"
+
+Status = models.UploadSessionStatus
+
+
+class UploadSessionError(Exception):
+    """Client-facing upload failure; status_code is the HTTP status to answer with"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _total_chunks(upload: models.UploadSession) -> int:
+    return (upload.file_size + upload.chunk_size - 1) // upload.chunk_size
+
+
+def _next_chunk(upload: models.UploadSession) -> int:
+    # The last chunk may be short, so dividing the final offset would undercount
+    if upload.received_bytes >= upload.file_size:
+        return _total_chunks(upload)
+    return upload.received_bytes // upload.chunk_size
+
+
+def describe(upload: models.UploadSession) -> dict:
+    """Session state returned by every endpoint; offset is where the client resumes"""
+    return {
+        "upload_id": upload.upload_id,
+        "status": upload.status.value,
+        "file_name": upload.file_name,
+        "file_size": upload.file_size,
+        "chunk_size": upload.chunk_size,
+        "offset": upload.received_bytes,
+        "next_chunk": _next_chunk(upload),
+        "total_chunks": _total_chunks(upload),
+        "report_id": upload.report_id,
+    }
+
+
+def content_checksum(sha256_hex: str) -> str:
+    """Base64 form of a hex SHA-256, as S3 checksum fields expect"""
+    return base64.b64encode(bytes.fromhex(sha256_hex)).decode("ascii")
+
+
+def _spool_path(upload_id: str) -> str:
+    return os.path.join(UPLOAD_SPOOL_DIR, f"{upload_id}.part")
+
+
+def get_upload(db: Session, upload_id: str) -> models.UploadSession:
+    upload = db.query(models.UploadSession).filter(models.UploadSession.upload_id == upload_id).first()
+    if not upload:
+        raise UploadSessionError(404, "Upload session not found")
+    return upload
+
+
+def start_upload(db: Session, request) -> models.UploadSession:
+    """Create an upload session (request: schemas.ResumableUploadCreate)"""
+    if request.file_size > RESUMABLE_MAX_UPLOAD_SIZE:
+        raise UploadSessionError(413, f"File too large. Maximum size is {RESUMABLE_MAX_UPLOAD_SIZE} bytes.")
+
+    upload = models.UploadSession(
+        upload_id=str(uuid.uuid4()),
+        patient_id=request.patient_id,
+        doctor_id=request.doctor_id,
+        session_id=request.session_id,
+        file_name=request.file_name,
+        content_type=request.content_type,
+        file_size=request.file_size,
+        content_sha256=request.content_sha256,
+        received_bytes=0,
+        parts="[]",
+        status=Status.active,
+    )
+
+    # The whole file is uploaded even when its content is stored already: a
+    # report is only linked to stored content whose bytes the client sent
+    # (finalize deduplicates after hashing them)
+    service = get_storage()
+    if getattr(service, "supports_multipart", False):
+        upload.staging = "s3"
+        upload.chunk_size = max(RESUMABLE_CHUNK_SIZE, MIN_MULTIPART_CHUNK_SIZE)
+        upload.staging_key = f"uploads/staging/{upload.upload_id}"
+        upload.multipart_upload_id = service.create_multipart_upload(upload.staging_key, request.content_type)
+    else:
+        upload.staging = "spool"
+        upload.chunk_size = RESUMABLE_CHUNK_SIZE
+        upload.staging_key = _spool_path(upload.upload_id)
+        os.makedirs(UPLOAD_SPOOL_DIR, exist_ok=True)
+        open(upload.staging_key, "wb").close()
+
+    db.add(upload)
+    db.commit()
+    return upload
+
+
+def write_chunk(db: Session, upload_id: str, chunk_number: int, offset: int,
+                data: bytes, chunk_sha256: str) -> models.UploadSession:
+    """
+    Store chunk `chunk_number` (starting at byte `offset`) after verifying its SHA-256.
+
+    Chunks are accepted in order. Re-sending a chunk that was already received
+    (e.g. its response was lost) is acknowledged without storing it again.
+    """
+    upload = get_upload(db, upload_id)
+    if upload.status != Status.active:
+        raise UploadSessionError(409, f"Upload session is {upload.status.value}")
+    if offset != chunk_number * upload.chunk_size or offset >= upload.file_size:
+        raise UploadSessionError(400, f"Chunk {chunk_number} must start at offset {chunk_number * upload.chunk_size}")
+
+    expected_length = min(upload.chunk_size, upload.file_size - offset)
+    if len(data) != expected_length:
+        raise UploadSessionError(400, f"Chunk {chunk_number} must be {expected_length} bytes, got {len(data)}")
+    if hashlib.sha256(data).hexdigest() != chunk_sha256.lower():
+        raise UploadSessionError(422, f"Checksum mismatch for chunk {chunk_number}")
+
+    parts = json.loads(upload.parts)
+    next_chunk = _next_chunk(upload)
+    if chunk_number < next_chunk:
+        if parts[chunk_number]["sha256"] != chunk_sha256.lower():
+            raise UploadSessionError(409, f"Chunk {chunk_number} was already received with different content")
+        return upload
+    if chunk_number > next_chunk:
+        raise UploadSessionError(409, f"Expected chunk {next_chunk} at offset {upload.received_bytes}")
+
+    etag = None
+    if upload.staging == "s3":
+        etag = get_storage().upload_part(
+            upload.staging_key, upload.multipart_upload_id, chunk_number + 1, data, chunk_sha256.lower()
+        )
+    else:
+        with open(upload.staging_key, "r+b") as spool:
+            spool.seek(offset)
+            spool.write(data)
+            spool.flush()
+            # The offset we report must survive a crash
+            os.fsync(spool.fileno())
+
+    parts.append({"chunk": chunk_number, "size": len(data), "sha256": chunk_sha256.lower(), "etag": etag})
+    # Only advance from the offset we validated against; a concurrent duplicate PUT loses
+    advanced = db.query(models.UploadSession).filter(
+        models.UploadSession.upload_id == upload_id,
+        models.UploadSession.received_bytes == upload.received_bytes,
+        models.UploadSession.status == Status.active,
+    ).update({
+        "received_bytes": upload.received_bytes + len(data),
+        "parts": json.dumps(parts),
+        "updated_at": datetime.utcnow(),
+    }, synchronize_session=False)
+    db.commit()
+    if not advanced:
+        print(f"Chunk {chunk_number} of upload {upload_id} was stored concurrently")
+    db.refresh(upload)
+    return upload
+
+
+def _staged_chunks(upload: models.UploadSession):
+    if upload.staging == "s3":
+        return get_storage().iter_object(upload.staging_key)
+    return _iter_file(upload.staging_key)
+
+
+def _iter_file(path: str, chunk_size: int = 1024 * 1024):
+    with open(path, "rb") as staged:
+        while True:
+            chunk = staged.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def _discard_staged(upload: models.UploadSession, assembled: bool = False):
+    """Remove staged bytes: the multipart upload (or assembled staging object) or spool file"""
+    try:
+        if upload.staging == "s3":
+            service = get_storage()
+            if assembled:
+                service.delete_file(upload.staging_key)
+            elif not service.abort_multipart_upload(upload.staging_key, upload.multipart_upload_id):
+                # Already completed by an interrupted finalize
+                service.delete_file(upload.staging_key)
+        elif upload.staging == "spool" and os.path.exists(upload.staging_key):
+            os.remove(upload.staging_key)
+    except Exception as e:
+        print(f"⚠️  Could not discard staged upload {upload.upload_id}: {e}")
+
+
+def _set_status(db: Session, upload: models.UploadSession, status, commit: bool = True, **values) -> bool:
+    """Move a session from its current status to `status`; False if another worker got there first"""
+    values.update({"status": status, "updated_at": datetime.utcnow()})
+    changed = db.query(models.UploadSession).filter(
+        models.UploadSession.upload_id == upload.upload_id,
+        models.UploadSession.status == upload.status,
+    ).update(values, synchronize_session=False)
+    if commit:
+        db.commit()
+        db.refresh(upload)
+    return bool(changed)
+
+
+def finalize_upload(db: Session, upload_id: str) -> models.UploadSession:
+    """
+    Assemble the chunks; S3-staged uploads are then verified by a job, spooled
+    ones are verified, stored and given their report right away
+    """
+    upload = get_upload(db, upload_id)
+    if upload.status in (Status.completed, Status.finalizing):
+        return upload
+    if upload.status != Status.active:
+        raise UploadSessionError(409, f"Upload session is {upload.status.value}")
+    if upload.received_bytes != upload.file_size:
+        raise UploadSessionError(409, f"Upload incomplete: {upload.received_bytes} of {upload.file_size} bytes received")
+    if not _set_status(db, upload, Status.finalizing):
+        raise UploadSessionError(409, "Upload session is already being finalized")
+
+    if upload.staging != "s3":
+        return _verify_and_store(db, upload)
+    try:
+        parts = [{
+            "PartNumber": part["chunk"] + 1,
+            "ETag": part["etag"],
+            "ChecksumSHA256": content_checksum(part["sha256"]),
+        } for part in json.loads(upload.parts)]
+        # S3 checked every part against its SHA-256; the whole-file hash is left to the job
+        jobs.enqueue(db, VERIFY_JOB, {"upload_id": upload.upload_id}, commit=False)
+        get_storage().complete_multipart_upload(upload.staging_key, upload.multipart_upload_id, parts)
+        db.commit()
+    except Exception:
+        db.rollback()
+        # Let the client retry the finalize
+        _set_status(db, upload, Status.active)
+        raise
+    jobs.wake()
+    return upload
+
+
+@jobs.job(VERIFY_JOB)
+def verify_upload(db: Session, payload: dict) -> dict:
+    """Hash an assembled S3 upload, store it deduplicated and create its report"""
+    upload = db.query(models.UploadSession).filter(models.UploadSession.upload_id == payload["upload_id"]).first()
+    if upload is not None and upload.status == Status.completed:
+        # Report committed by an earlier attempt that stopped before removing the staged object
+        _discard_staged(upload, assembled=True)
+        return {"status": upload.status.value, "report_id": upload.report_id}
+    if upload is None or upload.status != Status.finalizing:
+        raise jobs.JobSkipped(f"Upload session is {upload.status.value if upload else 'gone'}")
+    try:
+        upload = _verify_and_store(db, upload, assembled=True)
+    except UploadSessionError as e:
+        return {"status": upload.status.value, "error": e.detail}
+    return {"status": upload.status.value, "report_id": upload.report_id}
+
+
+def _verify_and_store(db: Session, upload: models.UploadSession, assembled: bool = False) -> models.UploadSession:
+    """
+    Verify the staged file's hash, store it deduplicated and create the report; the session is finalizing.
+
+    The report and the completed status commit together and the staged bytes
+    are removed only after that, so a retry after a failure at any point finds
+    either the staged bytes or the finished upload.
+    """
+    service = get_storage()
+    try:
+        digest = hashlib.sha256()
+        for chunk in _staged_chunks(upload):
+            digest.update(chunk)
+        content_sha256 = digest.hexdigest()
+
+        if upload.content_sha256 and upload.content_sha256 != content_sha256:
+            _set_status(db, upload, Status.aborted)
+            _discard_staged(upload, assembled)
+            raise UploadSessionError(422, "Assembled file does not match the announced SHA-256")
+
+        file_key = medical_reports.find_stored_object(db, content_sha256, lock=True)
+        if not file_key and upload.staging == "s3":
+            file_key = service.copy_object(upload.staging_key, content_key(content_sha256), upload.content_type)
+        elif not file_key:
+            with open(upload.staging_key, "rb") as staged:
+                file_key = service.store_object(staged, content_sha256, upload.content_type)
+
+        report_id = medical_reports.create_report(
+            db, upload.patient_id, upload.doctor_id, upload.session_id, upload.file_name,
+            file_key, upload.file_size, upload.content_type, content_sha256, commit=False
+        )
+        if not _set_status(db, upload, Status.completed, commit=False,
+                           content_sha256=content_sha256, report_id=report_id):
+            db.rollback()
+            db.refresh(upload)
+            raise UploadSessionError(409, f"Upload session is {upload.status.value}")
+        db.commit()
+        db.refresh(upload)
+    except UploadSessionError:
+        raise
+    except Exception:
+        db.rollback()
+        if not assembled:
+            # Let the client retry the finalize; an assembled upload is retried by its job
+            _set_status(db, upload, Status.active)
+        raise
+    _discard_staged(upload, assembled)
+    report_processing.queue_processing(db, report_id, upload.content_type)
+    return upload
+
+
+def abort_upload(db: Session, upload_id: str) -> models.UploadSession:
+    upload = get_upload(db, upload_id)
+    if upload.status != Status.active:
+        raise UploadSessionError(409, f"Upload session is {upload.status.value}")
+    if _set_status(db, upload, Status.aborted):
+        _discard_staged(upload)
+    return upload
+
+
+def abort_sessions(db: Session, uploads) -> int:
+    """Abort sessions still in progress and discard their staged bytes (used before deleting them)"""
+    aborted = 0
+    for upload in uploads:
+        if upload.status in (Status.active, Status.finalizing) and _set_status(db, upload, Status.aborted):
+            _discard_staged(upload)
+            aborted += 1
+    return aborted
+
+
+def collect_garbage(db: Session, max_idle_hours: float = UPLOAD_SESSION_TTL_HOURS, limit: int = 100) -> int:
+    """Expire sessions idle for longer than max_idle_hours and discard their staged bytes"""
+    cutoff = datetime.utcnow() - timedelta(hours=max_idle_hours)
+    stale = db.query(models.UploadSession).filter(
+        models.UploadSession.status.in_([Status.active, Status.finalizing]),
+        models.UploadSession.updated_at < cutoff,
+    ).limit(limit).all()
+
+    expired = 0
+    for upload in stale:
+        # Every worker runs the sweeper; the status transition decides who cleans up
+        if _set_status(db, upload, Status.expired):
+            _discard_staged(upload)
+            expired += 1
+    return expired
+
+
+_collector_started = threading.Event()
+_collector_stop = threading.Event()
+
+
+def _run_garbage_collector():
+    while not _collector_stop.wait(UPLOAD_GC_INTERVAL_SECONDS):
+        try:
+            db = SessionLocal()
+            try:
+                expired = collect_garbage(db)
+            finally:
+                db.close()
+            if expired:
+                print(f"🧹 Expired {expired} abandoned upload session(s)")
+        except Exception as e:
+            print(f"⚠️  Upload session cleanup failed: {e}")
+
+
+def start_garbage_collector():
+    """Sweep abandoned upload sessions periodically in a daemon thread (once per process)"""
+    if _collector_started.is_set():
+        return
+    _collector_started.set()
+    threading.Thread(target=_run_garbage_collector, name="curanet-upload-gc", daemon=True).start()
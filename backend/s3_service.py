@@ -1,23 +1,134 @@
-import boto3
+import base64
 import os
-from botocore.exceptions import ClientError
+import threading
+import time
+from botocore.exceptions import ClientError, ConnectTimeoutError, ReadTimeoutError
 from datetime import datetime, timedelta
 import uuid
 
-class S3Service:
+from . import deadlines
+from . import metrics
+from .storage import StorageBackend, DELETE_OBJECTS_BATCH_SIZE, content_key, get_storage, set_storage
+
+s3_operation_duration = metrics.registry.histogram(
+    "curanet_s3_operation_duration_seconds", "Latency of S3 calls, including retries",
+    ("operation",),
+)
+s3_operation_retries = metrics.registry.counter(
+    "curanet_s3_operation_retries_total", "Retries botocore performed for S3 calls",
+    ("operation",),
+)
+s3_operation_errors = metrics.registry.counter(
+    "curanet_s3_operation_errors_total", "S3 calls that failed after retries",
+    ("operation", "code"),
+)
+
+
+def _env_bool(name, default):
+    return os.getenv(name, str(default)).lower() in ('1', 'true', 'yes')
+
+
+S3_CONNECT_TIMEOUT = float(os.getenv('S3_CONNECT_TIMEOUT', '5'))
+S3_READ_TIMEOUT = float(os.getenv('S3_READ_TIMEOUT', '60'))
+# Timeouts of the clients used when a request's deadline leaves less time than S3_READ_TIMEOUT
+DEADLINE_TIMEOUT_STEPS = (1, 2, 5, 10, 30)
+
+
+def build_client_config(read_timeout=None, max_attempts=None):
+    """botocore client config for S3, tunable through environment variables"""
+    from botocore.config import Config
+
+    read_timeout = read_timeout or S3_READ_TIMEOUT
+    return Config(
+        # Shared by every worker thread; botocore's default of 10 queues concurrent uploads
+        max_pool_connections=int(os.getenv('S3_MAX_POOL_CONNECTIONS', '50')),
+        connect_timeout=min(S3_CONNECT_TIMEOUT, read_timeout),
+        read_timeout=read_timeout,
+        retries={
+            'mode': os.getenv('S3_RETRY_MODE', 'adaptive'),
+            'max_attempts': max_attempts or int(os.getenv('S3_MAX_ATTEMPTS', '5')),
+        },
+        tcp_keepalive=_env_bool('S3_TCP_KEEPALIVE', True),
+    )
+
+
+class S3Service(StorageBackend):
+    # Resumable uploads stage chunks as multipart upload parts
+    supports_multipart = True
+
     def __init__(self):
+        # Imported here rather than at module load: boto3 plus client creation
+        # costs a few hundred ms, which every autoscaled worker paid on import
+        import boto3
+
         # Get AWS credentials from environment or use defaults
         aws_access_key = os.getenv('AWS_ACCESS_KEY_ID', 'your_access_key_here')
         aws_secret_key = os.getenv('AWS_SECRET_ACCESS_KEY', 'your_secret_key_here')
         aws_region = os.getenv('AWS_REGION', 'us-east-1')
         
-        self.s3_client = boto3.client(
-            's3',
+        self._client_options = dict(
             aws_access_key_id=aws_access_key,
             aws_secret_access_key=aws_secret_key,
-            region_name=aws_region
+            region_name=aws_region,
+            # Optional S3-compatible endpoint (MinIO, local stand-ins)
+            endpoint_url=os.getenv('S3_ENDPOINT_URL') or None,
         )
+        self.s3_client = boto3.client('s3', config=build_client_config(), **self._client_options)
         self.bucket_name = os.getenv('S3_BUCKET_NAME', 'curanet-medical-reports')
+        self._deadline_clients = {}
+        self._deadline_clients_lock = threading.Lock()
+
+    def _client_within(self, seconds):
+        """A client whose timeouts fit a request deadline with `seconds` left"""
+        if seconds >= S3_READ_TIMEOUT:
+            return self.s3_client
+        fitting = [step for step in DEADLINE_TIMEOUT_STEPS if step <= seconds]
+        timeout = fitting[-1] if fitting else DEADLINE_TIMEOUT_STEPS[0]
+        client = self._deadline_clients.get(timeout)
+        if client is None:
+            import boto3
+
+            with self._deadline_clients_lock:
+                client = self._deadline_clients.get(timeout)
+                if client is None:
+                    # One retry at most: there is no time for backoff
+                    client = boto3.client('s3', config=build_client_config(timeout, max_attempts=2),
+                                          **self._client_options)
+                    self._deadline_clients[timeout] = client
+        return client
+
+    def _call(self, operation, **kwargs):
+        """Invoke a client method, recording latency, retries and errors per operation"""
+        client = self.s3_client
+        remaining = deadlines.remaining()
+        if remaining is not None:
+            deadlines.check("storage")
+            client = self._client_within(remaining)
+        started = time.perf_counter()
+        try:
+            response = getattr(client, operation)(**kwargs)
+        except ClientError as e:
+            metadata = e.response.get('ResponseMetadata', {})
+            s3_operation_retries.inc(metadata.get('RetryAttempts', 0), operation=operation)
+            s3_operation_errors.inc(operation=operation, code=e.response.get('Error', {}).get('Code', 'Unknown'))
+            raise
+        except Exception as e:
+            s3_operation_errors.inc(operation=operation, code=type(e).__name__)
+            if remaining is not None:
+                # A timeout caused by the deadline is reported as such
+                deadlines.check("storage")
+                if client is not self.s3_client and isinstance(e, (ConnectTimeoutError, ReadTimeoutError)):
+                    # So is one of a client whose timeouts were cut to fit the deadline
+                    raise deadlines.current().exceeded("storage") from e
+            raise
+        finally:
+            s3_operation_duration.observe(time.perf_counter() - started, operation=operation)
+
+        if isinstance(response, dict):
+            retries = response.get('ResponseMetadata', {}).get('RetryAttempts', 0)
+            if retries:
+                s3_operation_retries.inc(retries, operation=operation)
+        return response
     
     def upload_file(self, file_content, file_name, content_type, patient_id, doctor_id):
         """Upload file to S3 and return the file key"""
@@ -28,7 +139,8 @@ class S3Service:
             file_key = f"reports/patient_{patient_id}/doctor_{doctor_id}/{timestamp}_{unique_id}_{file_name}"
             
             # Upload to S3
-            self.s3_client.put_object(
+            self._call(
+                'put_object',
                 Bucket=self.bucket_name,
                 Key=file_key,
                 Body=file_content,
@@ -39,13 +151,193 @@ class S3Service:
             return file_key
         except ClientError as e:
             raise Exception(f"Failed to upload file to S3: {str(e)}")
+
+    def store_object(self, file_obj, content_sha256, content_type, prefix='reports'):
+        """Upload a file object under its content-addressed key and return the key"""
+        file_key = content_key(content_sha256, prefix)
+        try:
+            self._call(
+                'put_object',
+                Bucket=self.bucket_name,
+                Key=file_key,
+                Body=file_obj,
+                ContentType=content_type,
+                # S3 rejects the upload if the bytes don't match the hash we computed
+                ChecksumSHA256=base64.b64encode(bytes.fromhex(content_sha256)).decode('ascii'),
+                ServerSideEncryption='AES256'
+            )
+            return file_key
+        except ClientError as e:
+            raise Exception(f"Failed to upload file to S3: {str(e)}")
     
-    def generate_presigned_url(self, file_key, expiration=3600):
+    def create_presigned_post(self, content_sha256, content_type, file_size, expiration=900, file_key=None):
+        """
+        Presigned POST letting a browser upload straight to S3, by default to the content-addressed key.
+
+        The policy pins the exact size, content type, encryption and SHA-256, so
+        S3 rejects anything other than the file that was announced.
+        """
+        file_key = file_key or content_key(content_sha256)
+        checksum = base64.b64encode(bytes.fromhex(content_sha256)).decode('ascii')
+        fields = {
+            'Content-Type': content_type,
+            'x-amz-server-side-encryption': 'AES256',
+            'x-amz-checksum-algorithm': 'SHA256',
+            'x-amz-checksum-sha256': checksum,
+        }
+        conditions = [{name: value} for name, value in fields.items()]
+        conditions.append(['content-length-range', file_size, file_size])
+        try:
+            # Signed locally: no S3 round trip to time or fit into a deadline
+            post = self.s3_client.generate_presigned_post(
+                Bucket=self.bucket_name,
+                Key=file_key,
+                Fields=fields,
+                Conditions=conditions,
+                ExpiresIn=expiration
+            )
+            return {'url': post['url'], 'fields': post['fields'], 'file_key': file_key}
+        except ClientError as e:
+            raise Exception(f"Failed to create presigned upload: {str(e)}")
+
+    def head_object(self, file_key):
+        """Object metadata (size, content type, checksum), or None if it doesn't exist"""
+        try:
+            response = self._call('head_object', Bucket=self.bucket_name, Key=file_key, ChecksumMode='ENABLED')
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise Exception(f"Failed to read object metadata from S3: {str(e)}")
+        return {
+            'file_size': response['ContentLength'],
+            'content_type': response.get('ContentType'),
+            'checksum_sha256': response.get('ChecksumSHA256'),
+        }
+
+    def create_multipart_upload(self, file_key, content_type):
+        """Start a multipart upload with SHA-256 part checksums and return its id"""
+        try:
+            response = self._call(
+                'create_multipart_upload',
+                Bucket=self.bucket_name,
+                Key=file_key,
+                ContentType=content_type,
+                ServerSideEncryption='AES256',
+                ChecksumAlgorithm='SHA256'
+            )
+            return response['UploadId']
+        except ClientError as e:
+            raise Exception(f"Failed to start multipart upload: {str(e)}")
+
+    def upload_part(self, file_key, multipart_upload_id, part_number, data, part_sha256):
+        """Upload one part; S3 verifies it against part_sha256 (hex)"""
+        checksum = base64.b64encode(bytes.fromhex(part_sha256)).decode('ascii')
+        try:
+            response = self._call(
+                'upload_part',
+                Bucket=self.bucket_name,
+                Key=file_key,
+                UploadId=multipart_upload_id,
+                PartNumber=part_number,
+                Body=data,
+                ChecksumSHA256=checksum
+            )
+            return response['ETag']
+        except ClientError as e:
+            raise Exception(f"Failed to upload part {part_number}: {str(e)}")
+
+    def complete_multipart_upload(self, file_key, multipart_upload_id, parts):
+        """Assemble the object from parts: [{'PartNumber', 'ETag', 'ChecksumSHA256'}, ...]"""
+        try:
+            self._call(
+                'complete_multipart_upload',
+                Bucket=self.bucket_name,
+                Key=file_key,
+                UploadId=multipart_upload_id,
+                MultipartUpload={'Parts': parts}
+            )
+        except ClientError as e:
+            raise Exception(f"Failed to complete multipart upload: {str(e)}")
+
+    def abort_multipart_upload(self, file_key, multipart_upload_id):
+        """Discard uploaded parts; returns False if the upload no longer exists"""
+        try:
+            self._call(
+                'abort_multipart_upload',
+                Bucket=self.bucket_name,
+                Key=file_key,
+                UploadId=multipart_upload_id
+            )
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') == 'NoSuchUpload':
+                return False
+            raise Exception(f"Failed to abort multipart upload: {str(e)}")
+
+    def iter_object(self, file_key, chunk_size=1024 * 1024):
+        """Stream an object's bytes in chunks"""
+        try:
+            response = self._call('get_object', Bucket=self.bucket_name, Key=file_key)
+        except ClientError as e:
+            raise Exception(f"Failed to read object from S3: {str(e)}")
+        body = response['Body']
+        try:
+            yield from body.iter_chunks(chunk_size)
+        finally:
+            body.close()
+
+    def copy_object(self, source_key, file_key, content_type=None):
+        """Server-side copy within the bucket (objects up to 5GB)"""
+        if content_type:
+            metadata = {'ContentType': content_type, 'MetadataDirective': 'REPLACE'}
+        else:
+            metadata = {'MetadataDirective': 'COPY'}
+        try:
+            self._call(
+                'copy_object',
+                Bucket=self.bucket_name,
+                Key=file_key,
+                CopySource={'Bucket': self.bucket_name, 'Key': source_key},
+                ServerSideEncryption='AES256',
+                ChecksumAlgorithm='SHA256',
+                **metadata
+            )
+            return file_key
+        except ClientError as e:
+            raise Exception(f"Failed to copy object in S3: {str(e)}")
+
+    def iter_keys(self, prefix=''):
+        """Stream the bucket listing through the list_objects_v2 paginator, 1000 keys per page"""
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        pages = iter(paginator.paginate(
+            Bucket=self.bucket_name, Prefix=prefix, PaginationConfig={'PageSize': 1000}
+        ))
+        while True:
+            started = time.perf_counter()
+            try:
+                page = next(pages)
+            except StopIteration:
+                return
+            except ClientError as e:
+                s3_operation_errors.inc(operation='list_objects_v2', code=e.response.get('Error', {}).get('Code', 'Unknown'))
+                raise Exception(f"Failed to list S3 objects: {str(e)}")
+            finally:
+                s3_operation_duration.observe(time.perf_counter() - started, operation='list_objects_v2')
+            for obj in page.get('Contents', []):
+                yield obj['Key'], obj['Size'], obj['LastModified']
+
+    def generate_presigned_url(self, file_key, expiration=3600, file_name=None):
         """Generate a presigned URL for file download"""
+        params = {'Bucket': self.bucket_name, 'Key': file_key}
+        if file_name:
+            # Content-addressed keys carry no file name, so set it on the response
+            safe_name = file_name.replace('"', '')
+            params['ResponseContentDisposition'] = f'attachment; filename="{safe_name}"'
         try:
+            # Signed locally, like create_presigned_post
             response = self.s3_client.generate_presigned_url(
-                'get_object',
-                Params={'Bucket': self.bucket_name, 'Key': file_key},
+                ClientMethod='get_object',
+                Params=params,
                 ExpiresIn=expiration
             )
             return response
@@ -55,7 +347,76 @@ class S3Service:
     def delete_file(self, file_key):
         """Delete file from S3"""
         try:
-            self.s3_client.delete_object(Bucket=self.bucket_name, Key=file_key)
+            self._call('delete_object', Bucket=self.bucket_name, Key=file_key)
             return True
         except ClientError as e:
-            raise Exception(f"Failed to delete file from S3: {str(e)}")
\ No newline at end of file
+            raise Exception(f"Failed to delete file from S3: {str(e)}")
+
+    def delete_objects(self, file_keys):
+        """Delete up to DELETE_OBJECTS_BATCH_SIZE keys in one request; returns {key: error} for failures"""
+        file_keys = list(file_keys)
+        if len(file_keys) > DELETE_OBJECTS_BATCH_SIZE:
+            raise ValueError(f"delete_objects accepts at most {DELETE_OBJECTS_BATCH_SIZE} keys per call")
+        if not file_keys:
+            return {}
+        try:
+            response = self._call(
+                'delete_objects',
+                Bucket=self.bucket_name,
+                Delete={'Objects': [{'Key': key} for key in file_keys], 'Quiet': True},
+            )
+        except ClientError as e:
+            raise Exception(f"Failed to delete files from S3: {str(e)}")
+        # Quiet mode only lists the keys that could not be deleted
+        return {
+            error['Key']: f"{error.get('Code')}: {error.get('Message')}"
+            for error in response.get('Errors', [])
+        }
+
+class MockS3Service(StorageBackend):
+    """Stand-in used when S3 is not configured or unreachable; stores nothing"""
+    # Resumable uploads are staged in the local spool directory instead
+    supports_multipart = False
+
+    def upload_file(self, file_content, filename, content_type, patient_id, doctor_id):
+        # Generate a mock file key
+        return f"mock/patient_{patient_id}/doctor_{doctor_id}/{uuid.uuid4()}_{filename}"
+
+    def store_object(self, file_obj, content_sha256, content_type, prefix='reports'):
+        return content_key(content_sha256, prefix='mock')
+
+    def create_presigned_post(self, content_sha256, content_type, file_size, expiration=900, file_key=None):
+        # Nothing to upload to; clients fall back to POST /reports/upload
+        return None
+
+    def head_object(self, file_key):
+        return None
+
+    def iter_object(self, file_key, chunk_size=1024 * 1024):
+        raise Exception("Mock storage does not keep file contents")
+
+    def generate_presigned_url(self, file_key, expiration=3600, file_name=None):
+        # Return a mock download URL
+        return f"https://mock-s3-url.com/download/{file_key}?expires={expiration}"
+
+    def delete_file(self, file_key):
+        return True
+
+    def delete_objects(self, file_keys):
+        return {}
+
+    def copy_object(self, source_key, file_key, content_type=None):
+        return file_key
+
+    def iter_keys(self, prefix=''):
+        return iter(())
+
+
+def get_s3_service():
+    """Return the shared storage backend (kept for existing callers; see storage.get_storage)"""
+    return get_storage()
+
+
+def set_s3_service(service):
+    """Replace the shared storage backend (kept for existing callers; see storage.set_storage)"""
+    set_storage(service)
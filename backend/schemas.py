@@ -301,4 +301,29 @@ class MedicalSessionResponse(BaseModel):
     treatment_plans: List[dict] = []
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+# Direct-to-storage report upload schemas
+class ReportUploadInitiate(BaseModel):
+    patient_id: int
+    doctor_id: int
+    session_id: Optional[int] = None
+    file_name: str = Field(..., min_length=1, max_length=255)
+    content_type: str = Field(..., min_length=1, max_length=100)
+    file_size: int = Field(..., gt=0)
+    content_sha256: str = Field(..., pattern=r"^[0-9a-f]{64}$")  # Hex digest computed by the browser
+
+class ReportUploadComplete(ReportUploadInitiate):
+    # upload.file_key from /reports/upload/initiate: where the browser posted the file
+    upload_key: str = Field(..., pattern=r"^uploads/direct/[0-9a-f]{32}$")
+    shared_with: List[int] = []
+
+class ResumableUploadCreate(BaseModel):
+    patient_id: int
+    doctor_id: int
+    session_id: Optional[int] = None
+    file_name: str = Field(..., min_length=1, max_length=255)
+    content_type: str = Field(..., min_length=1, max_length=100)
+    file_size: int = Field(..., gt=0)
+    # Optional for large files; verified against the assembled file when given
+    content_sha256: Optional[str] = Field(None, pattern=r"^[0-9a-f]{64}$")
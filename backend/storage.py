@@ -0,0 +1,143 @@
+"""
+Report storage backends.
+
+Every backend implements StorageBackend; STORAGE_BACKEND selects one:
+
+- "s3" (default): S3Service, falling back to MockS3Service when the client
+  can't be created
+- "local": LocalDiskStorage, files on disk under LOCAL_STORAGE_DIR (on-prem)
+- "mock": MockS3Service, stores nothing (development only)
+
+Run `python -m backend.storage_conformance` to check a configured backend.
+"""
+import hashlib
+import io
+import os
+import threading
+
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 's3').lower()
+# Most keys one delete_objects call takes (the S3 DeleteObjects limit)
+DELETE_OBJECTS_BATCH_SIZE = 1000
+
+
+def content_key(content_sha256, prefix='reports'):
+    """Content-addressed object key: identical files map to the same object"""
+    return f"{prefix}/sha256/{content_sha256[:2]}/{content_sha256[2:4]}/{content_sha256}"
+
+
+def key_content_hash(file_key):
+    """The SHA-256 a content_key() was built from, or None for other keys"""
+    parts = file_key.split('/')
+    if len(parts) >= 5 and parts[-4] == 'sha256' and len(parts[-1]) == 64 and parts[-1].startswith(parts[-3] + parts[-2]):
+        return parts[-1]
+    return None
+
+
+class StorageBackend:
+    """
+    Operations the application needs from report storage.
+
+    Keys are opaque strings such as content_key(); objects are immutable once
+    stored. Failures raise Exception with a readable message, like S3Service.
+    """
+    # True if resumable uploads can stage chunks in the backend itself
+    # (create/upload_part/complete/abort_multipart_upload); otherwise they are
+    # spooled on local disk and passed to store_object on finalize
+    supports_multipart = False
+
+    def store_object(self, file_obj, content_sha256, content_type, prefix='reports'):
+        """Store a file object under content_key(content_sha256, prefix) and return the key"""
+        raise NotImplementedError
+
+    def head_object(self, file_key):
+        """{'file_size', 'content_type', 'checksum_sha256'} or None if the object doesn't exist"""
+        raise NotImplementedError
+
+    def iter_object(self, file_key, chunk_size=1024 * 1024):
+        """Yield the object's bytes in chunks"""
+        raise NotImplementedError
+
+    def delete_file(self, file_key):
+        """Delete an object; returns True"""
+        raise NotImplementedError
+
+    def delete_objects(self, file_keys):
+        """Delete many objects; returns {key: error message} for the ones that failed"""
+        failed = {}
+        for file_key in file_keys:
+            try:
+                self.delete_file(file_key)
+            except Exception as e:
+                failed[file_key] = str(e)
+        return failed
+
+    def copy_object(self, source_key, file_key, content_type=None):
+        """Copy an object to another key (keeping its content type unless one is given); returns the new key"""
+        raise NotImplementedError
+
+    def iter_keys(self, prefix=''):
+        """
+        Yield (key, size, last_modified) for every object under prefix.
+
+        Keys come in ascending order of their UTF-8 bytes (the order S3 lists
+        them in), which storage_reconcile relies on to merge them with the
+        database. last_modified is a timezone-aware UTC datetime.
+        """
+        raise NotImplementedError
+
+    def generate_presigned_url(self, file_key, expiration=3600, file_name=None):
+        """Time-limited download URL for an object"""
+        raise NotImplementedError
+
+    def create_presigned_post(self, content_sha256, content_type, file_size, expiration=900, file_key=None):
+        """
+        Browser upload target ({'url', 'fields', 'file_key'}) for file_key
+        (default: content_key), or None if uploads must go through the API
+        """
+        return None
+
+    def upload_file(self, file_content, file_name, content_type, patient_id, doctor_id):
+        """Store raw bytes (used by /test-upload) and return the key"""
+        content_sha256 = hashlib.sha256(file_content).hexdigest()
+        return self.store_object(io.BytesIO(file_content), content_sha256, content_type)
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def _create_storage():
+    if STORAGE_BACKEND == 'local':
+        from .local_storage import LocalDiskStorage
+        storage = LocalDiskStorage()
+        print(f"✅ Local disk storage at {storage.root}")
+        return storage
+
+    from .s3_service import S3Service, MockS3Service
+    if STORAGE_BACKEND == 'mock':
+        print("⚠️  Mock storage configured; uploaded files are not kept")
+        return MockS3Service()
+    try:
+        storage = S3Service()
+        print("✅ S3 service initialized successfully")
+        return storage
+    except Exception as e:
+        print(f"⚠️  S3 service failed, using mock service: {e}")
+        return MockS3Service()
+
+
+def get_storage():
+    """Return the shared storage backend, creating it on first use"""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = _create_storage()
+    return _storage
+
+
+def set_storage(storage):
+    """Replace the shared storage backend (benchmarks, conformance checks)"""
+    global _storage
+    with _storage_lock:
+        _storage = storage
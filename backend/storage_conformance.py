@@ -0,0 +1,189 @@
+"""
+Conformance checks for storage backends.
+
+Runs the same checks against whichever backend is configured (or the one
+named with --backend), so an on-prem local-disk setup can be verified the
+same way as S3:
+
+    python -m backend.storage_conformance
+    STORAGE_BACKEND=local LOCAL_STORAGE_DIR=/srv/curanet python -m backend.storage_conformance
+    python -m backend.storage_conformance --backend local --root /tmp/curanet-check
+
+Every check writes random content and deletes it again.
+"""
+import argparse
+import base64
+import hashlib
+import io
+import os
+import sys
+import tempfile
+
+from .storage import content_key, get_storage
+
+MIB = 1024 * 1024
+
+
+def _store(storage, data, content_type="application/octet-stream"):
+    return storage.store_object(io.BytesIO(data), hashlib.sha256(data).hexdigest(), content_type)
+
+
+def _read(storage, file_key):
+    return b"".join(storage.iter_object(file_key))
+
+
+def check_store_and_read(storage):
+    data = os.urandom(3 * MIB + 17)
+    file_key = _store(storage, data, "application/pdf")
+    try:
+        assert file_key == content_key(hashlib.sha256(data).hexdigest()), f"unexpected key {file_key}"
+        head = storage.head_object(file_key)
+        assert head is not None, "stored object not found"
+        assert head["file_size"] == len(data), f"size {head['file_size']} != {len(data)}"
+        assert head["content_type"] == "application/pdf", f"content type {head['content_type']}"
+        if head["checksum_sha256"]:
+            expected = base64.b64encode(hashlib.sha256(data).digest()).decode("ascii")
+            assert head["checksum_sha256"] == expected, "stored checksum differs"
+        assert _read(storage, file_key) == data, "read back different bytes"
+    finally:
+        storage.delete_file(file_key)
+
+
+def check_duplicate_store(storage):
+    data = os.urandom(64 * 1024)
+    first = _store(storage, data)
+    try:
+        assert _store(storage, data) == first, "same content stored under a different key"
+        assert _read(storage, first) == data, "content changed after storing it twice"
+    finally:
+        storage.delete_file(first)
+
+
+def check_missing_object(storage):
+    file_key = content_key(hashlib.sha256(os.urandom(32)).hexdigest())
+    assert storage.head_object(file_key) is None, "head_object of a missing key is not None"
+
+
+def check_checksum_mismatch_rejected(storage):
+    data = os.urandom(1024)
+    wrong = hashlib.sha256(data + b"tampered").hexdigest()
+    try:
+        storage.store_object(io.BytesIO(data), wrong, "text/plain")
+    except Exception:
+        return
+    storage.delete_file(content_key(wrong))
+    raise AssertionError("bytes not matching the announced SHA-256 were accepted")
+
+
+def check_delete(storage):
+    file_key = _store(storage, os.urandom(2048))
+    assert storage.delete_file(file_key) is True, "delete_file did not return True"
+    assert storage.head_object(file_key) is None, "object still present after delete"
+    storage.delete_file(file_key)  # deleting twice is not an error
+
+
+def check_download_url(storage):
+    """The download URL serves the object, including HTTP Range requests"""
+    import httpx
+
+    data = os.urandom(256 * 1024)
+    file_key = _store(storage, data, "image/png")
+    try:
+        url = storage.generate_presigned_url(file_key, expiration=60, file_name="scan.png")
+        if url.startswith("/"):
+            # Served by the API itself (local storage)
+            from fastapi.testclient import TestClient
+            from .main import app
+            client = TestClient(app)
+        else:
+            client = httpx.Client(timeout=30)
+        full = client.get(url)
+        assert full.status_code == 200, f"download returned {full.status_code}"
+        assert full.content == data, "download returned different bytes"
+        partial = client.get(url, headers={"Range": "bytes=100-199"})
+        assert partial.status_code == 206, f"range request returned {partial.status_code}"
+        assert partial.content == data[100:200], "range request returned the wrong bytes"
+        tampered = client.get(url.replace("signature=", "signature=0")) if "signature=" in url else None
+        if tampered is not None:
+            assert tampered.status_code == 403, f"tampered URL returned {tampered.status_code}"
+    finally:
+        storage.delete_file(file_key)
+
+
+def check_multipart(storage):
+    """Chunk staging used by resumable uploads, for backends that support it"""
+    if not storage.supports_multipart:
+        return "skipped (chunks are spooled locally)"
+    parts_data = [os.urandom(5 * MIB), os.urandom(MIB)]
+    staging_key = f"uploads/staging/conformance-{os.urandom(8).hex()}"
+    upload_id = storage.create_multipart_upload(staging_key, "application/octet-stream")
+    try:
+        parts = []
+        for number, part in enumerate(parts_data, start=1):
+            sha = hashlib.sha256(part).hexdigest()
+            etag = storage.upload_part(staging_key, upload_id, number, part, sha)
+            parts.append({
+                "PartNumber": number,
+                "ETag": etag,
+                "ChecksumSHA256": base64.b64encode(bytes.fromhex(sha)).decode("ascii"),
+            })
+        storage.complete_multipart_upload(staging_key, upload_id, parts)
+        assert _read(storage, staging_key) == b"".join(parts_data), "assembled object differs"
+    except Exception:
+        storage.abort_multipart_upload(staging_key, upload_id)
+        raise
+    finally:
+        storage.delete_file(staging_key)
+
+
+CHECKS = [
+    check_store_and_read,
+    check_duplicate_store,
+    check_missing_object,
+    check_checksum_mismatch_rejected,
+    check_delete,
+    check_download_url,
+    check_multipart,
+]
+
+
+def run(storage):
+    """Run every check; returns the number of failures"""
+    failures = 0
+    print(f"Storage backend: {type(storage).__name__}")
+    for check in CHECKS:
+        name = check.__name__[len("check_"):]
+        try:
+            note = check(storage)
+            print(f"✅ {name}" + (f" — {note}" if note else ""))
+        except Exception as e:
+            failures += 1
+            print(f"❌ {name}: {type(e).__name__}: {e}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=("configured", "local", "s3"), default="configured")
+    parser.add_argument("--root", help="directory for --backend local (default: a temporary directory)")
+    args = parser.parse_args()
+
+    from .storage import set_storage
+    if args.backend == "local":
+        from .local_storage import LocalDiskStorage
+        storage = LocalDiskStorage(args.root or tempfile.mkdtemp(prefix="curanet-storage-"))
+        set_storage(storage)
+    elif args.backend == "s3":
+        from .s3_service import S3Service
+        storage = S3Service()
+        set_storage(storage)
+    else:
+        storage = get_storage()
+
+    failures = run(storage)
+    print(f"\n{len(CHECKS) - failures}/{len(CHECKS)} checks passed")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+"""
+Reconcile report storage with the medical_reports table.
+
+Finds objects no report references (e.g. an upload whose database insert
+failed) and reports whose object is gone (e.g. deleted out of band), for
+report files under reports/ and their thumbnails under thumbnails/:
+
+    python -m backend.storage_reconcile                      # report only
+    python -m backend.storage_reconcile --orphans quarantine # move orphans to quarantine/
+    python -m backend.storage_reconcile --orphans delete --restore-missing
+    python -m backend.storage_reconcile --output diff.ndjson
+
+Both sides are streamed in the same order and merge-diffed, so memory stays
+flat for millions of objects: the storage listing (S3 list_objects_v2
+paginator, 1000 keys a page, fetched ahead in a background thread) and
+the file_key and thumbnail_key columns (UNION ALL, ORDER BY CAST(... AS
+BINARY)) through a server-side cursor. Keys are compared as UTF-8 bytes, the order S3 lists them in; the
+binary cast keeps MySQL's case-insensitive collation from reordering them.
+
+Objects modified within --min-age-minutes are never treated as orphans:
+uploads store the object before inserting the row, and direct uploads
+only get their row once the browser calls /reports/upload/complete.
+Orphans are deleted in batches under medical_reports.lock_content, after
+a locking re-check of the references, like delete_report does.
+"""
+import argparse
+import json
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import LargeBinary, cast, select, union_all
+
+from . import models
+from . import report_processing
+from .crud import medical_reports
+from .database import SessionLocal
+from .storage import DELETE_OBJECTS_BATCH_SIZE, get_storage, key_content_hash
+
+QUARANTINE_PREFIX = "quarantine/"
+# Report files and their thumbnails
+RECONCILE_PREFIXES = ("reports/", f"{report_processing.THUMBNAIL_PREFIX}/")
+DB_BATCH_SIZE = 5000
+# Storage pages buffered ahead of the merge
+LISTING_PREFETCH_ITEMS = 10000
+PROGRESS_INTERVAL_SECONDS = 10
+
+_END = object()
+
+
+class OrderError(Exception):
+    """A side did not come back in ascending byte order; the diff would be wrong"""
+
+
+def _prefetch(iterable, batch_size=1000):
+    """Iterate in a background thread so storage listing overlaps the database reads"""
+    # Items cross the queue in batches; a queue operation per key would cost more than the merge
+    batches = queue.Queue(maxsize=max(1, LISTING_PREFETCH_ITEMS // batch_size))
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            batch = []
+            for item in iterable:
+                batch.append(item)
+                if len(batch) >= batch_size:
+                    if not put(batch):
+                        return
+                    batch = []
+            if batch and not put(batch):
+                return
+            put(_END)
+        except Exception as e:
+            put(e)
+
+    threading.Thread(target=produce, name="curanet-reconcile-listing", daemon=True).start()
+    try:
+        while True:
+            batch = batches.get()
+            if batch is _END:
+                return
+            if isinstance(batch, Exception):
+                raise batch
+            yield from batch
+    finally:
+        stop.set()
+
+
+def iter_report_keys(db, prefix=""):
+    """Yield (key, report_count, [report_ids]) for distinct file and thumbnail keys in byte order"""
+    Report = models.MedicalReport
+    # Reports still in the upload spool have no object yet by design
+    files = select(Report.file_key.label("file_key"), Report.report_id).where(Report.storage_status == "stored")
+    thumbnails = select(Report.thumbnail_key.label("file_key"), Report.report_id).where(Report.thumbnail_key.isnot(None))
+    if prefix:
+        pattern = prefix.replace("%", r"\%").replace("_", r"\_") + "%"
+        files = files.where(Report.file_key.like(pattern, escape="\\"))
+        thumbnails = thumbnails.where(Report.thumbnail_key.like(pattern, escape="\\"))
+    keys = union_all(files, thumbnails).subquery()
+    statement = select(keys.c.file_key, keys.c.report_id).order_by(cast(keys.c.file_key, LargeBinary), keys.c.report_id)
+    result = db.execute(statement.execution_options(yield_per=DB_BATCH_SIZE))
+    try:
+        current, report_ids = None, []
+        for row in result:
+            if row.file_key != current:
+                if current is not None:
+                    yield current, len(report_ids), report_ids[:10]
+                current, report_ids = row.file_key, []
+            report_ids.append(row.report_id)
+        if current is not None:
+            yield current, len(report_ids), report_ids[:10]
+    finally:
+        result.close()
+
+
+def _keyed(items, side):
+    """Pair items with their key as UTF-8 bytes, checking the keys strictly ascend"""
+    previous = b""
+    for item in items:
+        key = item[0].encode("utf-8")
+        if key <= previous and previous:
+            raise OrderError(f"{side} keys out of order at {item[0]!r}; is the listing sorted by bytes?")
+        previous = key
+        yield key, item
+
+
+def merge_diff(storage_items, db_items):
+    """
+    Merge two key-ordered streams.
+
+    Yields ("orphan", storage_item) for objects without reports,
+    ("missing", db_item) for reports without objects and ("match", None) for
+    keys present on both sides.
+    """
+    storage_items = _keyed(storage_items, "storage")
+    db_items = _keyed(db_items, "database")
+    stored_key, stored = next(storage_items, (None, None))
+    recorded_key, recorded = next(db_items, (None, None))
+    while stored is not None or recorded is not None:
+        if recorded is None or (stored is not None and stored_key < recorded_key):
+            yield "orphan", stored
+            stored_key, stored = next(storage_items, (None, None))
+        elif stored is None or recorded_key < stored_key:
+            yield "missing", recorded
+            recorded_key, recorded = next(db_items, (None, None))
+        else:
+            yield "match", None
+            stored_key, stored = next(storage_items, (None, None))
+            recorded_key, recorded = next(db_items, (None, None))
+
+
+class Reconciliation:
+    """Counters, throughput and the actions taken on discrepancies"""
+
+    def __init__(self, storage, db, orphans="report", restore_missing=False, min_age_minutes=60, output=None):
+        self.storage = storage
+        self.db = db
+        self.orphan_action = orphans
+        self.restore_missing = restore_missing
+        self.cutoff = datetime.now(timezone.utc) - timedelta(minutes=min_age_minutes)
+        self.output = output
+        self.counts = {
+            "objects": 0, "reports_keys": 0, "matched": 0,
+            "orphans": 0, "orphan_bytes": 0, "too_recent": 0,
+            "missing": 0, "missing_reports": 0,
+            "deleted": 0, "quarantined": 0, "restored": 0, "action_failures": 0,
+        }
+        self._to_delete = []
+        self.started = time.perf_counter()
+        self._last_progress = self.started
+
+    def _record(self, kind, **fields):
+        if self.output:
+            self.output.write(json.dumps(dict(fields, kind=kind), default=str) + "\n")
+
+    def _flush_deletes(self, force=False):
+        while self._to_delete and (force or len(self._to_delete) >= DELETE_OBJECTS_BATCH_SIZE):
+            batch = self._to_delete[:DELETE_OBJECTS_BATCH_SIZE]
+            self._to_delete = self._to_delete[DELETE_OBJECTS_BATCH_SIZE:]
+            # Like delete_report: uploads reusing the content wait until the objects are gone,
+            # and the locking re-check sees reports created for it since it was listed
+            try:
+                for content_sha256 in sorted({key_content_hash(key) for key in batch} - {None}):
+                    medical_reports.lock_content(self.db, content_sha256)
+                still_used = medical_reports.referenced_keys(self.db, batch, lock=True)
+                batch = [key for key in batch if key not in still_used]
+                try:
+                    failed = self.storage.delete_objects(batch) if batch else {}
+                except Exception as e:
+                    failed = {key: str(e) for key in batch}
+                self.db.commit()
+            except Exception:
+                self.db.rollback()
+                raise
+            for key, error in failed.items():
+                print(f"⚠️  Could not delete {key}: {error}")
+            done = len(batch) - len(failed)
+            self.counts["action_failures"] += len(failed)
+            if self.orphan_action == "quarantine":
+                self.counts["quarantined"] += done
+            else:
+                self.counts["deleted"] += done
+
+    def orphan(self, file_key, size, last_modified):
+        if last_modified > self.cutoff:
+            self.counts["too_recent"] += 1
+            return
+        self.counts["orphans"] += 1
+        self.counts["orphan_bytes"] += size
+        self._record("orphan", file_key=file_key, size=size, last_modified=last_modified)
+        if self.orphan_action == "quarantine":
+            try:
+                self.storage.copy_object(file_key, QUARANTINE_PREFIX + file_key)
+            except Exception as e:
+                print(f"⚠️  Could not quarantine {file_key}: {e}")
+                self.counts["action_failures"] += 1
+                return
+        if self.orphan_action in ("quarantine", "delete"):
+            self._to_delete.append(file_key)
+            self._flush_deletes()
+
+    def missing(self, file_key, report_count, report_ids):
+        self.counts["missing"] += 1
+        self.counts["missing_reports"] += report_count
+        restored = False
+        if self.restore_missing:
+            try:
+                if self.storage.head_object(QUARANTINE_PREFIX + file_key):
+                    self.storage.copy_object(QUARANTINE_PREFIX + file_key, file_key)
+                    self.counts["restored"] += 1
+                    restored = True
+            except Exception as e:
+                print(f"⚠️  Could not restore {file_key} from quarantine: {e}")
+                self.counts["action_failures"] += 1
+        self._record("missing", file_key=file_key, report_count=report_count,
+                     report_ids=report_ids, restored=restored)
+
+    def progress(self, final=False):
+        now = time.perf_counter()
+        if not final and now - self._last_progress < PROGRESS_INTERVAL_SECONDS:
+            return
+        self._last_progress = now
+        elapsed = max(now - self.started, 1e-9)
+        c = self.counts
+        print(f"{'✅ Done' if final else '…'} {c['objects']} objects ({c['objects'] / elapsed:,.0f}/s), "
+              f"{c['reports_keys']} report keys ({c['reports_keys'] / elapsed:,.0f}/s) in {elapsed:.1f}s: "
+              f"{c['matched']} matched, {c['orphans']} orphaned ({c['orphan_bytes'] / 1024 ** 2:,.1f} MB), "
+              f"{c['missing']} missing objects ({c['missing_reports']} reports)")
+
+    def run(self, storage_items, db_items):
+        counts = self.counts
+        for kind, item in merge_diff(storage_items, db_items):
+            if kind == "match":
+                counts["matched"] += 1
+                counts["objects"] += 1
+                counts["reports_keys"] += 1
+                if counts["matched"] % 10000 == 0:
+                    self.progress()
+                continue
+            if kind == "orphan":
+                counts["objects"] += 1
+                self.orphan(*item)
+            else:
+                counts["reports_keys"] += 1
+                self.missing(*item)
+            self.progress()
+
+    def finish(self):
+        self._flush_deletes(force=True)
+        self.progress(final=True)
+        return self.counts
+
+
+def reconcile(prefixes=RECONCILE_PREFIXES, orphans="report", restore_missing=False, min_age_minutes=60,
+              output=None, storage=None, session_factory=SessionLocal):
+    """Diff storage under each prefix against medical_reports and act on the differences; returns the counts"""
+    storage = storage or get_storage()
+    # The streaming cursor holds its connection; re-checks before deleting use a second one
+    stream_db = session_factory()
+    check_db = session_factory()
+    try:
+        reconciliation = Reconciliation(storage, check_db, orphans, restore_missing, min_age_minutes, output)
+        for prefix in prefixes:
+            reconciliation.run(_prefetch(storage.iter_keys(prefix)), iter_report_keys(stream_db, prefix))
+        return reconciliation.finish()
+    finally:
+        check_db.close()
+        stream_db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prefix", action="append", dest="prefixes",
+                        help=f"only reconcile keys under this prefix, may be repeated "
+                             f"(default: {' and '.join(RECONCILE_PREFIXES)})")
+    parser.add_argument("--orphans", choices=("report", "quarantine", "delete"), default="report",
+                        help="what to do with objects no report references (default: only report them)")
+    parser.add_argument("--restore-missing", action="store_true",
+                        help=f"copy objects of reports whose object is missing back from {QUARANTINE_PREFIX}")
+    parser.add_argument("--min-age-minutes", type=float, default=60,
+                        help="ignore objects modified more recently than this (uploads in flight)")
+    parser.add_argument("--output", help="write every discrepancy as NDJSON to this file")
+    args = parser.parse_args()
+
+    prefixes = args.prefixes or RECONCILE_PREFIXES
+    if any(prefix.startswith(QUARANTINE_PREFIX) for prefix in prefixes):
+        parser.error("the quarantine prefix can't be reconciled against reports")
+
+    output = open(args.output, "w") if args.output else None
+    try:
+        counts = reconcile(prefixes, args.orphans, args.restore_missing, args.min_age_minutes, output)
+    except OrderError as e:
+        print(f"❌ {e}")
+        sys.exit(2)
+    finally:
+        if output:
+            output.close()
+    print(json.dumps(counts, indent=2))
+    sys.exit(1 if counts["missing"] > counts["restored"] or counts["action_failures"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+"""
+Durable upload spool for when remote storage is slow or down.
+
+If storing a report upload fails, or the circuit breaker says storage is
+down, the file is written to the spool instead: a LocalDiskStorage under
+STORAGE_SPOOL_DIR (fsynced, atomically renamed, verified against its
+SHA-256). The report row is committed with storage_status
+"pending_storage" and the doctor gets an immediate answer.
+
+A drainer thread in every worker uploads spooled files to storage with
+exponential backoff per file. It marks the rows "stored" and only then
+removes the spooled copy. Until that happens, downloads are served from the
+spool (GET /storage/spool/{key}).
+
+The circuit breaker opens after UPLOAD_SPOOL_BREAKER_FAILURES consecutive
+storage failures. While it is open, uploads go straight to the spool
+without waiting on S3 retries. After UPLOAD_SPOOL_BREAKER_RESET_SECONDS a
+single probe (an upload or a drain attempt) decides whether it closes again.
+
+With several app servers, STORAGE_SPOOL_DIR must be shared between them
+(like LOCAL_STORAGE_DIR): a pending report's bytes live where it was spooled.
+"""
+import fcntl
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.orm import Session
+
+from . import deadlines
+from . import metrics
+from . import models
+from .database import SessionLocal
+from .local_storage import BASE_DIR, LocalDiskStorage
+from .storage import get_storage
+
+STORED = "stored"
+PENDING_STORAGE = "pending_storage"
+
+UPLOAD_SPOOL_ENABLED = os.getenv('UPLOAD_SPOOL_ENABLED', 'true').lower() in ('1', 'true', 'yes', 'on')
+STORAGE_SPOOL_DIR = os.getenv('STORAGE_SPOOL_DIR', os.path.join(BASE_DIR, 'spool'))
+UPLOAD_SPOOL_DRAIN_INTERVAL_SECONDS = float(os.getenv('UPLOAD_SPOOL_DRAIN_INTERVAL_SECONDS', '5'))
+UPLOAD_SPOOL_DRAIN_BATCH = int(os.getenv('UPLOAD_SPOOL_DRAIN_BATCH', '50'))
+UPLOAD_SPOOL_MAX_BACKOFF_SECONDS = float(os.getenv('UPLOAD_SPOOL_MAX_BACKOFF_SECONDS', '300'))
+UPLOAD_SPOOL_BREAKER_FAILURES = int(os.getenv('UPLOAD_SPOOL_BREAKER_FAILURES', '5'))
+UPLOAD_SPOOL_BREAKER_RESET_SECONDS = float(os.getenv('UPLOAD_SPOOL_BREAKER_RESET_SECONDS', '30'))
+# Spooled files no pending report refers to (report deleted, row never committed) are removed after this
+UPLOAD_SPOOL_ORPHAN_HOURS = float(os.getenv('UPLOAD_SPOOL_ORPHAN_HOURS', '24'))
+SPOOL_DOWNLOAD_PATH = '/storage/spool/'
+
+spool_events = metrics.registry.counter(
+    "curanet_upload_spool_events_total",
+    "Uploads spooled, drained to storage, and failed drain attempts",
+    ("event",),
+)
+breaker_state = metrics.registry.gauge(
+    "curanet_storage_circuit_open",
+    "1 while the storage circuit breaker is open (uploads are spooled)",
+)
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open -> one half-open probe -> closed/open"""
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if self._probing or time.monotonic() - self._opened_at >= self.reset_seconds:
+                return "half_open"
+            return "open"
+
+    def allow(self) -> bool:
+        """Whether to call storage now; after the cool-down one caller gets through as the probe"""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._probing or time.monotonic() - self._opened_at < self.reset_seconds:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+        breaker_state.set(0)
+
+    def record_inconclusive(self):
+        """The call ended without telling whether storage works; a later caller probes instead"""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    print(f"⚠️  Storage circuit opened after {self._failures} failures; spooling uploads")
+                self._opened_at = time.monotonic()
+                self._probing = False
+        if self._opened_at is not None:
+            breaker_state.set(1)
+
+
+breaker = CircuitBreaker(UPLOAD_SPOOL_BREAKER_FAILURES, UPLOAD_SPOOL_BREAKER_RESET_SECONDS)
+
+_spool = None
+_spool_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    # Spooling to local disk in front of local-disk storage would gain nothing
+    return UPLOAD_SPOOL_ENABLED and not isinstance(get_storage(), LocalDiskStorage)
+
+
+def get_spool() -> LocalDiskStorage:
+    global _spool
+    if _spool is None:
+        with _spool_lock:
+            if _spool is None:
+                _spool = LocalDiskStorage(STORAGE_SPOOL_DIR, download_path=SPOOL_DOWNLOAD_PATH)
+    return _spool
+
+
+def spool_upload(file_obj, content_sha256: str, content_type: str) -> str:
+    """Write an upload durably to the spool; returns its (content-addressed) key"""
+    file_obj.seek(0)
+    file_key = get_spool().store_object(file_obj, content_sha256, content_type)
+    spool_events.inc(event="spooled")
+    return file_key
+
+
+def store_or_spool(file_obj, content_sha256: str, content_type: str):
+    """
+    Store an upload, falling back to the spool.
+
+    Returns (file_key, storage_status). Raises if storage fails and spooling
+    is disabled.
+    """
+    if enabled() and not breaker.allow():
+        return spool_upload(file_obj, content_sha256, content_type), PENDING_STORAGE
+    try:
+        file_key = get_storage().store_object(file_obj, content_sha256, content_type)
+    except deadlines.DeadlineExceeded:
+        # The request ran out of time (including timeouts cut short to fit it); storage didn't fail
+        breaker.record_inconclusive()
+        raise
+    except Exception as e:
+        breaker.record_failure()
+        if not enabled():
+            raise
+        print(f"⚠️  Storage failed ({e}); spooling upload {content_sha256}")
+        return spool_upload(file_obj, content_sha256, content_type), PENDING_STORAGE
+    breaker.record_success()
+    return file_key, STORED
+
+
+def is_spooled(file_key: str) -> bool:
+    return get_spool().locate(file_key) is not None
+
+
+def iter_object(file_key: str, chunk_size: int = 1024 * 1024):
+    """Read an object from the spool if it is still there, otherwise from storage"""
+    if is_spooled(file_key):
+        try:
+            yield from get_spool().iter_object(file_key, chunk_size)
+            return
+        except Exception:
+            # Drained and removed between the check and the read
+            pass
+    yield from get_storage().iter_object(file_key, chunk_size)
+
+
+def download_url(file_key: str, file_name: str = None, expiration: int = 3600) -> str:
+    """Download URL: the spooled copy while the object hasn't reached storage, else storage's"""
+    if is_spooled(file_key):
+        return get_spool().generate_presigned_url(file_key, expiration=expiration, file_name=file_name)
+    return get_storage().generate_presigned_url(file_key, expiration=expiration, file_name=file_name)
+
+
+def discard(file_key: str):
+    """Drop a spooled copy, e.g. after its last report was deleted"""
+    get_spool().delete_file(file_key)
+
+
+def mark_stored(db: Session, file_key: str) -> int:
+    updated = db.query(models.MedicalReport).filter(
+        models.MedicalReport.file_key == file_key,
+        models.MedicalReport.storage_status == PENDING_STORAGE,
+    ).update({"storage_status": STORED}, synchronize_session=False)
+    db.commit()
+    return updated
+
+
+# file_key -> (failed attempts, monotonic time of the next attempt); per worker
+_backoff = {}
+
+
+def _schedule_retry(file_key: str):
+    attempts = _backoff.get(file_key, (0, 0))[0] + 1
+    delay = min(UPLOAD_SPOOL_MAX_BACKOFF_SECONDS, UPLOAD_SPOOL_DRAIN_INTERVAL_SECONDS * 2 ** attempts)
+    _backoff[file_key] = (attempts, time.monotonic() + delay * random.uniform(0.5, 1.0))
+
+
+def _drain_one(db: Session, file_key: str) -> bool:
+    spool = get_spool()
+    storage = get_storage()
+    located = spool.locate(file_key)
+    if located is None:
+        # Spooled on a server without a shared spool, or drained by another worker
+        if storage.head_object(file_key):
+            mark_stored(db, file_key)
+            return True
+        return False
+
+    path, meta = located
+    try:
+        spooled = open(path, 'rb')
+    except FileNotFoundError:
+        return False
+    with spooled:
+        try:
+            # Workers sharing the spool don't upload the same file at the same time
+            fcntl.flock(spooled.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        storage.store_object(spooled, meta['content_sha256'], meta.get('content_type') or 'application/octet-stream')
+    mark_stored(db, file_key)
+    spool.delete_file(file_key)
+    return True
+
+
+def drain(db: Session, limit: int = UPLOAD_SPOOL_DRAIN_BATCH) -> int:
+    """Upload pending spooled files to storage; returns how many landed"""
+    pending = [row.file_key for row in db.query(models.MedicalReport.file_key).filter(
+        models.MedicalReport.storage_status == PENDING_STORAGE
+    ).distinct().limit(limit).all()]
+
+    drained = 0
+    now = time.monotonic()
+    for file_key in pending:
+        if _backoff.get(file_key, (0, 0))[1] > now:
+            continue
+        if not breaker.allow():
+            break
+        try:
+            landed = _drain_one(db, file_key)
+        except Exception as e:
+            db.rollback()
+            breaker.record_failure()
+            spool_events.inc(event="drain_failed")
+            _schedule_retry(file_key)
+            print(f"⚠️  Spooled upload {file_key} not stored yet: {e}")
+            continue
+        breaker.record_success()
+        if landed:
+            _backoff.pop(file_key, None)
+            spool_events.inc(event="drained")
+            drained += 1
+    return drained
+
+
+def sweep_orphans(db: Session, max_age_hours: float = UPLOAD_SPOOL_ORPHAN_HOURS) -> int:
+    """Remove spooled files no pending report refers to any more"""
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=max_age_hours)
+    removed = 0
+    for file_key, _size, modified in get_spool().iter_keys():
+        if modified > cutoff:
+            continue
+        still_pending = db.query(models.MedicalReport.report_id).filter(
+            models.MedicalReport.file_key == file_key,
+            models.MedicalReport.storage_status == PENDING_STORAGE,
+        ).first()
+        if not still_pending:
+            discard(file_key)
+            removed += 1
+    return removed
+
+
+_drainer_started = threading.Event()
+_drainer_stop = threading.Event()
+# Orphan sweeps run once per this many drain passes
+_SWEEP_EVERY = 720
+
+
+def _run_drainer():
+    passes = 0
+    while not _drainer_stop.wait(UPLOAD_SPOOL_DRAIN_INTERVAL_SECONDS):
+        try:
+            db = SessionLocal()
+            try:
+                drained = drain(db)
+                passes += 1
+                if passes % _SWEEP_EVERY == 0:
+                    swept = sweep_orphans(db)
+                    if swept:
+                        print(f"🧹 Removed {swept} orphaned spooled upload(s)")
+            finally:
+                db.close()
+            if drained:
+                print(f"✅ Moved {drained} spooled upload(s) to storage")
+        except Exception as e:
+            print(f"⚠️  Upload spool drain failed: {e}")
+
+
+def start_drainer():
+    """Drain the spool periodically in a daemon thread (once per process)"""
+    if _drainer_started.is_set() or not UPLOAD_SPOOL_ENABLED:
+        return
+    _drainer_started.set()
+    threading.Thread(target=_run_drainer, name="curanet-spool-drainer", daemon=True).start()
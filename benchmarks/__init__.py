@@ -0,0 +1,9 @@
+"""
+Reproducible load benchmarks for the CuraNet API.
+
+    python -m benchmarks generate --doctors 50 --patients 2000 --seed 42
+    python -m benchmarks run --scenario all --concurrency 16 --requests 500
+    python -m benchmarks compare results/old.json results/new.json
+
+See benchmarks/README.md for details.
+"""
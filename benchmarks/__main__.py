@@ -0,0 +1,121 @@
+import argparse
+import asyncio
+import os
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from . import dataset, report  # noqa: E402
+
+DEFAULT_MANIFEST = os.path.join(ROOT_DIR, "benchmarks", "results", "dataset.json")
+
+
+def cmd_generate(args):
+    from backend.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        manifest = dataset.generate(
+            db,
+            doctors=args.doctors,
+            patients=args.patients,
+            appointments_per_patient=args.appointments_per_patient,
+            session_ratio=args.session_ratio,
+            children_per_session=args.children_per_session,
+            seed=args.seed,
+        )
+    finally:
+        db.close()
+    dataset.save_manifest(manifest, args.manifest)
+    print(f"✅ Generated dataset (seed {args.seed}): {manifest['counts']}")
+    print(f"Manifest written to {args.manifest}")
+
+
+async def _run(args, manifest):
+    from .runner import build_client, run_scenario
+    from .scenarios import SCENARIOS, ScenarioContext
+
+    names = list(SCENARIOS) if args.scenario == ["all"] else args.scenario
+    results = {}
+    async with build_client(args.target, s3_latency_ms=args.s3_latency_ms) as client:
+        for name in names:
+            ctx = ScenarioContext(manifest, seed=args.seed, upload_size=args.upload_kb * 1024)
+            print(f"Running {name}...")
+            results[name] = await run_scenario(
+                client, SCENARIOS[name], ctx,
+                requests=args.requests, concurrency=args.concurrency, warmup=args.warmup,
+            )
+    return results
+
+
+def cmd_run(args):
+    manifest = dataset.load_manifest(args.manifest)
+    results = asyncio.run(_run(args, manifest))
+    report.print_results(results)
+
+    options = {
+        "target": args.target,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "warmup": args.warmup,
+        "seed": args.seed,
+        "upload_kb": args.upload_kb,
+        "s3_latency_ms": args.s3_latency_ms,
+    }
+    output = args.output or os.path.join(ROOT_DIR, "benchmarks", "results", f"{report.git_revision()}.json")
+    report.write_report(report.build_report(results, options, manifest), output)
+    print(f"Results written to {output}")
+
+
+def cmd_compare(args):
+    baseline = report.load_report(args.baseline)
+    candidate = report.load_report(args.candidate)
+    regressions = report.compare(baseline, candidate, threshold=args.threshold)
+    if regressions:
+        print(f"❌ Regressions above {args.threshold}%: {', '.join(regressions)}")
+        sys.exit(1)
+    print("✅ No regressions above threshold")
+
+
+def main():
+    from .scenarios import SCENARIOS
+
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="CuraNet load benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    generate = subparsers.add_parser("generate", help="insert a seeded synthetic dataset")
+    generate.add_argument("--doctors", type=int, default=20)
+    generate.add_argument("--patients", type=int, default=500)
+    generate.add_argument("--appointments-per-patient", type=int, default=4)
+    generate.add_argument("--session-ratio", type=float, default=0.7)
+    generate.add_argument("--children-per-session", type=int, default=2)
+    generate.add_argument("--seed", type=int, default=42)
+    generate.add_argument("--manifest", default=DEFAULT_MANIFEST)
+    generate.set_defaults(func=cmd_generate)
+
+    run = subparsers.add_parser("run", help="run scenarios and write a result file")
+    run.add_argument("--scenario", nargs="+", default=["all"], choices=["all"] + list(SCENARIOS))
+    run.add_argument("--target", default="inprocess", help="'inprocess' or a base URL such as http://localhost:8000")
+    run.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    run.add_argument("--concurrency", type=int, default=8)
+    run.add_argument("--warmup", type=int, default=10)
+    run.add_argument("--seed", type=int, default=1, help="seed for request inputs")
+    run.add_argument("--upload-kb", type=int, default=256)
+    run.add_argument("--s3-latency-ms", type=float, default=0.0, help="simulated stub S3 latency (inprocess only)")
+    run.add_argument("--manifest", default=DEFAULT_MANIFEST)
+    run.add_argument("--output", help="result file (default benchmarks/results/<commit>.json)")
+    run.set_defaults(func=cmd_run)
+
+    compare = subparsers.add_parser("compare", help="compare two result files")
+    compare.add_argument("baseline")
+    compare.add_argument("candidate")
+    compare.add_argument("--threshold", type=float, default=10.0, help="allowed regression in percent")
+    compare.set_defaults(func=cmd_compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Load test: do cheap routes keep their latency while the heavy ones are overloaded?
+
+Runs the same mixed load twice in-process, first with admission control off
+and then on. Many workers hammer the expensive routes (complete history,
+admin appointment list, report upload) while a few workers call the cheap
+ones (login, doctor availability). Reports p50/p99 per route, the requests
+shed with 503, and the change in the cheap routes' p99.
+
+--query-latency-ms adds a simulated database round trip to every statement,
+so the heavy routes hold threads and pooled connections as long as they
+would against MySQL under load. Needs a dataset (python -m benchmarks generate).
+
+    python benchmarks/admission_load.py --duration 20 --heavy-concurrency 64
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import httpx
+
+from benchmarks import dataset
+from benchmarks.report import summarize
+from benchmarks.scenarios import SCENARIOS, ScenarioContext
+
+HEAVY = ("history", "admin_appointments", "report_upload")
+CHEAP = ("login", "availability")
+DEFAULT_MANIFEST = os.path.join(ROOT_DIR, "benchmarks", "results", "dataset.json")
+
+
+def add_query_latency(latency_ms: float):
+    from sqlalchemy import event
+    from backend.database import get_engine
+
+    if latency_ms <= 0:
+        return
+
+    @event.listens_for(get_engine(), "before_cursor_execute")
+    def simulated_round_trip(*_args):
+        time.sleep(latency_ms / 1000)
+
+
+async def drive(client, names, ctx, deadline, samples):
+    index = 0
+    while time.perf_counter() < deadline:
+        name = names[index % len(names)]
+        index += 1
+        started = time.perf_counter()
+        try:
+            status = (await SCENARIOS[name](client, ctx)).status_code
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        samples.setdefault(name, []).append((time.perf_counter() - started, status))
+
+
+async def run_mode(client, manifest, args):
+    samples = {}
+    deadline = time.perf_counter() + args.duration
+    workers = [
+        drive(client, HEAVY[i % len(HEAVY):] + HEAVY[:i % len(HEAVY)], ScenarioContext(manifest, seed=i), deadline, samples)
+        for i in range(args.heavy_concurrency)
+    ] + [
+        drive(client, CHEAP[i % len(CHEAP):] + CHEAP[:i % len(CHEAP)], ScenarioContext(manifest, seed=1000 + i), deadline, samples)
+        for i in range(args.cheap_concurrency)
+    ]
+    started = time.perf_counter()
+    await asyncio.gather(*workers)
+    wall = time.perf_counter() - started
+
+    results = {}
+    for name, values in samples.items():
+        ok = [latency for latency, status in values if status == 200]
+        result = summarize(ok, wall)
+        result["shed"] = sum(1 for _, status in values if status == 503)
+        result["errors"] = sum(1 for _, status in values if status not in (200, 503))
+        results[name] = result
+    return results
+
+
+def print_results(mode, results):
+    print(f"\nadmission control {mode}:")
+    print(f"  {'route':<20}{'ok':>7}{'shed':>7}{'errors':>7}{'p50 ms':>10}{'p99 ms':>10}")
+    for name in CHEAP + HEAVY:
+        r = results.get(name)
+        if r:
+            print(f"  {name:<20}{r['requests']:>7}{r['shed']:>7}{r['errors']:>7}{r['p50_ms']:>10.1f}{r['p99_ms']:>10.1f}")
+
+
+async def main_async(args):
+    from backend import admission
+    from benchmarks.runner import build_client
+
+    manifest = dataset.load_manifest(args.manifest)
+    add_query_latency(args.query_latency_ms)
+    by_mode = {}
+    async with build_client("inprocess", s3_latency_ms=args.s3_latency_ms, timeout=120) as client:
+        # Warm up the engine, pool and storage client
+        await SCENARIOS["login"](client, ScenarioContext(manifest))
+        for mode in ("off", "on"):
+            admission.ADMISSION_CONTROL_ENABLED = mode == "on"
+            by_mode[mode] = await run_mode(client, manifest, args)
+            print_results(mode, by_mode[mode])
+
+    print()
+    for name in CHEAP:
+        before, after = by_mode["off"].get(name), by_mode["on"].get(name)
+        if before and after and before["p99_ms"]:
+            change = (after["p99_ms"] - before["p99_ms"]) / before["p99_ms"] * 100
+            print(f"{name}: p99 {before['p99_ms']:.1f} ms -> {after['p99_ms']:.1f} ms ({change:+.0f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=15, help="seconds per mode")
+    parser.add_argument("--heavy-concurrency", type=int, default=48)
+    parser.add_argument("--cheap-concurrency", type=int, default=4)
+    parser.add_argument("--query-latency-ms", type=float, default=5.0)
+    parser.add_argument("--s3-latency-ms", type=float, default=50.0)
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Benchmark: a downstream consumer polling full dumps against the change feed.
+
+Generates a dataset, then runs --polls rounds. Each round writes --writes
+prescriptions through POST /medical-sessions/{id}/prescriptions (one
+insert event each) and polls twice:
+
+- dumps: GET /admin/appointments-list and GET /admin/patients-list, what
+  billing and analytics fetched and diffed before the feed
+- changes: GET /changes?since=<cursor>, paged until has_more is false
+
+and reports bytes, SQL statements and latency per poll, plus the latency
+and statements of the writes, outbox rows included. --query-latency-ms
+adds a simulated database round trip to every statement.
+
+    python benchmarks/change_feed.py --patients 2000 --polls 50 --writes 20
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from benchmarks import dataset
+from benchmarks.admission_load import add_query_latency
+from benchmarks.report import summarize
+
+
+def count_statements():
+    from sqlalchemy import event
+    from backend.database import get_engine
+
+    counter = {"statements": 0}
+
+    @event.listens_for(get_engine(), "before_cursor_execute")
+    def count(*_args):
+        counter["statements"] += 1
+
+    return counter
+
+
+class Mode:
+    def __init__(self):
+        self.latencies, self.bytes, self.statements = [], 0, 0
+
+    def result(self, wall):
+        result = summarize(self.latencies, wall)
+        result["kib_per_poll"] = round(self.bytes / len(self.latencies) / 1024, 1)
+        result["statements_per_poll"] = round(self.statements / len(self.latencies), 2)
+        return result
+
+
+async def main_async(args, session_ids, counter):
+    from benchmarks.runner import build_client
+
+    modes = {"dumps": Mode(), "changes": Mode()}
+    writes = Mode()
+    events = 0
+    async with build_client("inprocess", timeout=120) as client:
+        # Start from the newest seq, as a consumer would after its initial sync
+        since = (await client.get("/changes", params={"since": 0, "limit": 1})).json()["head"]
+
+        started = time.perf_counter()
+        for round_number in range(args.polls):
+            for index in range(args.writes):
+                session_id = session_ids[(round_number * args.writes + index) % len(session_ids)]
+                statements_before = counter["statements"]
+                request_started = time.perf_counter()
+                response = await client.post(f"/medical-sessions/{session_id}/prescriptions", json={
+                    "medication_name": "Paracetamol", "dosage": "500mg",
+                    "frequency": "Once daily", "duration": "3 days",
+                })
+                writes.latencies.append(time.perf_counter() - request_started)
+                writes.statements += counter["statements"] - statements_before
+                assert response.status_code == 200, response.status_code
+
+            statements_before = counter["statements"]
+            request_started = time.perf_counter()
+            for path in ("/admin/appointments-list", "/admin/patients-list"):
+                response = await client.get(path)
+                modes["dumps"].bytes += len(response.content)
+            modes["dumps"].latencies.append(time.perf_counter() - request_started)
+            modes["dumps"].statements += counter["statements"] - statements_before
+
+            statements_before = counter["statements"]
+            request_started = time.perf_counter()
+            received = 0
+            while True:
+                response = await client.get("/changes", params={"since": since})
+                page = response.json()
+                modes["changes"].bytes += len(response.content)
+                received += len(page["changes"])
+                since = page["next"]
+                if not page["has_more"]:
+                    break
+            modes["changes"].latencies.append(time.perf_counter() - request_started)
+            modes["changes"].statements += counter["statements"] - statements_before
+            events += received
+        wall = time.perf_counter() - started
+
+    results = {mode: timing.result(wall) for mode, timing in modes.items()}
+    results["changes"]["events_per_poll"] = round(events / args.polls, 1)
+    return results, writes.result(wall)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--patients", type=int, default=2000)
+    parser.add_argument("--appointments", type=int, default=6, help="appointments per patient")
+    parser.add_argument("--doctors", type=int, default=50)
+    parser.add_argument("--polls", type=int, default=50, help="consumer polls")
+    parser.add_argument("--writes", type=int, default=20, help="writes between two polls")
+    parser.add_argument("--query-latency-ms", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=13)
+    args = parser.parse_args()
+
+    from backend import models
+    from backend.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        manifest = dataset.generate(db, doctors=args.doctors, patients=args.patients,
+                                    appointments_per_patient=args.appointments, seed=args.seed)
+        patient_ids = [patient["id"] for patient in manifest["patients"]]
+        session_ids = [row[0] for row in db.query(models.MedicalSession.session_id)
+                       .filter(models.MedicalSession.patient_id.in_(patient_ids)).limit(500)]
+    finally:
+        db.close()
+    print(f"{manifest['counts']['patients']} patients, {manifest['counts']['appointments']} appointments; "
+          f"{args.writes} writes between polls")
+
+    add_query_latency(args.query_latency_ms)
+    counter = count_statements()
+    results, writes = asyncio.run(main_async(args, session_ids, counter))
+
+    print(f"\n{'mode':<10}{'KiB/poll':>10}{'SQL/poll':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for mode, r in results.items():
+        print(f"{mode:<10}{r['kib_per_poll']:>10}{r['statements_per_poll']:>10}{r['p50_ms']:>9.2f}"
+              f"{r['p95_ms']:>9.2f}{r['p99_ms']:>9.2f}")
+    print(f"{results['changes']['events_per_poll']} events per changes poll")
+    print(f"writes: {writes['statements_per_poll']} SQL, p50 {writes['p50_ms']:.2f} ms, p95 {writes['p95_ms']:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+Seeded synthetic hospital dataset.
+
+The same seed and sizes always produce the same rows, so results taken on
+different commits are comparable. Rows are bulk inserted with explicit
+primary keys (continuing after the current maximum) so child tables can
+reference their parents without a round trip per row.
+"""
+import json
+import os
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, select
+
+DEPARTMENTS = [
+    "Cardiology", "Neurology", "Orthopedics", "Pediatrics", "Dermatology",
+    "Oncology", "Radiology", "General Medicine", "ENT", "Gynecology",
+]
+FIRST_NAMES = [
+    "Aarav", "Maya", "Rohan", "Isha", "Kabir", "Anaya", "Vihaan", "Diya", "Arjun", "Sara",
+    "Liam", "Emma", "Noah", "Olivia", "Lucas", "Mia", "Ethan", "Zara", "Leo", "Nora",
+]
+LAST_NAMES = [
+    "Sharma", "Patel", "Singh", "Gupta", "Iyer", "Khan", "Smith", "Garcia", "Chen", "Okafor",
+    "Müller", "Rossi", "Kim", "Silva", "Nair", "Das", "Brown", "Haddad", "Novak", "Reyes",
+]
+BLOOD_GROUPS = ["A+", "A-", "B+", "B-", "AB+", "AB-", "O+", "O-"]
+COMPLAINTS = ["Fever", "Chest pain", "Headache", "Back pain", "Cough", "Rash", "Fatigue", "Dizziness"]
+MEDICATIONS = ["Paracetamol", "Amoxicillin", "Ibuprofen", "Metformin", "Atorvastatin", "Lisinopril"]
+STATUSES = ["completed", "completed", "completed", "confirmed", "pending", "cancelled"]
+
+PASSWORD = "benchpass"
+BATCH_SIZE = 5000
+MANIFEST_SAMPLE = 500
+
+
+def _next_id(db, column):
+    return (db.execute(select(func.max(column))).scalar() or 0) + 1
+
+
+def _bulk_insert(db, model, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.execute(insert(model), rows[start:start + BATCH_SIZE])
+
+
+def generate(db, doctors=20, patients=500, appointments_per_patient=4,
+             session_ratio=0.7, children_per_session=2, seed=42, start_date=None):
+    """
+    Insert a synthetic dataset and return a manifest describing it.
+
+    Every appointment gets a medical session with probability `session_ratio`.
+    Each session gets up to `children_per_session` vital signs, prescriptions,
+    symptoms and diagnoses, plus a treatment plan for half of the sessions.
+    """
+    from backend import models
+
+    rng = random.Random(seed)
+    start_date = start_date or datetime(2025, 1, 6, 9, 0)
+    tag = f"s{seed}"
+
+    doctor_start = _next_id(db, models.Doctor.id)
+    patient_start = _next_id(db, models.Patient.id)
+    appointment_start = _next_id(db, models.Appointment.id)
+    session_start = _next_id(db, models.MedicalSession.session_id)
+
+    doctor_rows = []
+    for offset in range(doctors):
+        doctor_id = doctor_start + offset
+        doctor_rows.append({
+            "id": doctor_id,
+            "name": f"Dr {rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {tag}-{doctor_id}",
+            "email": f"bench.doctor.{tag}.{doctor_id}@curanet.test",
+            "phone": f"7{seed % 100:02d}{doctor_id:07d}",
+            "password": PASSWORD,
+            "department": DEPARTMENTS[offset % len(DEPARTMENTS)],
+            "description": "Synthetic benchmark doctor",
+            "image_url": "https://placehold.co/300x200",
+        })
+    _bulk_insert(db, models.Doctor, doctor_rows)
+
+    patient_rows = []
+    for offset in range(patients):
+        patient_id = patient_start + offset
+        patient_rows.append({
+            "id": patient_id,
+            "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {tag}-{patient_id}",
+            "email": f"bench.patient.{tag}.{patient_id}@curanet.test",
+            "phone": f"8{seed % 100:02d}{patient_id:07d}",
+            "password": PASSWORD,
+            "age": rng.randint(1, 95),
+            "blood_group": rng.choice(BLOOD_GROUPS),
+            "medical_history": rng.choice(["None", "Hypertension", "Diabetes", "Asthma"]),
+        })
+    _bulk_insert(db, models.Patient, patient_rows)
+
+    appointment_rows, session_rows = [], []
+    vital_rows, prescription_rows, symptom_rows, diagnosis_rows, plan_rows = [], [], [], [], []
+    appointment_id, session_id = appointment_start, session_start
+    for patient in patient_rows:
+        for _ in range(appointments_per_patient):
+            doctor = rng.choice(doctor_rows)
+            slot = start_date + timedelta(days=rng.randint(0, 180), minutes=30 * rng.randint(0, 16))
+            status = rng.choice(STATUSES)
+            appointment_rows.append({
+                "id": appointment_id,
+                "patient_id": patient["id"],
+                "doctor_id": doctor["id"],
+                "appointment_time": slot,
+                "status": status,
+            })
+            if rng.random() < session_ratio:
+                session_rows.append({
+                    "session_id": session_id,
+                    "appointment_id": appointment_id,
+                    "patient_id": patient["id"],
+                    "doctor_id": doctor["id"],
+                    "session_date": slot,
+                    "status": models.SessionStatus.completed if status == "completed" else models.SessionStatus.active,
+                    "chief_complaint": rng.choice(COMPLAINTS),
+                    "session_notes": "Synthetic benchmark session",
+                    "created_at": slot,
+                    "updated_at": slot,
+                })
+                for _ in range(rng.randint(1, children_per_session)):
+                    vital_rows.append({
+                        "session_id": session_id,
+                        "blood_pressure_systolic": rng.randint(100, 160),
+                        "blood_pressure_diastolic": rng.randint(60, 100),
+                        "heart_rate": rng.randint(55, 110),
+                        "temperature": round(rng.uniform(36.0, 39.5), 1),
+                        "respiratory_rate": rng.randint(12, 22),
+                        "oxygen_saturation": rng.randint(92, 100),
+                        "weight": round(rng.uniform(3, 120), 1),
+                        "height": round(rng.uniform(50, 200), 1),
+                        "recorded_at": slot,
+                    })
+                    prescription_rows.append({
+                        "session_id": session_id,
+                        "medication_name": rng.choice(MEDICATIONS),
+                        "dosage": f"{rng.choice([250, 500, 1000])}mg",
+                        "frequency": rng.choice(["Once daily", "Twice daily", "Every 8 hours"]),
+                        "duration": f"{rng.randint(3, 30)} days",
+                        "instructions": "After meals",
+                        "prescribed_date": slot,
+                    })
+                    symptom_rows.append({
+                        "session_id": session_id,
+                        "symptom_description": rng.choice(COMPLAINTS),
+                        "severity": rng.choice(list(models.SeverityLevel)),
+                        "duration": f"{rng.randint(1, 14)} days",
+                        "recorded_at": slot,
+                    })
+                    diagnosis_rows.append({
+                        "session_id": session_id,
+                        "diagnosis_code": f"R{rng.randint(0, 99):02d}.{rng.randint(0, 9)}",
+                        "diagnosis_description": f"Synthetic diagnosis for {rng.choice(COMPLAINTS).lower()}",
+                        "diagnosis_type": models.DiagnosisType.primary,
+                        "confidence_level": rng.choice(list(models.ConfidenceLevel)),
+                        "diagnosed_at": slot,
+                    })
+                if session_id % 2 == 0:
+                    plan_rows.append({
+                        "session_id": session_id,
+                        "treatment_description": "Synthetic treatment plan",
+                        "start_date": slot,
+                        "end_date": slot + timedelta(days=14),
+                        "status": models.TreatmentStatus.active,
+                        "follow_up_required": True,
+                        "follow_up_date": slot + timedelta(days=14),
+                        "created_at": slot,
+                    })
+                session_id += 1
+            appointment_id += 1
+
+    _bulk_insert(db, models.Appointment, appointment_rows)
+    _bulk_insert(db, models.MedicalSession, session_rows)
+    _bulk_insert(db, models.VitalSign, vital_rows)
+    _bulk_insert(db, models.Prescription, prescription_rows)
+    _bulk_insert(db, models.Symptom, symptom_rows)
+    _bulk_insert(db, models.Diagnosis, diagnosis_rows)
+    _bulk_insert(db, models.TreatmentPlan, plan_rows)
+    db.commit()
+
+    sample = random.Random(seed + 1)
+    return {
+        "seed": seed,
+        "generated_at": datetime.utcnow().isoformat(),
+        "password": PASSWORD,
+        "counts": {
+            "doctors": len(doctor_rows),
+            "patients": len(patient_rows),
+            "appointments": len(appointment_rows),
+            "medical_sessions": len(session_rows),
+            "vital_signs": len(vital_rows),
+            "prescriptions": len(prescription_rows),
+            "symptoms": len(symptom_rows),
+            "diagnoses": len(diagnosis_rows),
+            "treatment_plans": len(plan_rows),
+        },
+        "doctors": [
+            {"id": d["id"], "name": d["name"], "email": d["email"]}
+            for d in sample.sample(doctor_rows, min(MANIFEST_SAMPLE, len(doctor_rows)))
+        ],
+        "patients": [
+            {"id": p["id"], "name": p["name"], "email": p["email"]}
+            for p in sample.sample(patient_rows, min(MANIFEST_SAMPLE, len(patient_rows)))
+        ],
+        "date_range": [start_date.date().isoformat(), (start_date + timedelta(days=180)).date().isoformat()],
+    }
+
+
+def save_manifest(manifest, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def load_manifest(path):
+    with open(path) as f:
+        return json.load(f)
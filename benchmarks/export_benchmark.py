@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Measure throughput and peak RSS of the streaming admin exports.
+
+Each measurement runs in a fresh subprocess so that ru_maxrss reflects only
+that export. Compare the streaming export with the in-memory list endpoint:
+
+    python benchmarks/export_benchmark.py --seed 1000000
+    python benchmarks/export_benchmark.py --entity patients --format csv
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+
+def seed_patients(count, batch_size=10000):
+    """Bulk insert synthetic patients so the export has something to read"""
+    from sqlalchemy import insert
+    from backend.database import SessionLocal
+    from backend.models import Patient
+
+    db = SessionLocal()
+    try:
+        start = db.query(Patient).count()
+        for offset in range(0, count, batch_size):
+            rows = [
+                {
+                    "name": f"Bench Patient {start + i}",
+                    "email": f"bench{start + i}@example.com",
+                    "phone": f"9{start + i:09d}",
+                    "password": "bench",
+                    "age": 20 + (i % 60),
+                    "blood_group": "O+",
+                    "medical_history": "None",
+                }
+                for i in range(offset, min(offset + batch_size, count))
+            ]
+            db.execute(insert(Patient), rows)
+            db.commit()
+            print(f"Seeded {min(offset + batch_size, count)}/{count} patients")
+    finally:
+        db.close()
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_streaming(entity, export_format):
+    from backend.database import SessionLocal
+    from backend.crud import admin_exports
+
+    started = time.perf_counter()
+    total_bytes = 0
+    rows = 0
+    for chunk in admin_exports.stream_export(SessionLocal, entity, export_format):
+        total_bytes += len(chunk)
+        rows += chunk.count(b"\n")
+    elapsed = time.perf_counter() - started
+    if export_format == "csv":
+        rows -= 1  # header line
+    return {"mode": "streaming", "rows": rows, "bytes": total_bytes, "seconds": elapsed}
+
+
+def run_in_memory(entity):
+    from backend.database import SessionLocal
+    from backend.crud import admin_patients, admin_appointments
+
+    loaders = {
+        "patients": admin_patients.get_all_patients_list,
+        "appointments": admin_appointments.get_all_appointments,
+    }
+    db = SessionLocal()
+    started = time.perf_counter()
+    try:
+        payload = json.dumps(loaders[entity](db), default=str).encode("utf-8")
+        rows = payload.count(b"},")
+    finally:
+        db.close()
+    elapsed = time.perf_counter() - started
+    return {"mode": "in_memory", "rows": rows + 1, "bytes": len(payload), "seconds": elapsed}
+
+
+def measure(args):
+    if args.mode == "streaming":
+        result = run_streaming(args.entity, args.format)
+    else:
+        result = run_in_memory(args.entity)
+    result["rows_per_second"] = result["rows"] / result["seconds"] if result["seconds"] else 0
+    result["peak_rss_mb"] = round(_peak_rss_mb(), 1)
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entity", default="patients", choices=["appointments", "patients", "sessions"])
+    parser.add_argument("--format", default="ndjson", choices=["ndjson", "csv"])
+    parser.add_argument("--seed", type=int, default=0, help="insert this many synthetic patients first")
+    parser.add_argument("--mode", choices=["streaming", "in_memory"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        measure(args)
+        return
+
+    if args.seed:
+        seed_patients(args.seed)
+
+    modes = ["streaming"]
+    if args.entity != "sessions":
+        modes.append("in_memory")
+
+    for mode in modes:
+        output = subprocess.run(
+            [sys.executable, __file__, "--entity", args.entity, "--format", args.format, "--mode", mode],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip().splitlines()[-1]
+        result = json.loads(output)
+        print(
+            f"{mode:>10}: {result['rows']} rows in {result['seconds']:.2f}s "
+            f"({result['rows_per_second']:.0f} rows/s), {result['bytes'] / 1e6:.1f} MB, "
+            f"peak RSS {result['peak_rss_mb']} MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
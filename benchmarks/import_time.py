@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Guard the cold-start cost of importing the application.
+
+Runs `python -X importtime -c "import backend.main"` in fresh interpreters,
+reports the median cumulative import time and the slowest modules, and fails
+(exit status 1) when the median exceeds --budget-ms or when a module that must
+be loaded lazily (boto3 by default) shows up during import.
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --budget-ms 800 --runs 7 --top 15
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_profile(module):
+    """Return {module: (self_us, cumulative_us)} for one cold import"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT_DIR, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise SystemExit(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    profile = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        profile[name.strip()] = (int(self_us), int(cumulative_us))
+    return profile
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="backend.main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=1000.0)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--forbid", nargs="*", default=["boto3"], help="modules that must not be imported eagerly")
+    args = parser.parse_args()
+
+    profiles = [import_profile(args.module) for _ in range(args.runs)]
+    totals = [profile[args.module][1] / 1000 for profile in profiles]
+    median = statistics.median(totals)
+
+    last = profiles[-1]
+    print(f"{args.module}: median {median:.0f} ms over {args.runs} runs (min {min(totals):.0f}, max {max(totals):.0f})")
+    print(f"\nSlowest modules by self time:")
+    for name, (self_us, cumulative_us) in sorted(last.items(), key=lambda item: item[1][0], reverse=True)[:args.top]:
+        print(f"  {self_us / 1000:8.1f} ms self  {cumulative_us / 1000:8.1f} ms total  {name}")
+
+    failed = False
+    eager = [name for name in args.forbid if name in last]
+    if eager:
+        print(f"\n❌ Imported eagerly: {', '.join(eager)}")
+        failed = True
+    if median > args.budget_ms:
+        print(f"\n❌ Import time {median:.0f} ms exceeds budget of {args.budget_ms:.0f} ms")
+        failed = True
+    if failed:
+        sys.exit(1)
+    print(f"\n✅ Within budget ({args.budget_ms:.0f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Benchmark the overhead of MetricsMiddleware and the SQL event listeners.
+
+Serves the same small FastAPI app (one route issuing three SQLite queries, one
+route doing no I/O) with and without instrumentation through an in-process
+ASGI transport, and reports the relative slowdown. The target is < 3%.
+
+In-memory SQLite answers in microseconds, which makes the per-statement cost
+of SQLAlchemy's event dispatch look far bigger than against MySQL over the
+network. --query-latency-ms adds a simulated round trip to every statement
+(default 0.5 ms, a typical same-AZ RDS round trip); 0 gives the worst case.
+
+The end-to-end numbers need a quiet multi-core host; the script also prints
+the fixed per-request cost of the middleware around a no-op ASGI app, which
+is stable enough to compare between commits anywhere.
+
+    python benchmarks/metrics_overhead.py --requests 5000
+    python benchmarks/metrics_overhead.py --query-latency-ms 0
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.pool import StaticPool
+
+from backend import metrics
+
+
+def build_app(instrumented: bool, query_latency_ms: float) -> FastAPI:
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+
+    @event.listens_for(engine, "connect")
+    def register_pause(dbapi_connection, connection_record):
+        dbapi_connection.create_function("pause", 1, lambda ms: time.sleep(ms / 1000) if ms else None)
+
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)"))
+        conn.execute(text("INSERT INTO items (name) VALUES ('a'), ('b'), ('c')"))
+
+    app = FastAPI()
+    if instrumented:
+        metrics.instrument_engine(engine)
+        app.add_middleware(metrics.MetricsMiddleware)
+
+    @app.get("/items/{item_id}")
+    def read_item(item_id: int):
+        with engine.connect() as conn:
+            rows = [
+                conn.execute(
+                    text("SELECT name FROM items WHERE id = :id AND pause(:ms) IS NULL"),
+                    {"id": i, "ms": query_latency_ms},
+                ).scalar()
+                for i in (1, 2, item_id)
+            ]
+        return {"names": rows}
+
+    @app.get("/ping")
+    def ping():
+        return {"status": "ok"}
+
+    return app
+
+
+async def run(app: FastAPI, path: str, count: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for _ in range(min(50, count)):
+            await client.get(path)
+        started = time.perf_counter()
+        for _ in range(count):
+            await client.get(path)
+        return time.perf_counter() - started
+
+
+async def middleware_cost(iterations: int = 50000) -> float:
+    """Microseconds MetricsMiddleware adds around a no-op ASGI app"""
+    class Route:
+        path = "/noop"
+
+    async def noop_app(scope, receive, send):
+        scope["route"] = Route
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def send(message):
+        pass
+
+    timings = []
+    for app in (noop_app, metrics.MetricsMiddleware(noop_app)):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            await app({"type": "http", "method": "GET", "path": "/noop"}, None, send)
+        timings.append((time.perf_counter() - started) / iterations * 1e6)
+    return timings[1] - timings[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=11)
+    parser.add_argument("--query-latency-ms", type=float, default=0.5)
+    args = parser.parse_args()
+
+    for path in ("/items/3", "/ping"):
+        baseline_app = build_app(False, args.query_latency_ms)
+        instrumented_app = build_app(True, args.query_latency_ms)
+        baseline, instrumented, ratios = [], [], []
+        # Interleave the two variants so machine noise hits both equally
+        for _ in range(args.rounds):
+            base = asyncio.run(run(baseline_app, path, args.requests))
+            inst = asyncio.run(run(instrumented_app, path, args.requests))
+            baseline.append(base)
+            instrumented.append(inst)
+            ratios.append(inst / base)
+        overhead = (statistics.median(ratios) - 1) * 100
+        print(
+            f"{path:<10} baseline {args.requests / statistics.median(baseline):8.0f} req/s | "
+            f"instrumented {args.requests / statistics.median(instrumented):8.0f} req/s | "
+            f"overhead {overhead:+.2f}%"
+        )
+    print(f"middleware cost per request: {asyncio.run(middleware_cost()):.1f} us")
+
+if __name__ == "__main__":
+    main()
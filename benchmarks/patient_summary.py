@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Benchmark: admin patient summary for patients with thousands of appointments.
+
+Generates a few patients with --appointments appointments each (sessions,
+prescriptions and the rest as in python -m benchmarks generate), then
+builds their summaries three ways:
+
+- five_queries: the previous implementation, kept here for comparison -
+  five statements, the distinct doctors loaded as full Doctor objects
+- aggregate: admin_patients.get_patient_summary - patient and statistics in
+  one statement, doctors and prescriptions as column projections
+- cached: GET /admin/patients/{id}/summary in-process, served from
+  patient_summary_cache with one invalidating write every --write-every
+  requests
+
+--query-latency-ms adds a simulated database round trip to every statement.
+
+    python benchmarks/patient_summary.py --patients 3 --appointments 5000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from benchmarks import dataset
+from benchmarks.admission_load import add_query_latency
+from benchmarks.report import summarize
+
+
+def five_queries(db, patient_id):
+    """GET /admin/patients/{id}/summary before the aggregate query"""
+    from sqlalchemy import func
+    from backend import models
+
+    patient = db.query(models.Patient).filter(models.Patient.id == patient_id).first()
+    total_appointments = db.query(func.count(models.Appointment.id)).filter(
+        models.Appointment.patient_id == patient_id
+    ).scalar()
+    total_sessions = db.query(func.count(models.MedicalSession.session_id)).filter(
+        models.MedicalSession.patient_id == patient_id
+    ).scalar()
+    doctors = db.query(models.Doctor).join(models.Appointment).filter(
+        models.Appointment.patient_id == patient_id
+    ).distinct().all()
+    recent_prescriptions = db.query(models.Prescription).join(models.MedicalSession).filter(
+        models.MedicalSession.patient_id == patient_id
+    ).order_by(models.MedicalSession.session_date.desc()).limit(5).all()
+    return {
+        "patient_info": {"id": patient.id, "name": patient.name},
+        "statistics": {
+            "total_appointments": total_appointments,
+            "total_sessions": total_sessions,
+            "doctors_consulted": len(doctors)
+        },
+        "doctors": sorted(doctor.name for doctor in doctors),
+        "recent_prescriptions": [p.medication_name for p in recent_prescriptions],
+    }
+
+
+def count_statements():
+    from sqlalchemy import event
+    from backend.database import get_engine
+
+    counter = {"statements": 0}
+
+    @event.listens_for(get_engine(), "before_cursor_execute")
+    def count(*_args):
+        counter["statements"] += 1
+
+    return counter
+
+
+def time_calls(call, patient_ids, requests, counter):
+    latencies = []
+    statements_before = counter["statements"]
+    started = time.perf_counter()
+    for index in range(requests):
+        request_started = time.perf_counter()
+        call(patient_ids[index % len(patient_ids)])
+        latencies.append(time.perf_counter() - request_started)
+    result = summarize(latencies, time.perf_counter() - started)
+    result["statements_per_request"] = round((counter["statements"] - statements_before) / requests, 2)
+    return result
+
+
+def run_direct(function, patient_ids, requests, counter):
+    from backend.database import SessionLocal
+
+    def call(patient_id):
+        db = SessionLocal()
+        try:
+            return function(db, patient_id)
+        finally:
+            db.close()
+
+    return time_calls(call, patient_ids, requests, counter)
+
+
+async def run_cached(patient_ids, session_ids, args, counter):
+    from backend import models, patient_summary_cache
+    from backend.database import SessionLocal
+    from benchmarks.runner import build_client
+
+    patient_summary_cache.cache.clear()
+    hits_before = patient_summary_cache.summary_lookups.value(result="hit")
+    latencies, failures = [], 0
+    statements_before = counter["statements"]
+    async with build_client("inprocess", timeout=120) as client:
+        started = time.perf_counter()
+        for index in range(args.requests):
+            if args.write_every and index and index % args.write_every == 0:
+                # A prescription added to one of the patients' sessions drops that patient's entry
+                write_started = counter["statements"]
+                db = SessionLocal()
+                try:
+                    db.add(models.Prescription(
+                        session_id=session_ids[index % len(session_ids)], medication_name="Paracetamol",
+                        dosage="500mg", frequency="Once daily", duration="3 days",
+                    ))
+                    db.commit()
+                finally:
+                    db.close()
+                # Count only the summary requests' statements
+                statements_before += counter["statements"] - write_started
+            request_started = time.perf_counter()
+            response = await client.get(f"/admin/patients/{patient_ids[index % len(patient_ids)]}/summary")
+            latencies.append(time.perf_counter() - request_started)
+            failures += response.status_code != 200
+        result = summarize(latencies, time.perf_counter() - started)
+    hits = patient_summary_cache.summary_lookups.value(result="hit") - hits_before
+    result["statements_per_request"] = round((counter["statements"] - statements_before) / args.requests, 2)
+    result["hit_ratio"] = round(hits / args.requests, 3)
+    result["failures"] = failures
+    return result
+
+
+def check_same(patient_ids):
+    """The aggregate must report what the five queries did"""
+    from backend.crud import admin_patients
+    from backend.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        for patient_id in patient_ids:
+            old, new = five_queries(db, patient_id), admin_patients.get_patient_summary(db, patient_id)
+            assert old["statistics"] == new["statistics"], (patient_id, old["statistics"], new["statistics"])
+            assert old["doctors"] == [doctor["name"] for doctor in new["doctors"]], patient_id
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--patients", type=int, default=3)
+    parser.add_argument("--appointments", type=int, default=5000, help="appointments per patient")
+    parser.add_argument("--doctors", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=200, help="requests per mode")
+    parser.add_argument("--write-every", type=int, default=50,
+                        help="cached mode: one invalidating write every N requests (0: none)")
+    parser.add_argument("--query-latency-ms", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    from backend import models
+    from backend.crud import admin_patients
+    from backend.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        manifest = dataset.generate(db, doctors=args.doctors, patients=args.patients,
+                                    appointments_per_patient=args.appointments, seed=args.seed)
+        patient_ids = [patient["id"] for patient in manifest["patients"]]
+        session_ids = [row[0] for row in db.query(models.MedicalSession.session_id)
+                       .filter(models.MedicalSession.patient_id.in_(patient_ids)).limit(100)]
+    finally:
+        db.close()
+    print(f"{args.patients} patients, {manifest['counts']['appointments']} appointments, "
+          f"{manifest['counts']['medical_sessions']} sessions, {manifest['counts']['prescriptions']} prescriptions")
+
+    check_same(patient_ids)
+    add_query_latency(args.query_latency_ms)
+    counter = count_statements()
+    results = {
+        "five_queries": run_direct(five_queries, patient_ids, args.requests, counter),
+        "aggregate": run_direct(admin_patients.get_patient_summary, patient_ids, args.requests, counter),
+        "cached": asyncio.run(run_cached(patient_ids, session_ids, args, counter)),
+    }
+
+    print(f"\n{'mode':<14}{'SQL/req':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'rps':>9}")
+    for mode, r in results.items():
+        print(f"{mode:<14}{r['statements_per_request']:>9}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}"
+              f"{r['p99_ms']:>9.2f}{r['rps']:>9}")
+    print(f"cached hit ratio {results['cached']['hit_ratio']} with a write every {args.write_every} requests")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Benchmark: patient history served from stored timelines.
+
+Generates patients with --appointments appointments each, then measures:
+
+- live: the complete history assembled from the session tables and encoded
+  as the endpoint did before timelines (patient, sessions, doctors, three
+  sections), called directly
+- timeline: GET /patient/{id}/complete-history served from the stored document
+- revalidated: the same request with If-None-Match, answered 304
+- writes: POST /medical-sessions/{id}/prescriptions for patients whose
+  timeline is built (the document is patched in the transaction) and for
+  patients without one
+
+plus the stored document size against its uncompressed JSON.
+--query-latency-ms adds a simulated database round trip to every statement.
+
+    python benchmarks/patient_timeline.py --patients 20 --appointments 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from benchmarks import dataset
+from benchmarks.admission_load import add_query_latency
+from benchmarks.report import summarize
+
+
+def live_history(db, patient_id):
+    """The complete history as assembled before stored timelines"""
+    from backend import models
+    from backend.crud import patient_medical_history
+
+    patient = db.query(models.Patient).filter(models.Patient.id == patient_id).first()
+    sessions = db.query(models.MedicalSession).filter(
+        models.MedicalSession.patient_id == patient_id
+    ).order_by(models.MedicalSession.session_date.desc()).all()
+    selection = patient_medical_history.select_history_fields()
+    return {
+        "patient_info": {"id": patient.id, "name": patient.name},
+        "medical_sessions": patient_medical_history.format_session_history(db, sessions, selection),
+    }
+
+
+def count_statements():
+    from sqlalchemy import event
+    from backend.database import get_engine
+
+    counter = {"statements": 0}
+
+    @event.listens_for(get_engine(), "before_cursor_execute")
+    def count(*_args):
+        counter["statements"] += 1
+
+    return counter
+
+
+async def timed(requests, call, counter):
+    latencies = []
+    statements_before = counter["statements"]
+    started = time.perf_counter()
+    for index in range(requests):
+        request_started = time.perf_counter()
+        await call(index)
+        latencies.append(time.perf_counter() - request_started)
+    result = summarize(latencies, time.perf_counter() - started)
+    result["statements_per_request"] = round((counter["statements"] - statements_before) / requests, 2)
+    return result
+
+
+async def main_async(args, patient_ids, sessions_by_patient, counter):
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    from backend import models
+    from backend.database import SessionLocal
+    from benchmarks.runner import build_client
+
+    results = {}
+
+    async def live(index):
+        db = SessionLocal()
+        try:
+            # What FastAPI does with a returned dict
+            JSONResponse(jsonable_encoder(live_history(db, patient_ids[index % len(patient_ids)])))
+        finally:
+            db.close()
+
+    results["live"] = await timed(args.requests, live, counter)
+
+    async with build_client("inprocess", timeout=120) as client:
+        etags = {}
+        for patient_id in patient_ids:
+            response = await client.get(f"/patient/{patient_id}/complete-history")
+            etags[patient_id] = response.headers["etag"]
+
+        async def timeline(index):
+            response = await client.get(f"/patient/{patient_ids[index % len(patient_ids)]}/complete-history")
+            assert response.status_code == 200, response.status_code
+
+        async def revalidated(index):
+            patient_id = patient_ids[index % len(patient_ids)]
+            response = await client.get(f"/patient/{patient_id}/complete-history",
+                                        headers={"If-None-Match": etags[patient_id]})
+            assert response.status_code == 304, response.status_code
+
+        results["timeline"] = await timed(args.requests, timeline, counter)
+        results["revalidated"] = await timed(args.requests, revalidated, counter)
+
+        def prescribe(patient_ids):
+            async def call(index):
+                patient_id = patient_ids[index % len(patient_ids)]
+                response = await client.post(
+                    f"/medical-sessions/{sessions_by_patient[patient_id][0]}/prescriptions",
+                    json={"medication_name": "Paracetamol", "dosage": "500mg",
+                          "frequency": "Once daily", "duration": "3 days"},
+                )
+                assert response.status_code == 200, response.status_code
+            return call
+
+        half = len(patient_ids) // 2
+        db = SessionLocal()
+        try:
+            db.query(models.PatientTimeline).filter(
+                models.PatientTimeline.patient_id.in_(patient_ids[half:])
+            ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+        writes = max(1, args.requests // 4)
+        results["write_patched"] = await timed(writes, prescribe(patient_ids[:half]), counter)
+        results["write_unbuilt"] = await timed(writes, prescribe(patient_ids[half:]), counter)
+    return results
+
+
+def document_sizes(patient_ids):
+    from backend import models, patient_timeline
+    from backend.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        stored = [row.document for row in db.query(models.PatientTimeline.document)
+                  .filter(models.PatientTimeline.patient_id.in_(patient_ids),
+                          models.PatientTimeline.document.isnot(None))]
+    finally:
+        db.close()
+    raw = [len(json.dumps(patient_timeline.decode(data), separators=(",", ":")).encode()) for data in stored]
+    return sum(raw) / len(raw), sum(len(data) for data in stored) / len(stored)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--patients", type=int, default=20)
+    parser.add_argument("--appointments", type=int, default=200, help="appointments per patient")
+    parser.add_argument("--doctors", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=200, help="requests per mode")
+    parser.add_argument("--query-latency-ms", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=11)
+    args = parser.parse_args()
+
+    from backend import models
+    from backend.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        manifest = dataset.generate(db, doctors=args.doctors, patients=args.patients,
+                                    appointments_per_patient=args.appointments, seed=args.seed)
+        patient_ids = [patient["id"] for patient in manifest["patients"]]
+        sessions_by_patient = {}
+        for patient_id, session_id in db.query(models.MedicalSession.patient_id, models.MedicalSession.session_id)\
+                                        .filter(models.MedicalSession.patient_id.in_(patient_ids)):
+            sessions_by_patient.setdefault(patient_id, []).append(session_id)
+    finally:
+        db.close()
+    patient_ids = [patient_id for patient_id in patient_ids if patient_id in sessions_by_patient]
+    print(f"{len(patient_ids)} patients, {manifest['counts']['medical_sessions'] / args.patients:.0f} sessions each")
+
+    add_query_latency(args.query_latency_ms)
+    counter = count_statements()
+    results = asyncio.run(main_async(args, patient_ids, sessions_by_patient, counter))
+
+    print(f"\n{'mode':<16}{'SQL/req':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'rps':>9}")
+    for mode, r in results.items():
+        print(f"{mode:<16}{r['statements_per_request']:>9}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}"
+              f"{r['p99_ms']:>9.2f}{r['rps']:>9}")
+    raw, compressed = document_sizes(patient_ids)
+    print(f"document: {raw / 1024:.1f} KiB JSON, {compressed / 1024:.1f} KiB stored ({compressed / raw:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Latency summaries, JSON result files and commit-to-commit comparison"""
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, wall_seconds):
+    values = sorted(latencies)
+    ms = lambda seconds: round(seconds * 1000, 3)
+    return {
+        "requests": len(values),
+        "rps": round(len(values) / wall_seconds, 2) if wall_seconds else 0.0,
+        "p50_ms": ms(percentile(values, 0.50)),
+        "p95_ms": ms(percentile(values, 0.95)),
+        "p99_ms": ms(percentile(values, 0.99)),
+        "mean_ms": ms(sum(values) / len(values)) if values else 0.0,
+        "max_ms": ms(values[-1]) if values else 0.0,
+    }
+
+
+def git_revision():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=root, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=root, capture_output=True, text=True
+        ).stdout.strip())
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def build_report(results, options, manifest):
+    return {
+        "commit": git_revision(),
+        "created_at": datetime.utcnow().isoformat(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "options": options,
+        "dataset": {"seed": manifest.get("seed"), "counts": manifest.get("counts")},
+        "scenarios": results,
+    }
+
+
+def write_report(report, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+
+
+def load_report(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def print_results(results):
+    print(f"{'scenario':<18} {'req':>6} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for name, r in results.items():
+        print(
+            f"{name:<18} {r['requests']:>6} {r['rps']:>9.1f} {r['p50_ms']:>9.2f} "
+            f"{r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f} {r['errors']:>7}"
+        )
+
+
+def compare(baseline, candidate, threshold=10.0):
+    """
+    Print per-scenario deltas between two result files.
+
+    Returns the scenarios where p95 latency grew or throughput dropped by
+    more than `threshold` percent.
+    """
+    def delta(old, new):
+        return (new - old) / old * 100 if old else 0.0
+
+    if baseline.get("dataset") != candidate.get("dataset"):
+        print("⚠️  Results were taken on different datasets; deltas may not be meaningful")
+
+    print(f"baseline {baseline['commit']}  vs  candidate {candidate['commit']}")
+    print(f"{'scenario':<18} {'rps':>20} {'p50 ms':>20} {'p95 ms':>20} {'p99 ms':>20}")
+    regressions = []
+    for name, new in candidate["scenarios"].items():
+        old = baseline["scenarios"].get(name)
+        if not old:
+            continue
+        cells = []
+        for key in ("rps", "p50_ms", "p95_ms", "p99_ms"):
+            cells.append(f"{old[key]:>8.1f}→{new[key]:<8.1f}{delta(old[key], new[key]):+.0f}%")
+        print(f"{name:<18} " + " ".join(f"{cell:>20}" for cell in cells))
+        if delta(old["p95_ms"], new["p95_ms"]) > threshold or -delta(old["rps"], new["rps"]) > threshold:
+            regressions.append(name)
+    return regressions
@@ -0,0 +1,55 @@
+"""
+Closed-loop load driver: `concurrency` workers issue requests back to back
+until `requests` have completed, against either the app in-process (through
+httpx's ASGI transport, with the stub S3) or a live server URL.
+"""
+import asyncio
+import time
+
+import httpx
+
+from .report import summarize
+
+
+def build_client(target, s3_latency_ms=0.0, timeout=60.0):
+    if target == "inprocess":
+        from backend import main
+        from backend.storage import set_storage
+        from .stub_s3 import StubS3Service
+
+        set_storage(StubS3Service(latency_ms=s3_latency_ms))
+        transport = httpx.ASGITransport(app=main.app)
+        return httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=timeout)
+    return httpx.AsyncClient(base_url=target.rstrip("/"), timeout=timeout)
+
+
+async def run_scenario(client, scenario, ctx, requests=200, concurrency=8, warmup=10):
+    for _ in range(warmup):
+        await scenario(client, ctx)
+
+    latencies, statuses = [], {}
+    errors = 0
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            try:
+                response = await scenario(client, ctx)
+                status = response.status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+            if not isinstance(status, int) or status >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+
+    result = summarize(latencies, wall)
+    result.update({"errors": errors, "status_codes": statuses, "concurrency": concurrency})
+    return result
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Upload throughput of S3Service at high concurrency against a local S3 stand-in.
+
+Starts moto's threaded S3 server (pip install "moto[server]") unless
+--endpoint-url points at another S3-compatible service such as MinIO, then
+runs --concurrency simultaneous uploads with botocore's defaults (10 pooled
+connections, legacy retries) and with the tuned configuration.
+
+    python benchmarks/s3_concurrency.py --concurrency 50 --uploads 500 --size-kb 256
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+CONFIGURATIONS = {
+    "botocore defaults": {"S3_MAX_POOL_CONNECTIONS": "10", "S3_RETRY_MODE": "legacy", "S3_TCP_KEEPALIVE": "false"},
+    "tuned": {"S3_MAX_POOL_CONNECTIONS": "50", "S3_RETRY_MODE": "adaptive", "S3_TCP_KEEPALIVE": "true"},
+}
+
+
+def start_stand_in(port):
+    from moto.server import ThreadedMotoServer
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=port)
+    server.start()
+    return server, f"http://127.0.0.1:{port}"
+
+
+def run(concurrency, uploads, payload):
+    from backend import s3_service
+
+    # urllib3 warns "connection pool is full" when threads outnumber pooled connections
+    logging.getLogger("urllib3.connectionpool").setLevel(logging.ERROR)
+
+    service = s3_service.S3Service()
+    try:
+        service.s3_client.create_bucket(Bucket=service.bucket_name)
+    except Exception:
+        pass  # already exists
+
+    latencies = []
+
+    def upload(index):
+        started = time.perf_counter()
+        service.upload_file(payload, f"bench_{index}.bin", "application/octet-stream", index % 100, 1)
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(upload, range(uploads)))
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "uploads_per_second": uploads / wall,
+        "mb_per_second": uploads * len(payload) / wall / 1e6,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "retries": s3_service.s3_operation_retries.value(operation="put_object"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--uploads", type=int, default=500)
+    parser.add_argument("--size-kb", type=int, default=256)
+    parser.add_argument("--endpoint-url", help="existing S3-compatible endpoint instead of moto")
+    parser.add_argument("--port", type=int, default=5055)
+    args = parser.parse_args()
+
+    server = None
+    endpoint = args.endpoint_url
+    if not endpoint:
+        server, endpoint = start_stand_in(args.port)
+
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "bench")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "bench")
+    os.environ.setdefault("S3_BUCKET_NAME", "curanet-bench")
+    os.environ["S3_ENDPOINT_URL"] = endpoint
+    payload = os.urandom(args.size_kb * 1024)
+
+    try:
+        print(f"{args.uploads} uploads of {args.size_kb} KB, {args.concurrency} concurrent, endpoint {endpoint}")
+        for name, settings in CONFIGURATIONS.items():
+            os.environ.update(settings)
+            result = run(args.concurrency, args.uploads, payload)
+            print(
+                f"{name:<18} {result['uploads_per_second']:8.1f} uploads/s {result['mb_per_second']:7.1f} MB/s "
+                f"p50 {result['p50_ms']:7.1f} ms  p95 {result['p95_ms']:7.1f} ms  retries {result['retries']:.0f}"
+            )
+    finally:
+        if server:
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
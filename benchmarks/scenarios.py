@@ -0,0 +1,92 @@
+"""
+Scenario drivers for the main user flows.
+
+Each scenario issues exactly one HTTP request per call so the recorded
+latency is per request. Inputs are drawn from the dataset manifest with a
+seeded RNG, so two runs over the same dataset send the same requests.
+"""
+import json
+import random
+from datetime import date, timedelta
+
+
+class ScenarioContext:
+    def __init__(self, manifest, seed=0, upload_size=256 * 1024):
+        self.manifest = manifest
+        self.rng = random.Random(seed)
+        self.upload_size = upload_size
+        self.upload_payload = random.Random(seed).getrandbits(upload_size * 8).to_bytes(upload_size, "little")
+        self.uploads = 0
+
+    def doctor(self):
+        return self.rng.choice(self.manifest["doctors"])
+
+    def patient(self):
+        return self.rng.choice(self.manifest["patients"])
+
+    def day(self):
+        first, last = (date.fromisoformat(d) for d in self.manifest["date_range"])
+        return (first + timedelta(days=self.rng.randint(0, (last - first).days))).isoformat()
+
+
+async def login(client, ctx):
+    user_type = ctx.rng.choice(["patient", "doctor"])
+    user = ctx.patient() if user_type == "patient" else ctx.doctor()
+    return await client.post("/login", json={
+        "identifier": user["email"],
+        "password": ctx.manifest["password"],
+        "user_type": user_type,
+    })
+
+
+async def patient_dashboard(client, ctx):
+    return await client.get(f"/patient/dashboard-info/{ctx.patient()['name']}")
+
+
+async def doctor_dashboard(client, ctx):
+    return await client.get(f"/doctor/appointments/{ctx.doctor()['name']}")
+
+
+async def admin_dashboard(client, ctx):
+    return await client.get("/admin/recent-doctors")
+
+
+async def doctor_list(client, ctx):
+    return await client.get("/api/doctors")
+
+
+async def availability(client, ctx):
+    return await client.get(f"/doctor/availability/{ctx.doctor()['id']}", params={"date": ctx.day()})
+
+
+async def admin_appointments(client, ctx):
+    return await client.get("/admin/appointments-list")
+
+
+async def history(client, ctx):
+    return await client.get(f"/patient/P{ctx.patient()['id']:06d}/complete-history")
+
+
+async def report_upload(client, ctx):
+    patient, doctor = ctx.patient(), ctx.doctor()
+    # Unique prefix so every upload is a distinct file
+    ctx.uploads += 1
+    payload = ctx.uploads.to_bytes(8, "big") + ctx.upload_payload[8:]
+    return await client.post(
+        "/reports/upload",
+        files={"file": (f"bench-report-{ctx.uploads}.pdf", payload, "application/pdf")},
+        data={"patient_id": str(patient["id"]), "doctor_id": str(doctor["id"]), "shared_with": json.dumps([])},
+    )
+
+
+SCENARIOS = {
+    "login": login,
+    "patient_dashboard": patient_dashboard,
+    "doctor_dashboard": doctor_dashboard,
+    "admin_dashboard": admin_dashboard,
+    "doctor_list": doctor_list,
+    "availability": availability,
+    "admin_appointments": admin_appointments,
+    "history": history,
+    "report_upload": report_upload,
+}
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Benchmark: how many concurrent read requests does a small connection pool serve?
+
+Runs the same load twice in-process against a pool of --pool-size
+connections (no overflow): first with request sessions holding their
+connection from the first query until the request ends (DB_LAZY_SESSIONS
+off), then with lazy sessions that give it back after each read. The load
+mixes dashboard reads with report uploads, which look up duplicates before
+the (stub) S3 upload and so hold a connection through it with eager
+sessions. Reports throughput and latency together with the pool occupancy
+from the curanet_db_pool_* metrics: connections in use, how long each
+checkout lasts, and requests in flight.
+
+--query-latency-ms adds a simulated database round trip to every statement,
+--s3-latency-ms one to every stub S3 call. Needs a dataset (python -m
+benchmarks generate).
+
+    python benchmarks/session_pool.py --pool-size 4 --concurrency 32 --duration 15
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import httpx
+
+from benchmarks import dataset
+from benchmarks.admission_load import add_query_latency
+from benchmarks.report import summarize
+from benchmarks.scenarios import SCENARIOS, ScenarioContext
+
+# No /api/doctors: it queries from the event loop, which stalls the whole
+# worker once it has to wait for a pooled connection
+MIX = ("patient_dashboard", "availability", "report_upload", "doctor_dashboard", "history", "report_upload")
+DEFAULT_MANIFEST = os.path.join(ROOT_DIR, "benchmarks", "results", "dataset.json")
+
+
+async def drive(client, ctx, offset, deadline, latencies, statuses):
+    index = offset
+    while time.perf_counter() < deadline:
+        name = MIX[index % len(MIX)]
+        index += 1
+        started = time.perf_counter()
+        try:
+            status = (await SCENARIOS[name](client, ctx)).status_code
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        latencies.setdefault(name, []).append(time.perf_counter() - started)
+        statuses[status] = statuses.get(status, 0) + 1
+
+
+async def sample(pool, deadline, samples):
+    from backend import metrics
+
+    while time.perf_counter() < deadline:
+        samples.append((metrics.db_pool_in_use.value(pool=pool), metrics.http_requests_in_flight.value()))
+        await asyncio.sleep(0.005)
+
+
+def hold_stats(pool):
+    from backend import metrics
+
+    state = metrics.db_connection_hold._values.get((pool,))
+    return (state[-2], state[-1]) if state else (0.0, 0)
+
+
+async def run_mode(client, manifest, pool, args):
+    latencies, statuses, samples = {}, {}, []
+    hold_before = hold_stats(pool)
+    deadline = time.perf_counter() + args.duration
+    started = time.perf_counter()
+    await asyncio.gather(
+        sample(pool, deadline, samples),
+        *[drive(client, ScenarioContext(manifest, seed=i), i, deadline, latencies, statuses)
+          for i in range(args.concurrency)],
+    )
+    wall = time.perf_counter() - started
+    result = summarize([value for values in latencies.values() for value in values], wall)
+    result["scenarios"] = {name: summarize(values, wall) for name, values in latencies.items()}
+    hold_seconds, checkouts = (after - before for after, before in zip(hold_stats(pool), hold_before))
+    in_use = sum(s[0] for s in samples) / max(1, len(samples))
+    in_flight = sum(s[1] for s in samples) / max(1, len(samples))
+    result.update({
+        "statuses": statuses,
+        "checkouts": checkouts,
+        "mean_hold_ms": round(hold_seconds / checkouts * 1000, 3) if checkouts else 0.0,
+        "mean_connections_in_use": round(in_use, 2),
+        "mean_requests_in_flight": round(in_flight, 2),
+        "rps_per_connection": round(result["rps"] / args.pool_size, 2),
+        "pool_size": args.pool_size,
+    })
+    return result
+
+
+def print_results(mode, r):
+    print(f"\n{mode} sessions:")
+    print(f"  requests {r['requests']}  rps {r['rps']}  ({r['rps_per_connection']} per pooled connection)")
+    print(f"  p50 {r['p50_ms']:.1f} ms  p99 {r['p99_ms']:.1f} ms  statuses {r['statuses']}")
+    print(f"  checkouts {r['checkouts']}  mean hold {r['mean_hold_ms']:.2f} ms")
+    print(f"  connections in use {r['mean_connections_in_use']} / {r['pool_size']}  "
+          f"requests in flight {r['mean_requests_in_flight']}")
+    for name in MIX[:5]:
+        s = r["scenarios"].get(name)
+        if s:
+            print(f"    {name:<20}{s['requests']:>7}{s['p50_ms']:>10.1f} ms p50{s['p99_ms']:>10.1f} ms p99")
+
+
+async def main_async(args):
+    from backend import admission, coalescing, database, metrics
+    from benchmarks.runner import build_client
+
+    # Measure the pool alone: nothing is shed or shared between requests
+    admission.ADMISSION_CONTROL_ENABLED = False
+    coalescing.COALESCING_ENABLED = False
+    manifest = dataset.load_manifest(args.manifest)
+    add_query_latency(args.query_latency_ms)
+    pool = metrics.pool_label(database.get_engine())
+
+    by_mode = {}
+    async with build_client("inprocess", s3_latency_ms=args.s3_latency_ms, timeout=120) as client:
+        await SCENARIOS["availability"](client, ScenarioContext(manifest))
+        for mode in ("eager", "lazy"):
+            database.DB_LAZY_SESSIONS = mode == "lazy"
+            by_mode[mode] = await run_mode(client, manifest, pool, args)
+            print_results(mode, by_mode[mode])
+
+    eager, lazy = by_mode["eager"], by_mode["lazy"]
+    if eager["rps"]:
+        print(f"\nthroughput per pooled connection: {eager['rps_per_connection']} -> {lazy['rps_per_connection']} rps "
+              f"({(lazy['rps'] - eager['rps']) / eager['rps'] * 100:+.0f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=10, help="seconds per mode")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--pool-size", type=int, default=4)
+    parser.add_argument("--query-latency-ms", type=float, default=2.0)
+    parser.add_argument("--s3-latency-ms", type=float, default=100.0)
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST)
+    args = parser.parse_args()
+    # Read by backend.database when the engine is created
+    os.environ["DB_POOL_SIZE"] = str(args.pool_size)
+    os.environ["DB_MAX_OVERFLOW"] = "0"
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
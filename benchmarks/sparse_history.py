@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Payload size, latency and SQL statements of the history endpoints, in full
+and with sparse fieldsets.
+
+For each endpoint the same requests run once without parameters (every
+section) and once with fields=/include= asking only for what a
+prescriptions view renders. Runs in-process over the benchmark dataset
+(python -m benchmarks generate); --query-latency-ms adds a simulated
+database round trip to every statement.
+
+    python benchmarks/sparse_history.py --requests 200
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from benchmarks import dataset
+from benchmarks.admission_load import add_query_latency
+from benchmarks.report import summarize
+
+DEFAULT_MANIFEST = os.path.join(ROOT_DIR, "benchmarks", "results", "dataset.json")
+
+PRESCRIPTIONS_ONLY = "include=prescriptions&fields=session_date,prescriptions.medication_name,prescriptions.dosage"
+
+# name -> (path template, sparse query string)
+CASES = {
+    "complete_history": ("/patient/P{patient:06d}/complete-history", PRESCRIPTIONS_ONLY),
+    "admin_medical_history": ("/admin/patient/{patient}/medical-history", PRESCRIPTIONS_ONLY),
+    "medical_session": ("/medical-sessions/{session}", "fields=session_id,status,prescriptions"),
+}
+
+
+def sample_sessions(patient_ids):
+    """One medical session id per sampled patient that has sessions"""
+    from backend import models
+    from backend.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        rows = db.query(models.MedicalSession.patient_id, models.MedicalSession.session_id)\
+                 .filter(models.MedicalSession.patient_id.in_(patient_ids)).all()
+    finally:
+        db.close()
+    sessions = {}
+    for patient_id, session_id in rows:
+        sessions.setdefault(patient_id, session_id)
+    return list(sessions.values())
+
+
+def count_statements():
+    from sqlalchemy import event
+    from backend.database import get_engine
+
+    counter = {"statements": 0}
+
+    @event.listens_for(get_engine(), "before_cursor_execute")
+    def count(*_args):
+        counter["statements"] += 1
+
+    return counter
+
+
+async def run_case(client, paths, query, requests, counter):
+    latencies, sizes, failures = [], [], 0
+    statements_before = counter["statements"]
+    started = time.perf_counter()
+    for index in range(requests):
+        path = paths[index % len(paths)]
+        request_started = time.perf_counter()
+        response = await client.get(f"{path}?{query}" if query else path)
+        latencies.append(time.perf_counter() - request_started)
+        if response.status_code != 200:
+            failures += 1
+        sizes.append(len(response.content))
+    result = summarize(latencies, time.perf_counter() - started)
+    result["mean_bytes"] = round(sum(sizes) / len(sizes))
+    result["statements_per_request"] = round((counter["statements"] - statements_before) / requests, 1)
+    result["failures"] = failures
+    return result
+
+
+async def main_async(args):
+    from benchmarks.runner import build_client
+
+    manifest = dataset.load_manifest(args.manifest)
+    patients = [patient["id"] for patient in manifest["patients"]]
+    sessions = sample_sessions(patients)
+    add_query_latency(args.query_latency_ms)
+    counter = count_statements()
+
+    print(f"{'endpoint':<24}{'mode':<8}{'bytes':>9}{'SQL':>6}{'p50 ms':>9}{'p99 ms':>9}{'failed':>8}")
+    async with build_client("inprocess", timeout=120) as client:
+        for name, (template, sparse_query) in CASES.items():
+            paths = [template.format(patient=patient, session=session)
+                     for patient, session in zip(patients, sessions or patients)]
+            await run_case(client, paths, "", min(10, args.requests), counter)
+            results = {}
+            for mode, query in (("full", ""), ("sparse", sparse_query)):
+                r = results[mode] = await run_case(client, paths, query, args.requests, counter)
+                print(f"{name:<24}{mode:<8}{r['mean_bytes']:>9}{r['statements_per_request']:>6}"
+                      f"{r['p50_ms']:>9.1f}{r['p99_ms']:>9.1f}{r['failures']:>8}")
+            full, sparse = results["full"], results["sparse"]
+            if full["mean_bytes"] and full["p50_ms"]:
+                print(f"{'':<24}payload {(sparse['mean_bytes'] - full['mean_bytes']) / full['mean_bytes'] * 100:+.0f}%, "
+                      f"p50 {(sparse['p50_ms'] - full['p50_ms']) / full['p50_ms'] * 100:+.0f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint and mode")
+    parser.add_argument("--query-latency-ms", type=float, default=1.0)
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
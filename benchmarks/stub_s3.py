@@ -0,0 +1,45 @@
+"""
+In-memory stand-in for S3Service so upload scenarios measure the API, not AWS.
+
+An optional fixed latency per call approximates the S3 round trip.
+"""
+import threading
+import time
+import uuid
+from datetime import datetime
+
+
+class StubS3Service:
+    def __init__(self, latency_ms=0.0):
+        self.latency = latency_ms / 1000.0
+        self.objects = {}
+        self._lock = threading.Lock()
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def upload_file(self, file_content, file_name, content_type, patient_id, doctor_id):
+        self._wait()
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        file_key = f"reports/patient_{patient_id}/doctor_{doctor_id}/{timestamp}_{str(uuid.uuid4())[:8]}_{file_name}"
+        with self._lock:
+            self.objects[file_key] = (len(file_content), content_type)
+        return file_key
+
+    def store_object(self, file_obj, content_sha256, content_type):
+        self._wait()
+        data = file_obj.read()
+        file_key = f"reports/sha256/{content_sha256}"
+        with self._lock:
+            self.objects[file_key] = (len(data), content_type)
+        return file_key
+
+    def generate_presigned_url(self, file_key, expiration=3600, file_name=None):
+        return f"https://stub-s3.local/{file_key}?expires={expiration}"
+
+    def delete_file(self, file_key):
+        self._wait()
+        with self._lock:
+            self.objects.pop(file_key, None)
+        return True